@@ -1,17 +1,26 @@
 #=======================================================================#
 # IMPORTS
 #=======================================================================#
-from utils import reddit, twitch, auth
+from utils import reddit, twitch, auth, activity, admission, alerts, comments, http, metrics, responses, series, snapshots
+from utils.responses import FastJSONResponse
 from utils.db import users, markets
+from utils.db.storage import get_storage
+from utils.db.supabase_storage import get_client
 
-from models.classes import Credentials, ProfileData, Integration, Stock, Market, StockMarket, ExploreMarket, DashboardMarket
+from constants.constants import COMMENT_BUFFER_SIZE, COMMENT_PAGE_SIZE
+from models.classes import Credentials, ProfileData, Integration, Stock, Market, StockMarket, ExploreMarket, DashboardMarket, BatchOrder
 import os
+import json
+import time
+import asyncio
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
-from typing import Dict, List
+from typing import Dict, List, Literal, Optional
 from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status, Body
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer
-import uvicorn
 from dotenv import load_dotenv
 import jwt
 from jwt.exceptions import InvalidTokenError
@@ -28,7 +37,23 @@ JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
 if not JWT_SECRET:
     raise RuntimeError("JWT_SECRET environment variable is not set.")
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # clients are built here rather than at import, so reloads and tests that
+    # only import the app never pay for them
+    await asyncio.to_thread(get_client)
+    await asyncio.to_thread(get_storage)
+    markets.order_book.start()
+    markets.alert_engine.start()
+    yield
+    await asyncio.to_thread(markets.alert_engine.close)
+    # fills of the last check go through the ledger, so it closes after the order book
+    await asyncio.to_thread(markets.order_book.close)
+    await asyncio.to_thread(markets.trade_ledger.close)
+    await http.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -37,15 +62,83 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(GZipMiddleware, minimum_size=1000)
 security = HTTPBearer()
 
 
+#=======================================================================#
+# ADMISSION CONTROL AND RATE LIMITS
+#=======================================================================#
+def identify(request: Request) -> str:
+    """Key of the caller's rate limit buckets: the JWT sub, the client address without a valid token"""
+    token = request.cookies.get("access_token")
+    if token:
+        try:
+            payload = decode_token(token)
+            request.state.token_payload = payload  # verify_token reuses it
+            return payload.get("sub") or ""
+        except InvalidTokenError:
+            pass
+    return request.client.host if request.client else ""
+
+
+# registered before the latency middleware, which wraps it, so 429s are measured too
+app.middleware("http")(admission.Admission(identify))
+
+
+#=======================================================================#
+# METRICS
+#=======================================================================#
+REQUEST_LATENCY = metrics.Histogram("http_request_duration_seconds", "Latency of API requests", ("method", "route", "status"))
+
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # label by route template, not raw path, to keep the series count bounded
+        route = request.scope.get("route")
+        REQUEST_LATENCY.observe(time.perf_counter() - start, method=request.method,
+                                route=route.path if route else "unmatched", status=status_code)
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 #=======================================================================#
 # SECURITY
 #=======================================================================#
 
+def decode_token(token: str) -> Dict:
+    # Decode the token with the correct settings
+    # Important: Supabase uses HS256 algorithm with JWT secret
+    # The 'aud' and 'iss' claims are set by Supabase
+    return jwt.decode(
+        token,
+        JWT_SECRET,
+        algorithms=["HS256"],
+        # You might need to specify audience and/or issuer
+        options={
+            "verify_aud": False,  # Skip audience verification initially
+            "verify_iss": False,  # Skip issuer verification initially
+        }
+    )
+
+
 def verify_token(request: Request):
 
+    # already decoded by the admission middleware
+    payload = getattr(request.state, "token_payload", None)
+    if payload is not None:
+        return payload
+
     token = request.cookies.get("access_token")
     if not token: # this prints
         print("MISSING TOKEN")
@@ -55,19 +148,7 @@ def verify_token(request: Request):
         # Get token information without verification first for debugging
         header = jwt.get_unverified_header(token)
 
-        # Decode the token with the correct settings
-        # Important: Supabase uses HS256 algorithm with JWT secret
-        # The 'aud' and 'iss' claims are set by Supabase
-        payload = jwt.decode(
-            token,
-            JWT_SECRET,
-            algorithms=["HS256"],
-            # You might need to specify audience and/or issuer
-            options={
-                "verify_aud": False,  # Skip audience verification initially
-                "verify_iss": False,  # Skip issuer verification initially
-            }
-        )
+        payload = decode_token(token)
         return payload
     except InvalidTokenError as e:
         print(f"Token verification failed: {str(e)}")
@@ -197,16 +278,21 @@ def create_market(market_data: Market = Body(...), payload: Dict = Depends(verif
 #=======================================================================#
 # GET MARKETS FOR EXPLORE
 #=======================================================================#
-@app.get("/api/markets")
-def get_all(payload: Dict = Depends(verify_token)):
+@app.get("/api/markets", response_class=FastJSONResponse)
+def get_all(request: Request, payload: Dict = Depends(verify_token)):
 
     user_id = payload.get("sub")
 
     try:
+        # taken before the read, a write meanwhile leaves the body newer than its tag, never older
+        tag = markets.markets_etag(user_id)
+        not_modified = responses.not_modified(request.headers.get("if-none-match"), tag)
+        if not_modified:
+            return not_modified
 
         markets_response = markets.get_all_markets(user_id)
 
-        return {"status": 200, "data":{"markets":markets_response}}
+        return FastJSONResponse({"status": 200, "data":{"markets":markets_response}}, headers=responses.etag_headers(tag))
     except Exception as e:
             print(e)
             raise HTTPException(status_code=500, detail="Internal server error")
@@ -214,16 +300,20 @@ def get_all(payload: Dict = Depends(verify_token)):
 #=======================================================================#
 # GET JOINED MARKET
 #=======================================================================#
-@app.get("/api/markets/joined") # here
-def get_joined(payload: Dict = Depends(verify_token)):
+@app.get("/api/markets/joined", response_class=FastJSONResponse) # here
+def get_joined(request: Request, payload: Dict = Depends(verify_token)):
 
     user_id = payload.get("sub")
 
     try:
+        tag = markets.joined_etag(user_id)
+        not_modified = responses.not_modified(request.headers.get("if-none-match"), tag)
+        if not_modified:
+            return not_modified
 
         markets_response = markets.get_joined_markets(user_id)
 
-        return {"status": 200, "data":{"markets":markets_response}}
+        return FastJSONResponse({"status": 200, "data":{"markets":markets_response}}, headers=responses.etag_headers(tag))
     except Exception as e:
             print(e)
             raise HTTPException(status_code=500, detail="Internal server error")
@@ -246,18 +336,70 @@ def join_market(market_id: str = Query(...), payload: Dict = Depends(verify_toke
 #=======================================================================#
 # GET ENTIRE STOCKMARKET
 #=======================================================================#
-@app.get("/api/markets/stockmarket")
-def get_market(market_id: str = Query(...), payload: Dict = Depends(verify_token)):
+@app.get("/api/markets/stockmarket", response_class=FastJSONResponse)
+def get_market(request: Request, market_id: str = Query(...), price_range: Optional[Literal["h", "d", "m", "max"]] = Query(None, alias="range"), payload: Dict = Depends(verify_token)):
+
+    user_id = payload.get("sub")
+    try:
+        activity.viewed(market_id, user_id)
+        public = markets.get_public_market(user_id, market_id)
+        overlay = markets.get_market_overlay(user_id, market_id)
+
+        # an unchanged market is answered from the shared snapshot's version, without merging or encoding
+        media_type = series.negotiate(request.headers.get("accept"))
+        tag = markets.market_etag(public, overlay, market_id, price_range, media_type)
+        not_modified = responses.not_modified(request.headers.get("if-none-match"), tag)
+        if not_modified:
+            not_modified.headers["Vary"] = "Accept"
+            return not_modified
+
+        if media_type:
+            market = snapshots.select_range(snapshots.merge(public.market, overlay), price_range)
+            response = series.render({"status": 200,"data":{"market":market}}, "market", media_type)
+            response.headers.update(responses.etag_headers(tag))
+            return response
+
+        # price series are encoded once per (market, range) per tick and shared by every viewer
+        encoded = snapshots.encode_market(public, overlay, price_range)
+        return FastJSONResponse(snapshots.envelope("market", encoded), headers={**responses.etag_headers(tag), "Vary": "Accept"})
+    except Exception as e:
+            print(e)
+            raise HTTPException(status_code=500, detail="Internal server error")
+
+
+#=======================================================================#
+# LEADERBOARD
+#=======================================================================#
+@app.get("/api/markets/leaderboard", response_class=FastJSONResponse)
+def get_market_leaderboard(market_id: str = Query(...), limit: int = Query(10, ge=1, le=100), payload: Dict = Depends(verify_token)):
 
     user_id = payload.get("sub")
     try:
-        market = markets.get_stock_market(user_id, market_id )
-        return {"status": 200,"data":{"market":market}}
+        board = markets.get_leaderboard(user_id, market_id, limit)
+        return FastJSONResponse({"status": 200, "data": board})
+    except HTTPException as e:
+        raise e
     except Exception as e:
             print(e)
             raise HTTPException(status_code=500, detail="Internal server error")
 
 
+#=======================================================================#
+# PORTFOLIO ANALYTICS
+#=======================================================================#
+@app.get("/api/markets/analytics", response_class=FastJSONResponse)
+def get_market_analytics(market_id: str = Query(...), payload: Dict = Depends(verify_token)):
+
+    user_id = payload.get("sub")
+    try:
+        return FastJSONResponse({"status": 200, "data": markets.get_portfolio_analytics(user_id, market_id)})
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
 #=======================================================================#
 # POST COMMENT
 #=======================================================================#
@@ -266,13 +408,50 @@ def post_new_comment(market_id: str = Query(...), message: str = Query(...), pay
 
     user_id = payload.get("sub")
     try:
-        markets.post_comment(user_id, market_id, message)
-        return {"status": 200}
+        comment = markets.post_comment(user_id, market_id, message, payload.get("email"))
+        return {"status": 200, "data": {"comment": comment}}
     except Exception as e:
             print(e)
             raise HTTPException(status_code=500, detail="Internal server error")
 
 
+#=======================================================================#
+# GET COMMENTS (PAGINATED)
+#=======================================================================#
+@app.get("/api/markets/comments")
+def get_market_comments(market_id: str = Query(...), before: Optional[str] = Query(None), limit: int = Query(COMMENT_PAGE_SIZE, ge=1, le=COMMENT_BUFFER_SIZE), payload: Dict = Depends(verify_token)):
+
+    try:
+        page = markets.get_comments(market_id, before, limit)
+        return {"status": 200, "data": page}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+            print(e)
+            raise HTTPException(status_code=500, detail="Internal server error")
+
+
+#=======================================================================#
+# LIVE COMMENTS (SERVER-SENT EVENTS)
+#=======================================================================#
+@app.get("/api/markets/comments/stream")
+async def stream_market_comments(market_id: str = Query(...), payload: Dict = Depends(verify_token)):
+
+    user_id = payload.get("sub")
+
+    async def events():
+        # an open stream keeps its user counted as a viewer of the market
+        await asyncio.to_thread(activity.viewed, market_id, user_id)
+        async for comment in comments.subscribe(market_id):
+            if comment is None:
+                await asyncio.to_thread(activity.viewed, market_id, user_id)
+                yield ": keepalive\n\n"
+            else:
+                yield f"data: {json.dumps(comment)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 #=======================================================================#
 # STOCKS
 #=======================================================================#
@@ -310,9 +489,124 @@ def execute_sell_order(stock_id: str = Query(...), shares: float = Query(...), p
 
 
 
+#=======================================================================#
+# LIMIT AND STOP ORDERS
+#=======================================================================#
+@app.post("/api/orders")
+def place_order(stock_id: str = Query(...), side: Literal["buy", "sell"] = Query(...), kind: Literal["limit", "stop"] = Query(...),
+                shares: float = Query(..., gt=0), price: float = Query(..., gt=0), payload: Dict = Depends(verify_token)):
+
+    user_id = payload.get("sub")
+    try:
+        order = markets.place_order(user_id, stock_id, side, kind, shares, price)
+        return {"status": 200, "data": {"order": order}}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@app.post("/api/orders/batch")
+def execute_batch_order(order: BatchOrder = Body(...), payload: Dict = Depends(verify_token)):
+
+    user_id = payload.get("sub")
+    try:
+        fills = markets.batch_trade(user_id, order.market_id, [(leg.stock_id, leg.side, leg.shares) for leg in order.legs])
+        return {"status": 200, "data": {"fills": [{key: fill[key] for key in ("stock_id", "side", "shares", "price", "seq")} for fill in fills]}}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@app.delete("/api/orders")
+def cancel_order(order_id: str = Query(...), payload: Dict = Depends(verify_token)):
+
+    user_id = payload.get("sub")
+    try:
+        markets.cancel_order(user_id, order_id)
+        return {"status": 200}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@app.get("/api/orders")
+def get_open_orders(market_id: str = Query(...), payload: Dict = Depends(verify_token)):
+
+    user_id = payload.get("sub")
+    try:
+        return {"status": 200, "data": {"orders": markets.list_orders(user_id, market_id)}}
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+#=======================================================================#
+# PRICE ALERTS
+#=======================================================================#
+@app.post("/api/alerts")
+def place_alert(stock_id: str = Query(...), kind: Literal["above", "below", "rise", "drop"] = Query(...),
+                threshold: float = Query(..., gt=0), window: Optional[int] = Query(None), payload: Dict = Depends(verify_token)):
+
+    user_id = payload.get("sub")
+    try:
+        alert = markets.place_alert(user_id, stock_id, kind, threshold, window)
+        return {"status": 200, "data": {"alert": alert}}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@app.delete("/api/alerts")
+def cancel_alert(alert_id: str = Query(...), payload: Dict = Depends(verify_token)):
+
+    user_id = payload.get("sub")
+    try:
+        markets.cancel_alert(user_id, alert_id)
+        return {"status": 200}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@app.get("/api/alerts")
+def get_alerts(market_id: Optional[str] = Query(None), payload: Dict = Depends(verify_token)):
+
+    user_id = payload.get("sub")
+    try:
+        return {"status": 200, "data": markets.list_alerts(user_id, market_id)}
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@app.get("/api/alerts/stream")
+async def stream_alerts(payload: Dict = Depends(verify_token)):
+
+    user_id = payload.get("sub")
+
+    async def events():
+        async for hit in alerts.subscribe(user_id):
+            yield ": keepalive\n\n" if hit is None else f"data: {json.dumps(hit)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+
+
 #=======================================================================#
 # RUN THE APPLICATION
 #=======================================================================#
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run("app:app", host="localhost", port=8000, reload=True)
@@ -0,0 +1,110 @@
+"""
+Latency of well-behaved users while one client floods the trade and search
+routes, with and without the admission middleware. The routes are stand-ins
+that hold a threadpool thread (or, for search, an upstream call) as long as
+the real ones do; requests go through httpx's in-process ASGI transport.
+
+    python -m benchmarks.admission --users 20 --abusers 1 --rate 1000 --flood 1000 --seconds 5
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict, List
+import httpx
+from fastapi import FastAPI, Request
+from utils import admission
+
+TRADE_SECONDS = 0.050  # get_stock, the ledger and the params round trips to Supabase
+READ_SECONDS = 0.005  # a cached market snapshot
+SEARCH_SECONDS = 0.100  # one Reddit/Twitch round trip
+
+
+def make_app(limited: bool) -> FastAPI:
+    app = FastAPI()
+    if limited:
+        app.middleware("http")(admission.Admission(lambda request: request.headers.get("x-user", "")))
+
+    @app.get("/api/stocks/buy")
+    def buy():
+        time.sleep(TRADE_SECONDS)
+        return {"status": 200}
+
+    @app.get("/api/markets")
+    def markets():
+        time.sleep(READ_SECONDS)
+        return {"status": 200}
+
+    @app.post("/api/reddit/subreddit_search")
+    async def search():
+        await asyncio.sleep(SEARCH_SECONDS)
+        return {"status": 200}
+
+    return app
+
+
+def percentile(samples: List[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[int(round(p * (len(ordered) - 1)))] if ordered else 0.0
+
+
+async def run(limited: bool, args) -> Dict:
+    transport = httpx.ASGITransport(app=make_app(limited))
+    deadline = time.perf_counter() + args.seconds
+    good: List[float] = []
+    counts = {"good_429": 0, "flood_ok": 0, "flood_429": 0, "search_ok": 0}
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def user(i: int):
+            # a dashboard read and a trade every 200 ms
+            headers = {"x-user": f"user{i}"}
+            while time.perf_counter() < deadline:
+                for method, path in (("GET", "/api/markets"), ("GET", "/api/stocks/buy")):
+                    start = time.perf_counter()
+                    response = await client.request(method, path, headers=headers)
+                    good.append(time.perf_counter() - start)
+                    counts["good_429"] += response.status_code == 429
+                await asyncio.sleep(0.2)
+
+        async def request(method: str, path: str, headers: Dict, key: str, slots: asyncio.Semaphore):
+            async with slots:
+                response = await client.request(method, path, headers=headers)
+            counts["flood_429" if response.status_code == 429 else key] += 1
+
+        async def flooder(i: int, method: str, path: str, key: str):
+            # open loop at a fixed rate, whatever the answers
+            headers = {"x-user": f"abuser{i}"}
+            slots = asyncio.Semaphore(args.flood)
+            sent = []
+            start = time.perf_counter()
+            while time.perf_counter() < deadline:
+                sent.append(asyncio.ensure_future(request(method, path, headers, key, slots)))
+                await asyncio.sleep(max(0.0, start + len(sent) / args.rate - time.perf_counter()))
+            await asyncio.gather(*sent)
+
+        tasks = [user(i) for i in range(args.users)]
+        for i in range(args.abusers):
+            tasks += [flooder(i, "GET", "/api/stocks/buy", "flood_ok"), flooder(i, "POST", "/api/reddit/subreddit_search", "search_ok")]
+        await asyncio.gather(*tasks)
+
+    return {"p50": percentile(good, 0.5), "p99": percentile(good, 0.99), "requests": len(good), **counts}
+
+
+async def main(args):
+    print(f"{args.users} users (a read and a trade every 200 ms), {args.abusers} abuser(s) sending {args.rate:g} trades/s "
+          f"and {args.rate:g} searches/s, up to {args.flood} of each in flight, {args.seconds:g} s\n")
+    print(f"{'':<16}{'good p50 ms':>12}{'good p99 ms':>12}{'good 429':>10}{'flood trades':>14}{'flood searches':>16}{'flood 429':>11}")
+    for name, limited, abusers in (("no flood", False, 0), ("unprotected", False, args.abusers), ("admission", True, args.abusers)):
+        result = await run(limited, argparse.Namespace(**{**vars(args), "abusers": abusers}))
+        print(f"{name:<16}{result['p50'] * 1000:>12.1f}{result['p99'] * 1000:>12.1f}{result['good_429']:>10}"
+              f"{result['flood_ok']:>14}{result['search_ok']:>16}{result['flood_429']:>11}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--abusers", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=1000, help="requests per second per abuser and route")
+    parser.add_argument("--flood", type=int, default=1000, help="most requests in flight per abuser and route")
+    parser.add_argument("--seconds", type=float, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,154 @@
+"""
+Cost of evaluating every active price alert against one tick's prices as
+the number of dormant alerts grows: the grouped rule index (one comparison
+per stock, kind and window) against a vector comparison per alert, and a
+full AlertEngine.check (price read, history, fire, deliver) with in-memory
+storage. Alerts are placed 5% to 50% (levels) or 2% to 20% (moves) away and
+prices move by a small random walk, so few fire per tick.
+
+    python -m benchmarks.alerts [n_stocks] [ticks] [max_alerts]
+"""
+import sys
+import time
+import numpy as np
+from typing import Dict, List
+from constants.constants import ALERT_WINDOWS
+from utils.alerts import KINDS, SIGN, AlertEngine, PriceHistory, RuleIndex
+
+
+class MemoryStorage:
+    """The storage calls the alert engine makes, against dicts"""
+
+    def __init__(self, rows: List[Dict]):
+        self.rows = rows
+        self.prices: Dict[str, float] = {}
+        self.closed = 0
+
+    def list_active_alerts(self) -> List[Dict]:
+        return self.rows
+
+    def get_prices(self, stock_ids: List[str]) -> Dict[str, float]:
+        return {stock_id: self.prices[stock_id] for stock_id in stock_ids}
+
+    def close_alerts(self, alert_ids: List[str], status: str):
+        self.closed += len(alert_ids)
+
+
+def make_alerts(n_alerts: int, n_stocks: int, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    kind = rng.choice(np.array(KINDS), n_alerts)
+    sign = np.array([SIGN[k] for k in kind.tolist()])
+    move = (kind == "rise") | (kind == "drop")
+    return {
+        "stock": rng.integers(0, n_stocks, n_alerts),
+        "kind": kind,
+        "threshold": np.where(move, rng.uniform(2, 20, n_alerts), 1000.0 * (1 + sign * rng.uniform(0.05, 0.5, n_alerts))),
+        "window": np.where(move, rng.choice(np.array(ALERT_WINDOWS), n_alerts), 0),
+    }
+
+
+class PerAlertScan:
+    """Every alert compared with its stock's value each tick, in flat arrays"""
+
+    def __init__(self, alerts: Dict[str, np.ndarray]):
+        self.stock = alerts["stock"]
+        self.sign = np.array([SIGN[k] for k in alerts["kind"].tolist()])
+        self.window = alerts["window"]
+        self.key = np.where(self.window > 0, alerts["threshold"], alerts["threshold"] * self.sign)
+        self.active = np.ones(len(self.key), dtype=bool)
+
+    def fired(self, prices: np.ndarray, references: Dict[int, np.ndarray]) -> np.ndarray:
+        price = prices[self.stock]
+        reference = np.ones(len(price))
+        for window, by_stock in references.items():
+            mask = self.window == window
+            reference[mask] = by_stock[self.stock[mask]]
+        with np.errstate(invalid="ignore"):
+            value = np.where(self.window > 0, (price / reference - 1) * 100, price) * self.sign
+            fired = np.flatnonzero(self.active & (value >= self.key))
+        self.active[fired] = False
+        return fired
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def run(n_alerts: int, n_stocks: int, walk: np.ndarray, rng: np.random.Generator) -> Dict:
+    stock_ids = [f"s{i}" for i in range(n_stocks)]
+    alerts = make_alerts(n_alerts, n_stocks, rng)
+    alert_ids = [f"a{i}" for i in range(n_alerts)]
+    stocks = [stock_ids[i] for i in alerts["stock"].tolist()]
+    kinds = alerts["kind"].tolist()
+    windows = [window or None for window in alerts["window"].tolist()]
+
+    index = RuleIndex()
+    index.add_many(alert_ids, stocks, kinds, alerts["threshold"].tolist(), windows)
+    scan = PerAlertScan(alerts)
+    # columns of the index follow first appearance, the scan indexes by stock number
+    order = np.array([int(stock_id[1:]) for stock_id in index.stock_ids])
+    history = PriceHistory()
+    # a full history window is warmed up before timing, so move alerts have references
+    start = time.time()
+    for t in range(history.length):
+        history.record(start + t, walk[0][order])
+    now = start + history.length
+
+    index_times, scan_times, fired = [], [], 0
+    for tick_prices in walk:
+        now += 1
+        vector = tick_prices[order]
+        history.record(now, vector)
+        n = len(index.thresholds)
+        references = history.references(index.column[:n], index.window[:n], now)
+        seconds, popped = timed(lambda: index.pop_fired(index.values(vector, references)))
+        index_times.append(seconds)
+
+        by_window = {}
+        for window in ALERT_WINDOWS:
+            by_column = history.references(np.arange(len(order)), np.full(len(order), window), now)
+            by_window[window] = np.empty(n_stocks)
+            by_window[window][order] = by_column
+        seconds, scanned = timed(scan.fired, tick_prices, by_window)
+        scan_times.append(seconds)
+        assert sorted(rule_id for rule_id, _ in popped) == sorted(alert_ids[i] for i in scanned.tolist()), \
+            "rule index disagrees with the scan"
+        fired += len(popped)
+
+    # the whole check the API runs each tick
+    storage = MemoryStorage([{"id": alert_id, "user_id": f"u{i % 1000}", "market_id": "m", "stock_id": stock_id, "kind": kind,
+                              "threshold": threshold, "window_seconds": window}
+                             for i, (alert_id, stock_id, kind, threshold, window)
+                             in enumerate(zip(alert_ids, stocks, kinds, alerts["threshold"].tolist(), windows))])
+    hits = []
+    engine = AlertEngine(lambda: storage, hits.append)
+    for t in range(engine.history.length):
+        engine.check({stock_id: float(walk[0][i]) for i, stock_id in enumerate(stock_ids)}, start + t)
+    check_times = []
+    for tick_prices in walk:
+        now += 1
+        storage.prices = dict(zip(stock_ids, tick_prices.tolist()))
+        seconds, _ = timed(engine.check, None, now)
+        check_times.append(seconds)
+
+    return {"groups": len(index.thresholds), "index": index_times, "scan": scan_times, "check": check_times,
+            "fired": fired / len(walk)}
+
+
+def main(n_stocks: int, ticks: int, max_alerts: int):
+    rng = np.random.default_rng(0)
+    walk = 1000.0 * np.exp(np.cumsum(rng.normal(0, 0.002, (ticks, n_stocks)), axis=0))
+    print(f"{n_stocks} stocks, {ticks} ticks, mean ms per tick\n")
+    print(f"{'alerts':>10}{'groups':>9}{'rule index':>12}{'per alert':>11}{'engine check':>14}{'fired':>8}")
+    n_alerts = 10000
+    while n_alerts <= max_alerts:
+        result = run(n_alerts, n_stocks, walk, rng)
+        print(f"{n_alerts:>10}{result['groups']:>9}{np.mean(result['index']) * 1000:>12.3f}{np.mean(result['scan']) * 1000:>11.3f}"
+              f"{np.mean(result['check']) * 1000:>14.3f}{result['fired']:>8.1f}")
+        n_alerts *= 10
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [1000, 20, 1000000][len(args):]))
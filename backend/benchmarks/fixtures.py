@@ -0,0 +1,86 @@
+import importlib.util
+import math
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+RANGES = {"h_prices": 3600, "d_prices": 86400, "m_prices": 30 * 86400}
+MAX_POINTS = 1000  # the RPC downsamples every range to at most this many points
+
+
+#====================================================#
+# SYNTHETIC DATA SHAPED LIKE get_stock_market_details
+#====================================================#
+def make_prices(n_points: int, span_seconds: float, seed: int = 0, jitter_ms: int = 0) -> List[Dict]:
+    rng = random.Random(seed)
+    end = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    step = span_seconds / max(n_points, 1)
+    price = 1000.0
+    prices = []
+    for i in range(n_points):
+        price *= math.exp(rng.gauss(0, 0.001))
+        offset = timedelta(seconds=step * (n_points - i), milliseconds=rng.randint(0, jitter_ms))
+        prices.append({"price": price, "timestamp": (end - offset).isoformat()})
+    return prices
+
+
+def make_market(n_stocks: int = 10, n_points: int = MAX_POINTS, jitter_ms: int = 0, seed: int = 0) -> Dict:
+    stocks = []
+    for i in range(n_stocks):
+        stock = {"stock_id": f"stock-{i}", "ticker": f"TCK{i}", "shares": i, "price": 1000.0}
+        for key, span in RANGES.items():
+            stock[key] = make_prices(n_points, span, seed + i, jitter_ms)
+        stock["max_prices"] = make_prices(n_points, 90 * 86400, seed + i, jitter_ms)
+        stock["price"] = stock["max_prices"][-1]["price"]
+        stocks.append(stock)
+    return {"market_name": "bench", "market_id": "market-0", "stocks": stocks, "free_currency": 10000.0}
+
+
+#====================================================#
+# SYNTHETIC FAN POSTS FOR THE SENTIMENT SCORERS
+#====================================================#
+SUBJECTS = ["the stream", "his aim", "this team", "the new coach", "her last video", "the roster", "that trade",
+            "the collab", "the drama", "our defense", "the merch drop", "chat", "the finale", "this season"]
+OPINIONS = ["good", "great", "amazing", "bad", "terrible", "awful", "boring", "funny", "insane", "solid",
+            "disappointing", "perfect", "clean", "sloppy", "fine", "hilarious", "weak", "wonderful", "stupid", "fun"]
+INTENSIFIERS = ["", "", "", "really ", "very ", "extremely ", "pretty ", "kind of ", "so ", "incredibly ", "slightly "]
+NEGATIONS = ["", "", "", "not ", "never ", "no longer "]
+CLAUSES = [
+    "{subject} was {negation}{intensifier}{opinion}",
+    "{subject} is {negation}{intensifier}{opinion}",
+    "{subject} isn't {intensifier}{opinion}",
+    "honestly {subject} wasn't {opinion} at all",
+    "I {love} {subject}",
+    "I don't {love} {subject}",
+    "can't believe how {opinion} {subject} was",
+    "{subject} looked {intensifier}{opinion} today",
+    "what a {opinion} week for {subject}",
+    "anyone else think {subject} is {intensifier}{opinion}",
+    "{subject} tonight",
+    "thoughts on {subject}?",
+]
+LOVE = ["love", "hate", "like", "enjoy", "dislike"]
+ENDINGS = [".", ".", ".", "!", "!!", "?", " :)", " :(", " :D", " lol", " <3", " :/"]
+
+
+def make_posts(n_posts: int, seed: int = 0) -> List[Dict]:
+    """Reddit post `data` objects, a title and a few sentences of fan talk each"""
+    rng = random.Random(seed)
+
+    def sentence() -> str:
+        clause = rng.choice(CLAUSES).format(subject=rng.choice(SUBJECTS), opinion=rng.choice(OPINIONS), love=rng.choice(LOVE),
+                                            intensifier=rng.choice(INTENSIFIERS), negation=rng.choice(NEGATIONS))
+        return clause[0].upper() + clause[1:] + rng.choice(ENDINGS)
+
+    return [{"id": f"post-{i}", "created_utc": 1735689600 + i, "title": sentence(),
+             "selftext": " ".join(sentence() for _ in range(rng.randint(0, 6)))} for i in range(n_posts)]
+
+
+def load_worker(name: str):
+    """Import realtime/<name>.py, which is a script and not importable as realtime.<name>"""
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "realtime", f"{name}.py")
+    spec = importlib.util.spec_from_file_location(f"realtime_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,70 @@
+"""
+Import-time profile of the API and the realtime workers. Each target is
+imported in a fresh interpreter (what uvicorn's reloader and every worker
+restart pay), timed end to end and broken down with -X importtime.
+
+    python -m benchmarks.imports --runs 5 --top 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    "app": "import app",
+    "stocks worker": "from benchmarks.fixtures import load_worker; load_worker('stocks')",
+    "reddit worker": "from benchmarks.fixtures import load_worker; load_worker('reddit')",
+}
+
+
+def run(code: str, importtime: bool = False) -> Tuple[float, str]:
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=BACKEND, capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, result.stderr
+
+
+def baseline() -> float:
+    """Interpreter start-up alone, subtracted from every target"""
+    return statistics.median(run("pass")[0] for _ in range(3))
+
+
+def top_packages(importtime_log: str, top: int) -> List[Tuple[str, float]]:
+    """Self time of every module summed per top-level package, largest first"""
+    totals: Dict[str, float] = {}
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0.0) + int(own) / 1000
+    return sorted(totals.items(), key=lambda item: -item[1])[:top]
+
+
+def main(args):
+    interpreter = baseline()
+    print(f"interpreter start-up {interpreter * 1000:.0f} ms (subtracted below)\n")
+
+    for name, code in TARGETS.items():
+        wall = statistics.median(run(code)[0] for _ in range(args.runs)) - interpreter
+        _, log = run(code, importtime=True)
+        print(f"{name:<14} {wall * 1000:>7.0f} ms median of {args.runs}")
+        for package, ms in top_packages(log, args.top):
+            print(f"    {package:<24} {ms:>7.1f} ms")
+        print()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="packages to list per target")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,275 @@
+"""
+Deterministic load test of the ticker, order path, dashboard reads, search
+routes and sentiment pipeline against either storage backend (the Supabase
+one talking to the in-memory stand-in, or the embedded SQLite one) and
+local Reddit/Twitch servers. Reports throughput and p50/p99 per subsystem.
+
+    python -m benchmarks.load --stocks 200 --traders 8 --viewers 20 --subreddits 5 --rtt-ms 2
+    python -m benchmarks.load --backend sqlite
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+REDDIT_PORT = 18081
+TWITCH_PORT = 18082
+
+# module-level settings are read at import, point them at the local stand-ins first
+os.environ["REDDIT_API_URL"] = f"http://127.0.0.1:{REDDIT_PORT}"
+os.environ["TWITCH_API_URL"] = f"http://127.0.0.1:{TWITCH_PORT}"
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+os.environ.setdefault("SUPABASE_PRIVATE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.standin")
+
+from utils import snapshots, reddit as reddit_search, twitch
+from utils.db import cache, markets, storage
+from utils.db.sqlite_storage import AsyncSqliteStorage, SqliteStorage
+from utils.db.supabase_storage import AsyncSupabaseStorage, SupabaseStorage
+from benchmarks import mock_http
+from benchmarks.fixtures import load_worker
+from benchmarks.standin import AsyncClient, Client, Database
+
+ticker = load_worker("stocks")
+sentiment = load_worker("reddit")
+
+
+def percentile(samples: List[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[int(round(p * (len(ordered) - 1)))] if ordered else 0.0
+
+
+def report(name: str, latencies: List[float], elapsed: float, units: int, unit: str):
+    print(f"{name:<12}{units:>9} {unit:<12}{units / elapsed:>11.1f}/s"
+          f"{percentile(latencies, 0.5) * 1000:>10.2f}{percentile(latencies, 0.99) * 1000:>10.2f}")
+
+
+def run_threads(workers: int, jobs: List[Callable[[], None]]) -> List[float]:
+    """Run jobs on a pool, return the latency of each"""
+    def timed(job):
+        start = time.perf_counter()
+        job()
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(timed, jobs))
+
+
+#====================================================#
+# SEEDING (THROUGH THE STORAGE INTERFACE, SO BOTH BACKENDS GET THE SAME DATA)
+#====================================================#
+async def seed(db: storage.Storage, worker_db: storage.AsyncStorage, n_stocks: int, n_users: int,
+               history: int, subreddits: List[str], seed: int):
+    rng = random.Random(seed)
+    users = [{"id": str(uuid.UUID(int=rng.getrandbits(128))), "email": f"user{i}@bench.local"} for i in range(n_users)]
+    for user in users:
+        db.insert_profile(user)
+
+    market_id = db.create_market("bench", users[0]["id"], [("reddit", sub) for sub in subreddits],
+                                 [(f"T{i}", [f"stock{i}"], 1000.0) for i in range(n_stocks)])
+    for user in users:
+        db.join_market(user["id"], market_id, 10000.0)
+
+    stocks = [stock for stock in await worker_db.list_stocks() if stock["market_id"] == market_id]
+    start = datetime(2025, 1, 1)
+    for t in range(history):
+        ts = (start + timedelta(seconds=t)).isoformat()
+        await worker_db.record_prices([(stock["id"], 1000.0, ts) for stock in stocks])
+
+    return {"market": {"id": market_id}, "stocks": stocks, "users": users}
+
+
+#====================================================#
+# SCENARIOS
+#====================================================#
+async def ticker_scenario(ticks: int, n_stocks: int):
+    latencies = []
+    start = time.perf_counter()
+    clock = time.time()  # simulated, one tick interval apart so every market is due
+    for i in range(ticks):
+        tick_start = time.perf_counter()
+        await ticker.update_stock_prices(now=clock + i * ticker.TICK_INTERVAL)
+        latencies.append(time.perf_counter() - tick_start)
+    report("ticker", latencies, time.perf_counter() - start, ticks * n_stocks, "stock-ticks")
+
+
+def trader_scenario(seeded, traders: int, orders: int, seed: int):
+    stock_ids = [stock["id"] for stock in seeded["stocks"]]
+    jobs = []
+    for i, user in enumerate(seeded["users"][:traders]):
+        rng = random.Random(seed + i)
+        held = set()
+        # fractions of a share, so the starting cash covers every buy
+        for _ in range(orders):
+            stock_id = rng.choice(stock_ids)
+            if stock_id in held and rng.random() < 0.5:
+                held.discard(stock_id)
+                jobs.append(lambda u=user["id"], s=stock_id: markets.sell_stock(u, s, 0.01))
+            else:
+                held.add(stock_id)
+                jobs.append(lambda u=user["id"], s=stock_id: markets.buy_stock(u, s, 0.01))
+
+    # each trader's orders stay in order on its own worker
+    per_trader = [jobs[i * orders:(i + 1) * orders] for i in range(traders)]
+    start = time.perf_counter()
+    latencies = []
+    for batch in zip(*per_trader):
+        latencies += run_threads(traders, list(batch))
+    report("orders", latencies, time.perf_counter() - start, len(latencies), "orders")
+
+
+def rebalance_scenario(seeded, traders: int, rebalances: int, legs: int, seed: int):
+    """Each trader swaps half its holdings for other stocks, as one batch order and again as single orders"""
+    market_id = seeded["market"]["id"]
+    stock_ids = [stock["id"] for stock in seeded["stocks"]]
+    # fresh accounts, the order scenario's traders may have spent their cash
+    users = [user["id"] for user in seeded["users"][traders:2 * traders]]
+
+    def plans(user_index: int) -> List[List[tuple]]:
+        rng = random.Random(seed + user_index)
+        held: List[str] = []
+        rounds = []
+        for _ in range(rebalances):
+            sells = held[:legs // 2]
+            buys = rng.sample([stock_id for stock_id in stock_ids if stock_id not in held], legs - len(sells))
+            rounds.append([(stock_id, "sell", 0.01) for stock_id in sells] + [(stock_id, "buy", 0.01) for stock_id in buys])
+            held = held[len(sells):] + buys
+        return rounds
+
+    def batch(user_id: str, rounds: List[List[tuple]]):
+        for legs_of_round in rounds:
+            markets.batch_trade(user_id, market_id, legs_of_round)
+
+    def singles(user_id: str, rounds: List[List[tuple]]):
+        for legs_of_round in rounds:
+            for stock_id, side, shares in sorted(legs_of_round, key=lambda leg: leg[1] != "sell"):
+                markets.trade(user_id, stock_id, side, shares)
+
+    for name, run in (("rebalance", batch), ("as singles", singles)):
+        start = time.perf_counter()
+        latencies = run_threads(traders, [lambda u=user_id, i=i: run(u, plans(i)) for i, user_id in enumerate(users)])
+        report(name, [latency / rebalances for latency in latencies], time.perf_counter() - start,
+               traders * rebalances, f"x{legs} legs")
+
+
+def viewer_scenario(seeded, viewers: int, loads: int):
+    market_id = seeded["market"]["id"]
+
+    def load(user_id):
+        public = markets.get_public_market(user_id, market_id)
+        overlay = markets.get_market_overlay(user_id, market_id)
+        snapshots.envelope("market", snapshots.encode_market(public, overlay))
+
+    jobs = [lambda u=user["id"]: load(u) for _ in range(loads) for user in seeded["users"][:viewers]]
+    start = time.perf_counter()
+    latencies = run_threads(viewers, jobs)
+    report("dashboard", latencies, time.perf_counter() - start, len(latencies), "loads")
+
+
+async def search_scenario(searches: int):
+    latencies = []
+    start = time.perf_counter()
+    for i in range(searches):
+        for search in (reddit_search.get_subreddits, twitch.get_channels):
+            call_start = time.perf_counter()
+            await search(f"term{i}")
+            latencies.append(time.perf_counter() - call_start)
+    report("search", latencies, time.perf_counter() - start, len(latencies), "searches")
+
+
+async def sentiment_scenario(cycles: int):
+    processed = lambda: sum(sentiment.POSTS_PROCESSED.values.values())
+    comments = lambda: sum(sentiment.COMMENTS_PROCESSED.values.values())
+    before, comments_before = processed(), comments()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(cycles):
+        cycle_start = time.perf_counter()
+        await sentiment.process_all_subreddits()
+        latencies.append(time.perf_counter() - cycle_start)
+    elapsed = time.perf_counter() - start
+    report("sentiment", latencies, elapsed, int(processed() - before), "posts")
+    report("", latencies, elapsed, int(comments() - comments_before), "comments")
+
+
+#====================================================#
+# MAIN
+#====================================================#
+async def main(args):
+    random.seed(args.seed)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.backend == "sqlite":
+        db = SqliteStorage(os.path.join(tempfile.mkdtemp(), "bench.db"))
+        worker_db = AsyncSqliteStorage(db)
+        standin = None
+    else:
+        standin = Database()
+        db, worker_db = SupabaseStorage(Client(standin)), AsyncSupabaseStorage(AsyncClient(standin))
+
+    storage.set_storage(db)
+    ticker.storage = sentiment.storage = worker_db
+    ticker.rng = ticker.np.random.default_rng(args.seed)
+    sentiment.POSTS_LIMIT = args.posts
+
+    subreddits = [f"sub{i}" for i in range(args.subreddits)]
+    seeded = await seed(db, worker_db, args.stocks, max(2 * args.traders, args.viewers), args.history, subreddits, args.seed)
+    if standin is not None:
+        standin.rtt = args.rtt_ms / 1000  # seeding runs at full speed
+
+    names = [name for stock in seeded["stocks"] for name in stock["names"]]
+    runners = [await mock_http.serve(mock_http.reddit_app(names, args.rtt_ms / 1000, comments_per_read=args.comments, seed=args.seed), REDDIT_PORT),
+               await mock_http.serve(mock_http.twitch_app(args.rtt_ms / 1000), TWITCH_PORT)]
+    try:
+        rtt = f"{args.rtt_ms}ms simulated round trip" if standin is not None else "embedded sqlite"
+        print(f"{args.stocks} stocks, {args.traders} traders, {args.viewers} viewers, {args.subreddits} subreddits, "
+              f"{rtt}, seed {args.seed}")
+        print(f"{'subsystem':<12}{'ops':>9} {'':<12}{'throughput':>13}{'p50 ms':>10}{'p99 ms':>10}")
+
+        await ticker_scenario(args.ticks, args.stocks)
+        await asyncio.to_thread(trader_scenario, seeded, args.traders, args.orders, args.seed)
+        await asyncio.to_thread(rebalance_scenario, seeded, args.traders, args.rebalances, args.legs, args.seed)
+        await asyncio.to_thread(markets.trade_ledger.flush)
+        await asyncio.to_thread(viewer_scenario, seeded, args.viewers, args.loads)
+        await search_scenario(args.searches)
+        await sentiment_scenario(args.cycles)
+
+        if standin is not None:
+            print(f"\nstand-in calls: {standin.calls}")
+        for name, stats in cache.stats().items():
+            print(f"cache {name:<20} {stats}")
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("supabase", "sqlite"), default="supabase")
+    parser.add_argument("--stocks", type=int, default=200)
+    parser.add_argument("--history", type=int, default=600, help="seeded ticks per stock")
+    parser.add_argument("--ticks", type=int, default=10)
+    parser.add_argument("--traders", type=int, default=8)
+    parser.add_argument("--orders", type=int, default=25, help="orders per trader")
+    parser.add_argument("--rebalances", type=int, default=5, help="batch orders per trader")
+    parser.add_argument("--legs", type=int, default=20, help="legs per batch order")
+    parser.add_argument("--viewers", type=int, default=20)
+    parser.add_argument("--loads", type=int, default=5, help="dashboard loads per viewer")
+    parser.add_argument("--subreddits", type=int, default=5)
+    parser.add_argument("--posts", type=int, default=25, help="posts per subreddit per cycle")
+    parser.add_argument("--comments", type=int, default=20, help="new comments per followed thread per cycle")
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--searches", type=int, default=20)
+    parser.add_argument("--rtt-ms", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,140 @@
+"""
+Memory held by the sentiment worker's state at scale: the stock index built
+from the storage rows and the ids of the posts seen over a week of uptime.
+Each layout is measured in a fresh interpreter, the previous one (raw row
+caches, dicts of strings and an unbounded set of post ids) against the
+current one.
+
+    python -m benchmarks.memory --stocks 100000 --markets 1000 --posts-per-hour 10 [--traced]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import tracemalloc
+import uuid
+from typing import Dict, List, Tuple
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEEK_HOURS = 7 * 24
+
+
+def make_rows(n_stocks: int, n_markets: int, seed: int = 0) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """Rows shaped like list_markets / list_integrations('reddit') / list_stocks, two subreddits per market"""
+    rng = random.Random(seed)
+    new_id = lambda: str(uuid.UUID(int=rng.getrandbits(128)))
+    markets = [{"id": new_id(), "created_at": "2025-01-01T00:00:00", "market_name": f"market {m}"} for m in range(n_markets)]
+    integrations = [{"id": new_id(), "market_id": market["id"], "service": "reddit", "community_id": f"sub{m}_{k}"}
+                    for m, market in enumerate(markets) for k in range(2)]
+    stocks = [{"id": new_id(), "market_id": markets[i % n_markets]["id"], "ticker": f"T{i}",
+               "names": [f"player{i}", f"p{i}", f"nick{i}"], "price": 1000.0} for i in range(n_stocks)]
+    return markets, integrations, stocks
+
+
+def post_ids(subreddits: List[str], posts_per_hour: int):
+    """(subreddit, id) of every post of a week, ids are base36 counters like Reddit's"""
+    counter = 36**6
+    for _ in range(WEEK_HOURS * posts_per_hour):
+        for subreddit in subreddits:
+            counter += 1
+            yield subreddit, base36(counter)
+
+
+def base36(number: int) -> str:
+    digits = ""
+    while number:
+        number, digit = divmod(number, 36)
+        digits = "0123456789abcdefghijklmnopqrstuvwxyz"[digit] + digits
+    return digits
+
+
+#====================================================#
+# THE TWO LAYOUTS
+#====================================================#
+def legacy_state(markets: List[Dict], integrations: List[Dict], stocks: List[Dict], posts_per_hour: int) -> Dict:
+    """What fetch_db_data kept before: the raw rows, dicts of strings and every post id ever seen"""
+    market_subreddits: Dict[str, List[str]] = {}
+    for integration in integrations:
+        market_subreddits.setdefault(integration["market_id"], []).append(integration["community_id"])
+    stock_market_map = {stock["id"]: stock["market_id"] for stock in stocks}
+    stock_names_map = {stock["id"]: stock["names"] for stock in stocks}
+
+    seen_post_ids = set()
+    for _, post_id in post_ids([i["community_id"] for i in integrations], posts_per_hour):
+        seen_post_ids.add(post_id)
+    return {"markets_cache": markets, "integrations_cache": integrations, "stocks_cache": stocks,
+            "market_subreddits": market_subreddits, "stock_market_map": stock_market_map,
+            "stock_names_map": stock_names_map, "seen_post_ids": seen_post_ids}
+
+
+def compact_state(markets: List[Dict], integrations: List[Dict], stocks: List[Dict], posts_per_hour: int):
+    from benchmarks.fixtures import load_worker
+    worker = load_worker("reddit")
+    worker.index_db_data(integrations, stocks)
+    for subreddit, post_id in post_ids(list(worker.stock_index.subreddit_markets), posts_per_hour):
+        worker.seen_posts.add(subreddit, post_id)
+    return worker
+
+
+def rss_kb(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1])
+    return 0
+
+
+def measure(layout: str, n_stocks: int, n_markets: int, posts_per_hour: int, traced: bool) -> Dict:
+    """
+    Run in a fresh interpreter: build one layout, drop the input rows and
+    report what stays. tracemalloc slows the build down and inflates RSS,
+    so the retained bytes and the RSS come from separate runs.
+    """
+    if layout == "compact":
+        from benchmarks.fixtures import load_worker
+        load_worker("reddit")  # imports are not part of the state
+    gc.collect()
+    before = rss_kb("VmRSS:")
+    if traced:
+        tracemalloc.start()
+
+    rows = make_rows(n_stocks, n_markets)
+    state = (legacy_state if layout == "legacy" else compact_state)(*rows, posts_per_hour)
+    del rows
+    gc.collect()
+
+    retained = tracemalloc.get_traced_memory()[0] if traced else 0
+    return {"retained": retained, "rss": (rss_kb("VmRSS:") - before) * 1024, "peak_rss": rss_kb("VmHWM:") * 1024, "state": bool(state)}
+
+
+def run(layout: str, args, traced: bool) -> Dict:
+    code = (f"import json; from benchmarks.memory import measure; "
+            f"print(json.dumps(measure({layout!r}, {args.stocks}, {args.markets}, {args.posts_per_hour}, {traced})))")
+    output = subprocess.run([sys.executable, "-c", code], cwd=BACKEND, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(args):
+    print(f"{args.stocks} stocks in {args.markets} markets ({2 * args.markets} subreddits), "
+          f"{args.posts_per_hour} new posts per subreddit per hour, one week of uptime\n")
+    print(f"{'layout':<10}{'retained MB':>14}{'RSS growth MB':>16}{'peak RSS MB':>14}")
+    for layout in ("legacy", "compact"):
+        untraced = run(layout, args, traced=False)
+        retained = f"{run(layout, args, traced=True)['retained'] / 2**20:.1f}" if args.traced else "-"
+        print(f"{layout:<10}{retained:>14}{untraced['rss'] / 2**20:>16.1f}{untraced['peak_rss'] / 2**20:>14.1f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stocks", type=int, default=100000)
+    parser.add_argument("--markets", type=int, default=1000)
+    parser.add_argument("--posts-per-hour", type=int, default=10, help="new posts per subreddit")
+    parser.add_argument("--traced", action="store_true", help="also measure the exact bytes retained with tracemalloc (slow)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,116 @@
+"""
+Local Reddit and Twitch API servers returning deterministic data, so the
+search routes and the sentiment worker can run without network access.
+Point the code at them with REDDIT_API_URL and TWITCH_API_URL.
+"""
+import asyncio
+import random
+from typing import List
+from aiohttp import web
+
+POSITIVE = ["great", "love", "amazing", "best", "good", "happy"]
+NEGATIVE = ["terrible", "hate", "awful", "worst", "bad", "sad"]
+FILLER = ["the", "stream", "today", "was", "about", "and", "really", "honestly", "chat", "thread"]
+
+
+#====================================================#
+# REDDIT
+#====================================================#
+def base36(n: int) -> str:
+    digits = ""
+    while True:
+        n, digit = divmod(n, 36)
+        digits = "0123456789abcdefghijklmnopqrstuvwxyz"[digit] + digits
+        if not n:
+            return digits
+
+
+def reddit_app(names: List[str], latency: float = 0.0, mention_rate: float = 0.5, comments_per_read: int = 20, seed: int = 0) -> web.Application:
+    """
+    /r/{sub}/new returns `limit` new posts per request, a share of them naming a stock;
+    /comments/{post} returns a post's newest comments, about `comments_per_read` more each request
+    """
+    counters = {}
+    threads = {}  # post id -> comments so far
+
+    def words(rng: random.Random, k: int) -> List[str]:
+        chosen = rng.choices(FILLER, k=k)
+        if rng.random() < mention_rate and names:
+            chosen.insert(rng.randrange(len(chosen)), rng.choice(names))
+            chosen.insert(rng.randrange(len(chosen)), rng.choice(POSITIVE + NEGATIVE))
+        return chosen
+
+    async def new_posts(request: web.Request):
+        await asyncio.sleep(latency)
+        subreddit = request.match_info["subreddit"]
+        limit = int(request.query.get("limit", 25))
+        start = counters.get(subreddit, 0)
+        counters[subreddit] = start + limit
+
+        children = []
+        for n in range(start, start + limit):
+            rng = random.Random(f"{seed}-{subreddit}-{n}")
+            post_words = words(rng, 12)
+            post_id = f"{subreddit}-{n}"
+            threads.setdefault(post_id, rng.randint(0, comments_per_read))
+            children.append({"data": {"id": post_id, "title": " ".join(post_words[:6]), "selftext": " ".join(post_words[6:]),
+                                      "num_comments": threads[post_id]}})
+        return web.json_response({"data": {"children": children}})
+
+    async def comments(request: web.Request):
+        await asyncio.sleep(latency)
+        post_id = request.match_info["post"]
+        limit = int(request.query.get("limit", 200))
+        rng = random.Random(f"{seed}-{post_id}-{threads.get(post_id, 0)}")
+        total = threads[post_id] = threads.get(post_id, 0) + rng.randint(0, 2 * comments_per_read)
+
+        children = []
+        for n in range(total, max(0, total - limit), -1):
+            comment_rng = random.Random(f"{seed}-{post_id}-c{n}")
+            children.append({"kind": "t1", "data": {"id": base36(n), "body": " ".join(words(comment_rng, 8))}})
+        if total > limit:
+            children.append({"kind": "more", "data": {"count": total - limit}})
+        return web.json_response([
+            {"data": {"children": [{"kind": "t3", "data": {"id": post_id, "num_comments": total}}]}},
+            {"data": {"children": children}},
+        ])
+
+    async def search(request: web.Request):
+        await asyncio.sleep(latency)
+        term = request.query.get("q", "")
+        limit = int(request.query.get("limit", 3))
+        return web.json_response({"data": {"children": [
+            {"data": {"display_name": f"{term}{i}", "subscribers": 1000 * i, "public_description": f"r/{term}{i}"}}
+            for i in range(limit)
+        ]}})
+
+    app = web.Application()
+    app.router.add_get("/r/{subreddit}/new", new_posts)
+    app.router.add_get("/comments/{post}", comments)
+    app.router.add_get("/subreddits/search", search)
+    return app
+
+
+#====================================================#
+# TWITCH
+#====================================================#
+def twitch_app(latency: float = 0.0) -> web.Application:
+    async def search(request: web.Request):
+        await asyncio.sleep(latency)
+        term = request.query.get("query", "")
+        first = int(request.query.get("first", 3))
+        return web.json_response({"data": [
+            {"display_name": f"{term}{i}", "id": str(i), "game_id": str(i), "title": f"{term} stream {i}"}
+            for i in range(first)
+        ]})
+
+    app = web.Application()
+    app.router.add_get("/helix/search/channels", search)
+    return app
+
+
+async def serve(app: web.Application, port: int, host: str = "127.0.0.1") -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
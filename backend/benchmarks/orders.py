@@ -0,0 +1,123 @@
+"""
+Cost of checking every resting limit/stop order against one tick's prices:
+the vectorized trigger index against a Python scan over the orders, and a
+full OrderBook.check (price read, trigger, batch fill) with in-memory
+storage. Prices move by a random walk, so a small share fires each tick.
+
+    python -m benchmarks.orders [n_orders] [n_stocks] [ticks]
+"""
+import sys
+import time
+import numpy as np
+from typing import Dict, List
+from constants.constants import TICK_SECONDS
+from utils.orders import OrderBook, TriggerIndex, direction
+
+
+class MemoryStorage:
+    """The storage calls the order book makes, against dicts"""
+
+    def __init__(self, prices: Dict[str, float]):
+        self.prices = prices
+        self.closed = 0
+
+    def list_open_orders(self) -> List[Dict]:
+        return []
+
+    def get_prices(self, stock_ids: List[str]) -> Dict[str, float]:
+        return {stock_id: self.prices[stock_id] for stock_id in stock_ids}
+
+    def close_orders(self, order_ids: List[str], status: str):
+        self.closed += len(order_ids)
+
+
+def make_orders(n_orders: int, n_stocks: int, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    """Orders resting at a price of 1000, each trigger 0.1% to 20% away on the side it waits for"""
+    side = rng.choice(np.array(["buy", "sell"]), n_orders)
+    kind = rng.choice(np.array(["limit", "stop"]), n_orders)
+    sign = np.where((side == "sell") == (kind == "limit"), 1, -1)
+    return {
+        "stock": rng.integers(0, n_stocks, n_orders),
+        "trigger": 1000.0 * (1 + sign * rng.uniform(0.001, 0.2, n_orders)),
+        "side": side,
+        "kind": kind,
+    }
+
+
+def scan(orders: List[tuple], prices: Dict[str, float]) -> List[str]:
+    """One comparison per order in Python"""
+    return [order_id for order_id, stock_id, trigger, sign in orders if sign * (prices[stock_id] - trigger) >= 0]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main(n_orders: int, n_stocks: int, ticks: int):
+    rng = np.random.default_rng(0)
+    stock_ids = [f"s{i}" for i in range(n_stocks)]
+    columns = make_orders(n_orders, n_stocks, rng)
+    order_ids = [f"o{i}" for i in range(n_orders)]
+    signs = [direction(side, kind) for side, kind in zip(columns["side"].tolist(), columns["kind"].tolist())]
+    stocks = [stock_ids[i] for i in columns["stock"].tolist()]
+
+    index = TriggerIndex()
+    build, _ = timed(index.add_many, order_ids, stocks, columns["trigger"].tolist(), signs)
+    rows = list(zip(order_ids, stocks, columns["trigger"].tolist(), signs))
+
+    prices = np.full(n_stocks, 1000.0)
+    prices_by_id = dict(zip(stock_ids, prices.tolist()))
+    assert not index.triggered(prices_by_id)
+    print(f"{n_orders} resting orders over {n_stocks} stocks, "
+          f"built in {build * 1000:.0f} ms, one tick is {TICK_SECONDS} s\n")
+    print(f"{'per tick':<36}{'best ms':>10}{'mean ms':>10}{'fired':>8}")
+
+    def report(name: str, seconds: List[float], count: float):
+        print(f"{name:<36}{min(seconds) * 1000:>10.2f}{np.mean(seconds) * 1000:>10.2f}{count:>8.0f}")
+
+    walk = prices * np.exp(np.cumsum(rng.normal(0, 0.002, (ticks, n_stocks)), axis=0))
+    vector_times, dict_times, scan_times, counts = [], [], [], []
+    for tick_prices in walk:
+        by_id = dict(zip(stock_ids, tick_prices.tolist()))
+        seconds, _ = timed(index.fired, index.prices(by_id))
+        vector_times.append(seconds)
+        seconds, vectorized = timed(index.triggered, by_id)
+        dict_times.append(seconds)
+        seconds, scanned = timed(scan, rows, by_id)
+        scan_times.append(seconds)
+        assert sorted(vectorized) == sorted(scanned), "trigger index disagrees with the scan"
+        counts.append(len(vectorized))
+
+    report("trigger index, compare only", vector_times, np.mean(counts))
+    report("trigger index, from a price dict", dict_times, np.mean(counts))
+    report("python scan", scan_times, np.mean(counts))
+
+    # the whole check the API runs each tick: read prices, trigger, fill in one batch, close
+    storage = MemoryStorage(prices_by_id)
+    filled = []
+    book = OrderBook(lambda: storage, lambda orders, _: filled.extend(orders) or set())
+    book.loaded = True
+    with book.lock:
+        for i, (order_id, stock_id, trigger, _) in enumerate(rows):
+            book.add({"id": order_id, "user_id": f"u{i % 1000}", "market_id": "m", "stock_id": stock_id,
+                      "side": columns["side"][i], "kind": columns["kind"][i], "shares": 1.0, "price": trigger})
+
+    check_times = []
+    for tick_prices in walk:
+        storage.prices = dict(zip(stock_ids, tick_prices.tolist()))
+        seconds, _ = timed(book.check)
+        check_times.append(seconds)
+    report("OrderBook.check (fills removed)", check_times, len(filled) / ticks)
+
+    start = time.perf_counter()
+    for order_id, stock_id, trigger, sign in rows[:10000]:
+        index.remove(order_id)
+        index.add(order_id, stock_id, trigger, sign)
+    print(f"\nremove + add one order: {(time.perf_counter() - start) / min(10000, len(rows)) * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [1000000, 10000, 20][len(args):]))
@@ -0,0 +1,253 @@
+"""
+Offline replay of recorded Reddit posts and orders through the tick model
+and the sentiment coupling, faster than real time and with a fixed seed.
+Every tick's prices and parameters, the fills and the sentiment updates are
+written to a columnar .npz file (one array per column), so parameter
+changes can be compared before they are deployed.
+
+    python -m benchmarks.replay --market market.json --posts posts.jsonl --orders trades.jsonl --out day.npz
+    python -m benchmarks.replay --posts posts.jsonl --hours 24 --set MU_ATTRITION=0.8 --set MU_ACTIVITY_WEIGHT=3
+
+posts.jsonl holds one Reddit post `data` object per line (created_utc, id,
+subreddit, title, selftext). orders.jsonl holds one order per line (user_id,
+stock_id, side, shares, and created_at or ts), e.g. an export of the trades
+table. market.json is {"stocks": [...], "integrations": [...], "params": {}}
+shaped like the storage's list_stocks / list_integrations / list_params
+results; without it they are read from the configured storage backend.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+import numpy as np
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from constants.constants import INITIAL_CURRENCY
+from utils.db.markets import order_impact
+from utils.ledger import Account
+from benchmarks.fixtures import load_worker
+
+ticker = load_worker("stocks")
+sentiment = load_worker("reddit")
+
+Event = Tuple[float, Dict]  # (epoch seconds, recorded event)
+
+
+#====================================================#
+# RECORDED INPUT
+#====================================================#
+def timestamp(event: Dict) -> float:
+    """Epoch seconds of a recorded post or order"""
+    for field in ("created_utc", "ts", "created_at"):
+        value = event.get(field)
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, str):
+            moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if moment.tzinfo is None:
+                moment = moment.replace(tzinfo=timezone.utc)
+            return moment.timestamp()
+    raise ValueError(f"Event has no timestamp: {event}")
+
+
+def read_events(path: Optional[str]) -> List[Event]:
+    if not path:
+        return []
+    with open(path) as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    return sorted(((timestamp(event), event) for event in events), key=lambda pair: pair[0])
+
+
+async def load_market(path: Optional[str]) -> Tuple[List[Dict], List[Dict], Dict]:
+    if path:
+        with open(path) as f:
+            market = json.load(f)
+        return market["stocks"], market.get("integrations", []), market.get("params", {})
+
+    from utils.db.storage import create_async_storage
+    storage = await create_async_storage()
+    return await storage.list_stocks(), await storage.list_integrations("reddit"), await storage.list_params()
+
+
+#====================================================#
+# REPLAY
+#====================================================#
+class Replay:
+    """
+    Steps the tick model once per TICK_INTERVAL of simulated time, filling
+    the orders due before each tick and running a sentiment cycle every
+    UPDATE_INTERVAL, the way the API and both workers interleave live.
+    """
+
+    def __init__(self, stocks: List[Dict], integrations: List[Dict], params: Dict, start: float, ticks: int, record_every: int = 1):
+        sentiment.sentiment_state = sentiment.SentimentState([], sentiment.SENTIMENT_HALF_LIFE)  # after any --set
+        sentiment.index_db_data(integrations, stocks)
+        sentiment.seen_posts = sentiment.SeenPosts()
+
+        self.stocks = stocks
+        self.columns = {stock["id"]: i for i, stock in enumerate(stocks)}
+        self.prices = np.array([float(stock.get("price", 0)) for stock in stocks])
+        self.terms = np.array([params.get(stock["id"], (0, 0)) for stock in stocks], dtype=np.float64).reshape(-1, 2)
+        self.accounts: Dict[Tuple[str, str], Account] = {}
+        self.start, self.ticks, self.record_every = start, ticks, record_every
+
+        rows = -(-ticks // record_every)
+        self.series = {
+            "timestamp": np.zeros(rows),
+            "price": np.zeros((rows, len(stocks)), dtype=np.float32),
+            "mu": np.zeros((rows, len(stocks)), dtype=np.float32),
+            "sigma": np.zeros((rows, len(stocks)), dtype=np.float32),
+        }
+        self.fills: Dict[str, List] = defaultdict(list)
+        self.sentiments: Dict[str, List] = defaultdict(list)
+        self.rejected = 0
+
+    def fill(self, tick: int, order: Dict):
+        """Fill a market order at the current price, same checks and parameter impact as the API"""
+        stock_id, side, shares = order.get("stock_id"), order.get("side"), float(order.get("shares", 0))
+        column = self.columns.get(stock_id)
+        if column is None or side not in ("buy", "sell") or shares <= 0:
+            self.rejected += 1
+            return
+
+        account = self.accounts.setdefault((order["user_id"], self.stocks[column]["market_id"]), Account(INITIAL_CURRENCY))
+        if side == "sell" and stock_id not in account.positions:
+            self.rejected += 1
+            return
+
+        price = float(self.prices[column])
+        account.apply({"stock_id": stock_id, "side": side, "shares": shares, "price": price, "seq": account.seq + 1})
+        self.terms[column] += order_impact(side, shares)
+
+        for name, value in (("tick", tick), ("user_id", order["user_id"]), ("stock_id", stock_id),
+                            ("side", side), ("shares", shares), ("price", price)):
+            self.fills[name].append(value)
+
+    async def cycle(self, tick: int, now: float, posts: List[Dict]):
+        """One sentiment cycle over the posts published since the previous one, params come from the decayed state"""
+        by_subreddit: Dict[str, List[Dict]] = defaultdict(list)
+        for post in posts:
+            by_subreddit[post.get("subreddit")].append({"data": post})
+
+        # the worker only sees the newest POSTS_LIMIT posts of a subreddit per cycle
+        for subreddit, children in by_subreddit.items():
+            await sentiment.process_subreddit_posts({"data": {"children": children[-sentiment.POSTS_LIMIT:]}}, subreddit, now)
+        params = sentiment.sentiment_state.params(now)
+        for stock_id, terms in params.items():
+            self.terms[self.columns[stock_id]] = terms
+            self.sentiments["tick"].append(tick)
+            self.sentiments["stock_id"].append(stock_id)
+            self.sentiments["mu_term"].append(terms[0])
+            self.sentiments["sigma_term"].append(terms[1])
+
+    async def run(self, posts: List[Event], orders: List[Event]):
+        cycle_ticks = max(1, round(sentiment.UPDATE_INTERVAL / ticker.TICK_INTERVAL))
+        next_post = next_order = 0
+        due_posts: List[Dict] = []
+
+        for tick in range(self.ticks):
+            now = self.start + tick * ticker.TICK_INTERVAL
+
+            while next_order < len(orders) and orders[next_order][0] <= now:
+                self.fill(tick, orders[next_order][1])
+                next_order += 1
+
+            while next_post < len(posts) and posts[next_post][0] <= now:
+                due_posts.append(posts[next_post][1])
+                next_post += 1
+            if tick % cycle_ticks == 0:
+                await self.cycle(tick, now, due_posts)
+                due_posts = []
+
+            self.prices, mu, sigma, self.terms = ticker.step(self.stocks, self.prices, self.terms)
+
+            if tick % self.record_every == 0:
+                row = tick // self.record_every
+                self.series["timestamp"][row] = now
+                self.series["price"][row] = self.prices
+                self.series["mu"][row] = mu
+                self.series["sigma"][row] = sigma
+
+    def save(self, path: str, settings: Dict):
+        columns = {f"fill_{name}": np.array(values) for name, values in self.fills.items()}
+        columns.update({f"sentiment_{name}": np.array(values) for name, values in self.sentiments.items()})
+        np.savez(path, stock_id=np.array(list(self.columns)), settings=np.array(json.dumps(settings)), **self.series, **columns)
+
+    def net_worth(self) -> Dict[Tuple[str, str], float]:
+        prices = {stock_id: float(self.prices[column]) for stock_id, column in self.columns.items()}
+        return {key: account.free_currency + sum(shares * prices[stock_id] for stock_id, shares in account.shares().items())
+                for key, account in self.accounts.items()}
+
+
+#====================================================#
+# CLI
+#====================================================#
+def override(settings: List[str]) -> Dict[str, float]:
+    """Apply NAME=VALUE to the worker constant of that name"""
+    applied = {}
+    for setting in settings:
+        name, _, raw = setting.partition("=")
+        modules = [module for module in (ticker, sentiment) if isinstance(getattr(module, name, None), (int, float))]
+        try:
+            value = float(raw)
+        except ValueError:
+            modules = []
+        if not modules:
+            raise SystemExit(f"unknown setting {setting!r}, expected a numeric worker constant such as MU_ATTRITION=0.8")
+        if isinstance(getattr(modules[0], name), int) and value.is_integer():
+            value = int(value)
+        for module in modules:
+            setattr(module, name, value)
+        applied[name] = value
+    return applied
+
+
+async def main(args):
+    logging.getLogger().setLevel(logging.WARNING)
+    applied = override(args.set)
+    ticker.rng = np.random.default_rng(args.seed)
+    random.seed(args.seed)
+
+    stocks, integrations, params = await load_market(args.market)
+    posts, orders = read_events(args.posts), read_events(args.orders)
+    events = posts + orders
+    start = timestamp({"ts": args.start}) if args.start else min((ts for ts, _ in events), default=0.0)
+    end = start + args.hours * 3600 if args.hours else max((ts for ts, _ in events), default=start + 86400) + ticker.TICK_INTERVAL
+    ticks = int((end - start) // ticker.TICK_INTERVAL)
+
+    replay = Replay(stocks, integrations, params, start, ticks, args.record_every)
+    began = time.perf_counter()
+    await replay.run(posts, orders)
+    elapsed = time.perf_counter() - began
+    replay.save(args.out, {"seed": args.seed, "start": start, "ticks": ticks, **applied})
+
+    simulated = ticks * ticker.TICK_INTERVAL
+    returns = np.diff(np.log(np.maximum(replay.series["price"].astype(np.float64), 1e-12)), axis=0)
+    worth = replay.net_worth()
+    print(f"{len(stocks)} stocks, {ticks} ticks ({simulated / 3600:.1f} h simulated) in {elapsed:.1f} s, "
+          f"{simulated / elapsed:.0f}x real time")
+    print(f"posts {len(posts)} ({sum(sentiment.POSTS_PROCESSED.values.values()):.0f} scored), sentiment updates {len(replay.sentiments['tick'])}, "
+          f"orders {len(orders)} ({len(replay.fills['tick'])} filled, {replay.rejected} rejected)")
+    if len(stocks):
+        print(f"final price mean {replay.prices.mean():.2f} min {replay.prices.min():.2f} max {replay.prices.max():.2f}, "
+              f"volatility per tick {returns.std(axis=0).mean() if len(returns) else 0.0:.5f}")
+    if worth:
+        print(f"accounts {len(worth)}, mean net worth {np.mean(list(worth.values())):.2f}")
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--market", help="stocks/integrations/params JSON, default: the storage backend")
+    parser.add_argument("--posts", help="recorded Reddit posts, JSON lines")
+    parser.add_argument("--orders", help="recorded orders, JSON lines")
+    parser.add_argument("--start", help="ISO start of the replay, default: the first event")
+    parser.add_argument("--hours", type=float, help="simulated duration, default: until the last event")
+    parser.add_argument("--record-every", type=int, default=1, help="keep every nth tick in the output")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="override a worker constant")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="replay.npz")
+    asyncio.run(main(parser.parse_args()))
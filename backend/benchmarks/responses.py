@@ -0,0 +1,86 @@
+"""
+CPU time per /api/markets/stockmarket response, default FastAPI encoding vs
+the orjson fast path with shared per-tick series encoding vs a 304 to a
+viewer revalidating an unchanged market, and upstream fetches for
+concurrent viewers of one market.
+
+    python -m benchmarks.responses [n_stocks] [n_points] [viewers]
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from utils import responses, snapshots
+from utils.db import markets
+from utils.responses import FastJSONResponse
+from benchmarks.fixtures import make_market
+
+
+def default_path(market, market_id, price_range):
+    market = snapshots.select_range(market, price_range)
+    return JSONResponse(jsonable_encoder({"status": 200, "data": {"market": market}})).body
+
+
+def orjson_path(market, market_id, price_range):
+    market = snapshots.select_range(market, price_range)
+    return FastJSONResponse({"status": 200, "data": {"market": market}}).body
+
+
+def shared_path(market, market_id, price_range):
+    public = snapshots.get_public(market_id, lambda: market)
+    overlay = {"free_currency": market["free_currency"], "shares": {stock["stock_id"]: stock["shares"] for stock in market["stocks"]}}
+    return FastJSONResponse(snapshots.envelope("market", snapshots.encode_market(public, overlay, price_range))).body
+
+
+def revalidated_path(market, market_id, price_range):
+    # what the route does for a viewer whose If-None-Match is still current
+    public = snapshots.get_public(market_id, lambda: market)
+    overlay = {"seq": 1, "free_currency": market["free_currency"], "shares": {}}
+    tag = markets.market_etag(public, overlay, market_id, price_range, None)
+    return responses.not_modified(tag, tag).body
+
+
+def cpu_per_request(render, market, viewers, price_range=None):
+    snapshots.public_cache.invalidate()
+    start = time.process_time()
+    for _ in range(viewers):
+        body = render(market, "market-0", price_range)
+    return (time.process_time() - start) / viewers, len(body)
+
+
+def main():
+    n_stocks = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    n_points = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    viewers = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+    market = make_market(n_stocks, n_points)
+    print(f"{n_stocks} stocks x 4 ranges x {n_points} points, {viewers} viewers within one tick")
+    print(f"{'path':<34}{'range':>7}{'bytes':>11}{'CPU ms/req':>12}")
+    for price_range in (None, "h"):
+        for name, render in (("fastapi default (jsonable+json)", default_path),
+                             ("orjson", orjson_path),
+                             ("orjson + shared series encode", shared_path),
+                             ("unchanged, 304", revalidated_path)):
+            seconds, size = cpu_per_request(render, market, viewers, price_range)
+            print(f"{name:<34}{price_range or 'all':>7}{size:>11}{seconds * 1000:>12.2f}")
+
+    print(f"\nupstream get_stock_market_details calls for {viewers} concurrent viewers")
+    for ticks in (1, 3):
+        snapshots.public_cache.invalidate()
+        fetches = []
+
+        def fetch():
+            fetches.append(1)
+            time.sleep(0.05)  # one RPC round trip
+            return market
+
+        with ThreadPoolExecutor(max_workers=viewers) as pool:
+            for tick in range(ticks):
+                list(pool.map(lambda _: snapshots.get_public("market-0", fetch), range(viewers)))
+                time.sleep(snapshots.next_tick(time.time()) - time.time())
+        print(f"{ticks} tick(s): {len(fetches)} calls")
+
+
+if __name__ == "__main__":
+    main()
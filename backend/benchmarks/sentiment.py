@@ -0,0 +1,128 @@
+"""
+Agreement and throughput of the sentiment scorers against TextBlob, on the
+synthetic fan posts of benchmarks.fixtures or on recorded posts (the JSON
+lines benchmarks.replay reads). Posts are scored as the worker scores them,
+title and body together, in batches of --batch.
+
+    python -m benchmarks.sentiment --posts 5000 --batch 10
+    python -m benchmarks.sentiment --file posts.jsonl
+    python -m benchmarks.sentiment --build-lexicon   # regenerate utils/sentiment_lexicon.tsv
+"""
+import argparse
+import json
+import math
+import os
+import time
+import xml.etree.ElementTree as ElementTree
+from typing import Dict, List, Tuple
+from benchmarks.fixtures import make_posts
+from utils import sentiment
+
+
+def build_lexicon(path: str = sentiment.LEXICON_PATH):
+    """
+    Compile TextBlob's en-sentiment.xml the way pattern loads it: every
+    sense of a word averaged per part of speech, then over its parts of
+    speech. A word with an adverb sense modifies the next word. Phrases and
+    contractions are left out, pattern's tokenizer never yields them.
+    """
+    import textblob
+    senses: Dict[str, Dict[str, List]] = {}
+    xml = ElementTree.parse(os.path.join(os.path.dirname(textblob.__file__), "en", "en-sentiment.xml"))
+    for word in xml.getroot().findall("word"):
+        form = word.attrib.get("form")
+        if form:
+            senses.setdefault(form, {}).setdefault(word.attrib.get("pos"), []).append(
+                (float(word.attrib.get("polarity", 0.0)), float(word.attrib.get("intensity", 1.0))))
+
+    def avg(values) -> float:
+        return sum(values) / (len(values) or 1)
+
+    entries: Dict[str, Tuple[float, float, bool]] = {}
+    for form, by_pos in senses.items():
+        per_pos = {pos: [avg(each) for each in zip(*psi)] for pos, psi in by_pos.items()}
+        polarity, intensity = (avg(each) for each in zip(*per_pos.values()))
+        entries[form] = (polarity, intensity, "RB" in by_pos)
+        senses[form] = per_pos
+    # and, like textblob.en.Sentiment, an adverb for every adjective ("terrible" -> "terribly") that scores like it
+    for form, per_pos in senses.items():
+        if "JJ" in per_pos:
+            stem = form[:-1] + "i" if form.endswith("y") else form
+            stem = stem[:-2] if stem.endswith("le") else stem
+            entries[stem + "ly"] = (*per_pos["JJ"], True)
+
+    lines = [f"{form}\t{polarity:.6g}\t{intensity:.6g}\t{int(modifies)}\n"
+             for form, (polarity, intensity, modifies) in sorted(entries.items()) if sentiment.TOKEN.fullmatch(form)]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"# {len(lines)} words compiled from TextBlob's en/en-sentiment.xml (pattern, BSD license)\n")
+        f.write("# by python -m benchmarks.sentiment --build-lexicon\n")
+        f.write("# word\tpolarity\tintensity\tmodifies the next word\n")
+        f.writelines(lines)
+    print(f"wrote {len(lines)} words to {path}")
+
+
+def read_posts(path: str) -> List[Dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def throughput(scorer: sentiment.Scorer, texts: List[str], batch: int) -> Tuple[List[float], float]:
+    """Scores and posts per second"""
+    scores = []
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch):
+        scores += scorer.score(texts[i:i + batch])
+    return scores, len(texts) / (time.perf_counter() - start)
+
+
+def sign(x: float) -> int:
+    return (x > 0) - (x < 0)
+
+
+def correlation(xs: List[float], ys: List[float]) -> float:
+    mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+    cov = sum((x - mx) * (y - my) for x, y in zip(xs, ys))
+    var = math.sqrt(sum((x - mx) ** 2 for x in xs) * sum((y - my) ** 2 for y in ys))
+    return cov / var if var else 0.0
+
+
+def main(args):
+    if args.build_lexicon:
+        build_lexicon()
+        return
+
+    posts = read_posts(args.file) if args.file else make_posts(args.posts, args.seed)
+    texts = [f"{post.get('title', '')} {post.get('selftext', '')}" for post in posts]
+    source = args.file or f"{len(posts)} synthetic posts (seed {args.seed})"
+    print(f"{source}, batches of {args.batch}\n")
+
+    reference, reference_rate = throughput(sentiment.TextBlobScorer(), texts, args.batch)
+    print(f"{'scorer':<10}{'posts/s':>10}{'speedup':>9}{'same sign':>11}{'|diff| mean':>13}{'|diff|<.01':>12}{'pearson':>9}")
+    # the lexicon scorer with TextBlob's blind spot for "n't" shows how closely it follows the rules otherwise
+    scorers = [("textblob", None), ("lexicon", sentiment.LexiconScorer()), ("no n't", sentiment.LexiconScorer(negate_contractions=False))]
+    for name, scorer in scorers:
+        if scorer is None:
+            scores, rate = reference, reference_rate
+        else:
+            scores, rate = throughput(scorer, texts, args.batch)
+        diffs = [abs(a - b) for a, b in zip(scores, reference)]
+        print(f"{name:<10}{rate:>10.0f}{rate / reference_rate:>8.1f}x"
+              f"{sum(sign(a) == sign(b) for a, b in zip(scores, reference)) / len(texts):>11.1%}"
+              f"{sum(diffs) / len(diffs):>13.4f}{sum(d < 0.01 for d in diffs) / len(diffs):>12.1%}{correlation(scores, reference):>9.3f}")
+
+    if args.show:
+        lexicon = sentiment.LexiconScorer(negate_contractions=False).score(texts)
+        disagreements = [(abs(a - b), text, a, b) for text, a, b in zip(texts, lexicon, reference) if abs(a - b) >= 0.01]
+        for _, text, a, b in sorted(disagreements, reverse=True)[:args.show]:
+            print(f"\nlexicon {a:+.3f} textblob {b:+.3f}  {text[:200]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=5000, help="synthetic posts to score")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--file", help="recorded Reddit posts, JSON lines, instead of synthetic ones")
+    parser.add_argument("--batch", type=int, default=10, help="posts per score() call, the worker scores a subreddit's new posts at once")
+    parser.add_argument("--show", type=int, default=0, help="print the N posts the scorers disagree on most")
+    parser.add_argument("--build-lexicon", action="store_true")
+    main(parser.parse_args())
@@ -0,0 +1,71 @@
+"""
+Payload size and encode time of a stock market snapshot, per wire format.
+
+    python -m benchmarks.series [n_stocks] [n_points]
+"""
+import gzip
+import json
+import sys
+import time
+from typing import Callable, Dict, List
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from models.classes import StockPrice
+from utils import series
+from benchmarks.fixtures import make_market
+
+price_list = TypeAdapter(List[StockPrice])
+
+
+def pydantic_json(market: Dict) -> bytes:
+    stocks = []
+    for stock in market["stocks"]:
+        stocks.append({key: price_list.validate_python(value) if series.is_price_series(key, value) else value
+                       for key, value in stock.items()})
+    return json.dumps(jsonable_encoder({"status": 200, "data": {"market": {**market, "stocks": stocks}}})).encode()
+
+
+def default_json(market: Dict) -> bytes:
+    return json.dumps(jsonable_encoder({"status": 200, "data": {"market": market}})).encode()
+
+
+def columnar(media_type: str) -> Callable[[Dict], bytes]:
+    def encode(market: Dict) -> bytes:
+        return series.render({"status": 200, "data": {"market": market}}, "market", media_type).body
+    return encode
+
+
+def measure(encode: Callable[[Dict], bytes], market: Dict, repeat: int = 5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = encode(market)
+        best = min(best, time.perf_counter() - start)
+    return body, best
+
+
+def main():
+    n_stocks = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    n_points = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    formats = {
+        "pydantic StockPrice + json": pydantic_json,
+        "fastapi default json": default_json,
+        "columnar json": columnar(series.COLUMNAR_JSON),
+    }
+    if series.msgpack is not None:
+        formats["columnar msgpack"] = columnar(series.COLUMNAR_MSGPACK)
+
+    for jitter_ms in (0, 50):
+        market = make_market(n_stocks, n_points, jitter_ms=jitter_ms)
+        ticks = n_stocks * n_points * 4
+        print(f"\n{n_stocks} stocks x 4 ranges x {n_points} points, timestamp jitter {jitter_ms}ms ({ticks} ticks)")
+        print(f"{'format':<28}{'bytes':>12}{'B/tick':>8}{'gzip':>12}{'B/tick':>8}{'encode ms':>11}")
+        for name, encode in formats.items():
+            body, seconds = measure(encode, market)
+            zipped = len(gzip.compress(body))
+            print(f"{name:<28}{len(body):>12}{len(body) / ticks:>8.1f}{zipped:>12}{zipped / ticks:>8.1f}{seconds * 1000:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
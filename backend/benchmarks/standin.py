@@ -0,0 +1,270 @@
+"""
+In-memory stand-in for the Supabase tables and RPCs used by the backend.
+
+Implements the subset of the supabase-py query builder the code calls
+(select/insert/update/delete, eq/gt/lt/in_, order/limit/single, rpc) with a
+sync client for the API and an async client for the realtime workers. A
+fixed simulated round trip can be added to every call.
+"""
+import asyncio
+import itertools
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+RANGE_SECONDS = {"h_prices": 3600, "d_prices": 86400, "m_prices": 30 * 86400, "max_prices": None}
+MAX_POINTS = 1000  # every range is downsampled to at most this many points
+
+TABLES = ("markets", "owned_markets", "joined_markets", "integrations", "stocks", "stocks_params",
+          "stock_prices", "profiles_stocks", "profiles", "comments", "trades", "account_snapshots", "market_activity", "orders",
+          "sentiment_state", "alerts", "stock_stats")
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+
+#====================================================#
+# DATABASE
+#====================================================#
+class Database:
+    def __init__(self, rtt: float = 0.0):
+        self.rtt = rtt  # simulated round trip per call, seconds
+        self.tables: Dict[str, List[Dict]] = {name: [] for name in TABLES}
+        self.prices: Dict[str, tuple] = {}  # stock_id -> ([epoch seconds], [price], [iso timestamp])
+        self.lock = threading.RLock()
+        self.ids = itertools.count(1)
+        self.calls = 0
+
+    def new_id(self) -> str:
+        return str(uuid.UUID(int=next(self.ids)))  # deterministic
+
+    def insert(self, table: str, rows: List[Dict]) -> List[Dict]:
+        inserted = []
+        with self.lock:
+            for row in rows:
+                row = {"id": self.new_id(), "created_at": datetime.now().isoformat(), **row}
+                self.tables[table].append(row)
+                inserted.append(dict(row))
+                if table == "stocks":
+                    self.prices[row["id"]] = ([], [], [])
+        return inserted
+
+    #====================================================#
+    # RPCS
+    #====================================================#
+    def rpc(self, name: str, params: Dict) -> Any:
+        return getattr(self, f"rpc_{name}")(**params)
+
+    def rpc_update_stock_price(self, p_stock_id: str, p_new_price: float, p_ts: str):
+        with self.lock:
+            times, prices, stamps = self.prices[p_stock_id]
+            times.append(datetime.fromisoformat(p_ts).timestamp())
+            prices.append(p_new_price)
+            stamps.append(p_ts)
+            for stock in self.tables["stocks"]:
+                if stock["id"] == p_stock_id:
+                    stock["price"] = p_new_price
+        return None
+
+    def rpc_record_stock_prices(self, p_stock_ids: List[str], p_prices: List[float], p_ts: List[str]):
+        with self.lock:
+            for point in sorted(zip(p_stock_ids, p_prices, p_ts), key=lambda point: point[2]):
+                self.rpc_update_stock_price(*point)
+        return None
+
+    def series(self, stock_id: str, seconds: Optional[float]) -> List[Dict]:
+        times, prices, stamps = self.prices.get(stock_id, ([], [], []))
+        start = bisect_left(times, times[-1] - seconds) if times and seconds else 0
+        step = max(1, (len(times) - start) // MAX_POINTS)
+        return [{"price": prices[i], "timestamp": stamps[i]} for i in range(start, len(times), step)]
+
+    def rpc_add_stock_params(self, p_params: List[Dict]):
+        with self.lock:
+            rows = {row["stock_id"]: row for row in self.tables["stocks_params"]}
+            for delta in p_params:
+                row = rows.get(delta["stock_id"])
+                if row is None:
+                    self.tables["stocks_params"].append(dict(delta))
+                else:
+                    row["mu_term"] += delta["mu_term"]
+                    row["sigma_term"] += delta["sigma_term"]
+        return None
+
+    def rpc_get_stock_market_details(self, p_user_id: str, p_market_id: str):
+        with self.lock:
+            market = next((m for m in self.tables["markets"] if m["id"] == p_market_id), None)
+            if market is None:
+                return None
+            joined = next((j for j in self.tables["joined_markets"]
+                           if j["user_id"] == p_user_id and j["market_id"] == p_market_id), None)
+            holdings = {h["stock_id"]: h["shares"] for h in self.tables["profiles_stocks"]
+                        if h["profile_id"] == p_user_id and h["market_id"] == p_market_id}
+            stocks = []
+            for stock in self.tables["stocks"]:
+                if stock["market_id"] != p_market_id:
+                    continue
+                entry = {"stock_id": stock["id"], "ticker": stock["ticker"], "price": stock["price"],
+                         "shares": holdings.get(stock["id"], 0)}
+                for key, seconds in RANGE_SECONDS.items():
+                    entry[key] = self.series(stock["id"], seconds)
+                stocks.append(entry)
+            return {"market_name": market["market_name"], "market_id": market["id"],
+                    "free_currency": joined["free_currency"] if joined else None, "stocks": stocks}
+
+    def rpc_get_all_markets_with_status(self, p_user_id: str):
+        with self.lock:
+            owned = {o["market_id"] for o in self.tables["owned_markets"] if o["user_id"] == p_user_id}
+            joined = {j["market_id"] for j in self.tables["joined_markets"] if j["user_id"] == p_user_id}
+            return [{"market_id": m["id"], "market_name": m["market_name"],
+                     "status": "owned" if m["id"] in owned else "joined" if m["id"] in joined else "none"}
+                    for m in self.tables["markets"]]
+
+    def rpc_get_user_joined_markets(self, p_user_id: str):
+        with self.lock:
+            names = {m["id"]: m["market_name"] for m in self.tables["markets"]}
+            return [{"market_id": j["market_id"], "market_name": names.get(j["market_id"]), "free_currency": j["free_currency"]}
+                    for j in self.tables["joined_markets"] if j["user_id"] == p_user_id]
+
+
+#====================================================#
+# QUERY BUILDER
+#====================================================#
+class Query:
+    def __init__(self, db: Database, table: Optional[str] = None, rpc: Optional[tuple] = None):
+        self.db = db
+        self.table = table
+        self.rpc_call = rpc
+        self.action = "select"
+        self.columns: Optional[List[str]] = None
+        self.payload: Any = None
+        self.filters: List = []
+        self.ordering: Optional[tuple] = None
+        self.row_limit: Optional[int] = None
+        self.one = False
+
+    def select(self, columns: str = "*"):
+        self.action = "select"
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def insert(self, rows):
+        self.action, self.payload = "insert", rows if isinstance(rows, list) else [rows]
+        return self
+
+    def update(self, values: Dict):
+        self.action, self.payload = "update", values
+        return self
+
+    def upsert(self, rows, on_conflict: str = "id"):
+        self.action, self.payload, self.conflict = "upsert", rows if isinstance(rows, list) else [rows], on_conflict
+        return self
+
+    def delete(self):
+        self.action = "delete"
+        return self
+
+    def eq(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def lt(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
+        return self
+
+    def in_(self, column: str, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self.ordering = (column, desc)
+        return self
+
+    def limit(self, count: int):
+        self.row_limit = count
+        return self
+
+    def single(self):
+        self.one = True
+        return self
+
+    def run(self):
+        db = self.db
+        db.calls += 1
+        if self.rpc_call:
+            return Response(db.rpc(*self.rpc_call))
+        if self.action == "insert":
+            return Response(db.insert(self.table, self.payload))
+
+        with db.lock:
+            rows = db.tables[self.table]
+            if self.action == "upsert":
+                existing = {row.get(self.conflict): row for row in rows}
+                for row in self.payload:
+                    if row[self.conflict] in existing:
+                        existing[row[self.conflict]].update(row)
+                    else:
+                        rows.append(dict(row))
+                return Response([dict(row) for row in self.payload])
+            matching = [row for row in rows if all(f(row) for f in self.filters)]
+            if self.action == "update":
+                for row in matching:
+                    row.update(self.payload)
+                return Response([dict(row) for row in matching])
+            if self.action == "delete":
+                db.tables[self.table] = [row for row in rows if not all(f(row) for f in self.filters)]
+                return Response([dict(row) for row in matching])
+
+            if self.ordering:
+                column, desc = self.ordering
+                matching.sort(key=lambda row: row.get(column), reverse=desc)
+            if self.row_limit is not None:
+                matching = matching[:self.row_limit]
+            data = [{c: row.get(c) for c in self.columns} if self.columns else dict(row) for row in matching]
+
+        if self.one:
+            if len(data) != 1:
+                raise Exception(f"single() expected 1 row, got {len(data)}")
+            data = data[0]
+        return Response(data)
+
+    def execute(self):
+        if self.db.rtt:
+            time.sleep(self.db.rtt)
+        return self.run()
+
+
+class AsyncQuery(Query):
+    async def execute(self):
+        if self.db.rtt:
+            await asyncio.sleep(self.db.rtt)
+        return self.run()
+
+
+#====================================================#
+# CLIENTS
+#====================================================#
+class Client:
+    query_class = Query
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    def table(self, name: str):
+        return self.query_class(self.db, table=name)
+
+    def rpc(self, name: str, params: Dict):
+        return self.query_class(self.db, rpc=(name, params))
+
+
+class AsyncClient(Client):
+    query_class = AsyncQuery
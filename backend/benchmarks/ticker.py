@@ -0,0 +1,168 @@
+"""
+Compute cost of one price tick at scale, independent vs correlated shocks,
+the co-movement the correlated mode actually produces, and how many price
+writes each tick policy issues for mostly dormant markets.
+
+    python -m benchmarks.ticker [n_stocks] [n_markets] [ticks]
+"""
+import asyncio
+import itertools
+import math
+import random
+import sys
+import time
+import numpy as np
+from datetime import datetime
+from typing import Callable, Dict, List
+from utils.db.storage import AsyncStorage
+from benchmarks.fixtures import load_worker
+
+ticker = load_worker("stocks")
+
+
+class MemoryStorage(AsyncStorage):
+    """Holds the stocks in a list, so a full tick can be timed without any I/O"""
+
+    def __init__(self, stocks: List[Dict], params: bool = True):
+        self.stocks = stocks
+        self.by_id = {stock["id"]: stock for stock in stocks}
+        self.params = {stock["id"]: (0.001, 0.001) for stock in stocks[::10]} if params else {}
+        self.activity: Dict[str, tuple] = {}
+        self.writes = 0
+
+    async def list_markets(self) -> List[Dict]:
+        return []
+
+    async def list_integrations(self, service: str) -> List[Dict]:
+        return []
+
+    async def list_stocks(self) -> List[Dict]:
+        return self.stocks
+
+    async def list_params(self):
+        return self.params
+
+    async def set_params_batch(self, params):
+        self.params.update(params)
+
+    async def add_params(self, deltas):
+        for stock_id, (mu, sigma) in deltas.items():
+            old_mu, old_sigma = self.params.get(stock_id, (0.0, 0.0))
+            self.params[stock_id] = (old_mu + mu, old_sigma + sigma)
+
+    async def record_prices(self, points):
+        self.writes += len(points)
+        for stock_id, price, _ in points:
+            self.by_id[stock_id]["price"] = price
+
+    async def list_market_activity(self):
+        return self.activity
+
+    async def load_sentiment_state(self):
+        return {}
+
+    async def save_sentiment_state(self, sums, updated_at):
+        pass
+
+    async def load_stock_stats(self):
+        return {}
+
+    async def save_stock_stats(self, stats, updated_at):
+        pass
+
+
+def make_stocks(n_stocks: int, n_markets: int) -> List[Dict]:
+    return [{"id": f"s{i}", "market_id": f"m{i % n_markets}", "price": 1000.0} for i in range(n_stocks)]
+
+
+def best_of(func: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def scalar_tick(prices: List[float], mu: float, sigma: float) -> List[float]:
+    """The per-stock loop the ticker used before"""
+    return [max(0, price * math.exp(mu - (1/2)*(sigma**2) + sigma * random.gauss(0, 1))) for price in prices]
+
+
+def main(n_stocks: int, n_markets: int, ticks: int):
+    stocks = make_stocks(n_stocks, n_markets)
+    prices = np.full(n_stocks, 1000.0)
+    mu, sigma = np.zeros(n_stocks), np.full(n_stocks, ticker.SIGMA)
+    ticker.rng = np.random.default_rng(0)
+
+    print(f"{n_stocks} stocks in {n_markets} markets, best of {ticks} ticks\n")
+    print(f"{'step':<44}{'ms/tick':>10}")
+
+    def report(name: str, seconds: float):
+        print(f"{name:<44}{seconds * 1000:>10.2f}")
+
+    report("per-stock loop (random.gauss)", best_of(lambda: scalar_tick(prices.tolist(), 0.0, ticker.SIGMA), ticks))
+
+    ticker.CORRELATION = ticker.CROSS_MARKET_CORRELATION = 0
+    report("vectorized, independent", best_of(lambda: ticker.next_prices(prices, mu, sigma, ticker.draw_shocks(stocks)), ticks))
+
+    ticker.CORRELATION, ticker.CROSS_MARKET_CORRELATION = 0.5, 0.1
+    ticker.draw_shocks(stocks)  # build and cache the factorization
+    report("vectorized, correlated (cached factors)", best_of(lambda: ticker.next_prices(prices, mu, sigma, ticker.draw_shocks(stocks)), ticks))
+
+    def rebuild():
+        ticker.shock_model_key = None
+        ticker.next_prices(prices, mu, sigma, ticker.draw_shocks(stocks))
+    report("vectorized, correlated (refactor per tick)", best_of(rebuild, ticks))
+
+    dense = min(n_stocks, 2000)
+    covariance = np.full((dense, dense), 0.5)
+    np.fill_diagonal(covariance, 1.0)
+    report(f"dense {dense}x{dense} Cholesky (comparison)", best_of(lambda: np.linalg.cholesky(covariance), max(1, ticks // 5)))
+
+    storage = MemoryStorage(stocks)
+    ticker.storage = storage
+    clock = itertools.count(time.time(), ticker.TICK_INTERVAL)
+    report("full update_stock_prices, correlated", best_of(lambda: asyncio.run(ticker.update_stock_prices(now=next(clock))), ticks))
+
+    # realised correlation of log returns over many ticks
+    samples = np.array([ticker.draw_shocks(stocks) for _ in range(20000)])
+    same = np.corrcoef(samples[:, 0], samples[:, n_markets])[0, 1]
+    other = np.corrcoef(samples[:, 0], samples[:, 1])[0, 1] if n_markets > 1 else float("nan")
+    print(f"\nshock correlation, same market {same:.2f} (target {ticker.CORRELATION}), "
+          f"different markets {other:.2f} (target {ticker.CORRELATION * ticker.CROSS_MARKET_CORRELATION:.2f})")
+
+
+def pacing(n_stocks: int, n_markets: int, watched: int, hours: float = 1):
+    """Price writes per simulated hour when only `watched` markets have viewers"""
+    print(f"\n{n_stocks} stocks in {n_markets} markets, {watched} watched, {hours:g} h simulated")
+    print(f"{'policy':<16}{'price writes':>14}{'per stock-hour':>16}{'wake backfill':>15}")
+    ticker.CORRELATION = ticker.CROSS_MARKET_CORRELATION = 0
+    for policy in ("fixed:1", "adaptive", "catchup"):
+        ticker.TICK_POLICY, ticker.scheduler = policy, ticker.TickScheduler()
+        storage = ticker.storage = MemoryStorage(make_stocks(n_stocks, n_markets), params=False)
+        start = time.time()
+
+        async def run():
+            for i in range(int(hours * 3600 / ticker.TICK_INTERVAL)):
+                now = start + i * ticker.TICK_INTERVAL
+                storage.activity = {f"m{m}": (1, datetime.fromtimestamp(now).isoformat()) for m in range(watched)}
+                await ticker.update_stock_prices(now=now)
+
+            # a viewer opens a dormant market
+            now = start + hours * 3600
+            storage.activity[f"m{n_markets - 1}"] = (1, datetime.fromtimestamp(now).isoformat())
+            before = storage.writes
+            await ticker.update_stock_prices(now=now)
+            return storage.writes - before
+
+        woken = asyncio.run(run())
+        print(f"{policy:<16}{storage.writes:>14}{storage.writes / (n_stocks * hours):>16.1f}{woken:>15}")
+
+
+if __name__ == "__main__":
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [10000, 50, 20][len(args):]))
+    pacing(2000, 200, 10)
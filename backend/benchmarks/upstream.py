@@ -0,0 +1,130 @@
+"""
+Tail latency of reads from a flaky upstream, sent bare or through
+utils.upstream: first with per-attempt timeouts and jittered retries only,
+then with hedged second requests too. The upstream is simulated on the
+event loop: most reads take around --median-ms, --stall of them stall for
+--stall-ms and --hang of them never answer before --hang-s.
+
+The outage part takes the upstream down for a while behind a read cache and
+counts the reads answered fresh, answered stale (the breaker is open) and
+failed, and how long they took.
+
+    python -m benchmarks.upstream --clients 20 --calls 200 --stall 0.03 --hang 0.005
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import Dict, List
+from benchmarks.admission import percentile
+from utils import upstream
+from utils.db.cache import SingleFlightCache
+
+
+class FlakyUpstream:
+    def __init__(self, args, seed: int):
+        self.args = args
+        self.random = random.Random(seed)
+        self.requests = 0
+
+    async def read(self):
+        self.requests += 1
+        roll = self.random.random()
+        if roll < self.args.hang:
+            await asyncio.sleep(self.args.hang_s)
+        elif roll < self.args.hang + self.args.stall:
+            await asyncio.sleep(self.args.stall_ms / 1000)
+        else:
+            await asyncio.sleep(self.random.lognormvariate(0, 0.25) * self.args.median_ms / 1000)
+        return {"data": []}
+
+
+async def run(mode: str, args) -> Dict:
+    service = f"bench-{mode}"
+    upstream.policies[service] = upstream.Policy(args.timeout, args.deadline, args.retries if mode != "bare" else 0, mode == "hedged")
+    flaky = FlakyUpstream(args, args.seed)
+    latencies: List[float] = []
+    failures = 0
+
+    async def client():
+        nonlocal failures
+        for _ in range(args.calls):
+            start = time.perf_counter()
+            try:
+                if mode == "bare":
+                    await flaky.read()
+                else:
+                    await upstream.call_async(service, "read", flaky.read, read=True)
+            except Exception:
+                failures += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(client() for _ in range(args.clients)))
+    return {"latencies": latencies, "failures": failures, "requests": flaky.requests}
+
+
+def outage(args) -> Dict:
+    """Reads every --every-ms through a cache while the upstream is down for --outage-s, and a little after"""
+    service = "bench-outage"
+    upstream.policies[service] = upstream.Policy(args.timeout, args.deadline, args.retries, False)
+    upstream.breakers[service] = upstream.Breaker(service, cooldown=args.cooldown)
+    down_until = time.monotonic() + args.outage_s
+
+    def read():
+        if time.monotonic() < down_until:
+            time.sleep(args.timeout)  # connection attempts that time out
+            raise TimeoutError("upstream down")
+        time.sleep(args.median_ms / 1000)
+        return "fresh"
+
+    # every entry is already expired when it is read, so a read is fresh from upstream, stale or an error
+    cache = SingleFlightCache("bench_outage", 0.000001)
+    cache.entries["market"] = (time.time(), "stale")
+    counts = {"fresh": 0, "stale": 0, "failed": 0}
+    latencies = []
+    end = down_until + args.cooldown + args.timeout * 2
+    while time.monotonic() < end:
+        start = time.perf_counter()
+        try:
+            counts[cache.get("market", lambda: upstream.call(service, "read", read, read=True))] += 1
+        except Exception:
+            counts["failed"] += 1
+        latencies.append(time.perf_counter() - start)
+        time.sleep(args.every_ms / 1000)
+    return {**counts, "latencies": latencies}
+
+
+async def main(args):
+    print(f"{args.clients} clients x {args.calls} reads, median {args.median_ms:g} ms, {args.stall:.1%} stall {args.stall_ms:g} ms, "
+          f"{args.hang:.1%} hang {args.hang_s:g} s; {args.timeout:g} s per attempt, {args.deadline:g} s per call, {args.retries} retries\n")
+    print(f"{'':<18}{'p50 ms':>9}{'p99 ms':>9}{'p99.9 ms':>10}{'max ms':>9}{'failed':>8}{'requests/read':>15}")
+    for mode in ("bare", "retries", "hedged"):
+        result = await run(mode, args)
+        samples = result["latencies"]
+        print(f"{mode:<18}{percentile(samples, 0.5) * 1000:>9.1f}{percentile(samples, 0.99) * 1000:>9.1f}"
+              f"{percentile(samples, 0.999) * 1000:>10.1f}{max(samples) * 1000:>9.1f}{result['failures']:>8}{result['requests'] / len(samples):>15.3f}")
+
+    result = await asyncio.to_thread(outage, args)
+    samples = result["latencies"]
+    print(f"\nupstream down {args.outage_s:g} s, a cached read every {args.every_ms:g} ms, breaker cooldown {args.cooldown:g} s")
+    print(f"fresh {result['fresh']}, stale {result['stale']}, failed {result['failed']}, "
+          f"p50 {percentile(samples, 0.5) * 1000:.1f} ms, max {max(samples) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--calls", type=int, default=200, help="reads per client, one after the other")
+    parser.add_argument("--median-ms", type=float, default=20)
+    parser.add_argument("--stall", type=float, default=0.03, help="share of reads that stall")
+    parser.add_argument("--stall-ms", type=float, default=400)
+    parser.add_argument("--hang", type=float, default=0.005, help="share of reads that hang")
+    parser.add_argument("--hang-s", type=float, default=5)
+    parser.add_argument("--timeout", type=float, default=0.25, help="seconds per attempt")
+    parser.add_argument("--deadline", type=float, default=1.0, help="seconds per call")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--outage-s", type=float, default=3)
+    parser.add_argument("--cooldown", type=float, default=1, help="seconds the breaker stays open before a probe")
+    parser.add_argument("--every-ms", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
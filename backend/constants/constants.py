@@ -1,2 +1,67 @@
 DEFAULT_STOCK_PRICE = 1000
 INITIAL_CURRENCY = 10000
+
+COMMENT_BUFFER_SIZE = 200 # recent comments kept in memory per market
+COMMENT_BUFFER_TTL = 30 # seconds before a market's buffer is read again from the database
+COMMENT_BUFFER_MARKETS = 1000 # markets whose comments are kept in memory, least recently read evicted first
+COMMENT_PAGE_SIZE = 50
+
+TICK_SECONDS = 1 # interval of the price ticker in realtime/stocks.py
+PRICE_RANGES = {"h": "h_prices", "d": "d_prices", "m": "m_prices", "max": "max_prices"}
+
+# TTL in seconds of the read caches in utils/db/cache.py, CACHE_TTL_<NAME> overrides
+CACHE_TTLS = {
+    "get_all_markets": 2,
+    "get_joined_markets": 2,
+    "get_stock_market": 1,
+    "get_user": 30,
+    "get_market_stats": 5,
+}
+
+# trade ledger in utils/ledger.py
+LEDGER_FLUSH_SECONDS = 0.5 # longest a trade waits before it is written
+LEDGER_BATCH_SIZE = 500 # pending trades that trigger an early flush
+LEDGER_SNAPSHOT_EVERY = 100 # trades of an account between two snapshots
+
+# market viewers in utils/activity.py, realtime/stocks.py paces each market's ticks by them
+VIEWER_WINDOW_SECONDS = 60 # a market fetch or comment stream keepalive counts as a viewer this long
+ACTIVITY_PUBLISH_SECONDS = 10 # a watched market's viewer count is rewritten at most this often
+
+# per-user rate limits and admission control in utils/admission.py
+RATE_LIMITS = { # class -> (requests per second, burst)
+    "trade": (10, 30),
+    "read": (20, 60),
+    "search": (2, 5),
+}
+ADMISSION_CAPACITY = 32 # limited requests running at once, below the 40 threads the sync routes share
+SHED_DEPTH = { # queued requests at which a class is answered 429 instead of queued
+    "search": 16,
+    "read": 128,
+    "trade": 256,
+}
+ADMISSION_RETRY_SECONDS = 1 # Retry-After of a shed request
+
+# timeouts, retries, hedging and breakers of upstream calls in utils/upstream.py
+UPSTREAM_POLICIES = { # service -> (seconds per attempt, seconds per call with its retries, retries of a read, hedge reads)
+    "supabase": (3, 8, 2, True),
+    "reddit": (5, 12, 2, True),
+    "twitch": (5, 12, 2, True),
+}
+RETRY_BACKOFF_SECONDS = 0.1 # a read's first retry waits up to this (full jitter), doubled for each next one
+HEDGE_QUANTILE = 0.95 # a read still unanswered past this quantile of its recent latencies is sent a second time
+HEDGE_MIN_SAMPLES = 20 # latencies an op needs before its reads are hedged
+HEDGE_BUDGET = 0.05 # most second requests, as a share of an op's reads
+HEDGE_THREADS = 16 # threads running the sync client's hedged reads
+BREAKER_FAILURES = 5 # consecutive transient errors that open a service's breaker
+BREAKER_COOLDOWN_SECONDS = 10 # an open breaker fails calls fast this long before letting one probe through
+STALE_SECONDS = 300 # longest a read cache serves an expired entry while its upstream's breaker is open
+
+# price alerts in utils/alerts.py
+ALERT_WINDOWS = (60, 300, 900, 3600) # seconds a rise or drop alert can measure its move over
+ALERTS_PER_USER = 100 # active alerts a user may hold
+ALERT_INBOX_SIZE = 50 # latest hits kept per user for clients that were not listening
+
+# rolling price statistics in utils/analytics.py, kept by realtime/stocks.py
+STATS_WINDOWS = {"h": 3600, "d": 86400, "m": 30 * 86400, "max": None} # name -> seconds, None never rolls
+STATS_BUCKETS = 12 # buckets per window, a window covers between 11 and 12 twelfths of its length
+STATS_CHECKPOINT_SECONDS = 10 # how often the ticker writes the statistics of the stocks that moved
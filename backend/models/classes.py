@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
 from typing import Literal
@@ -33,6 +33,15 @@ class Market(BaseModel):
     integrations: List[Integration]
     stocks: List[Stock]
 
+class OrderLeg(BaseModel):
+    stock_id: str
+    side: Literal["buy", "sell"]
+    shares: float = Field(gt=0)
+
+class BatchOrder(BaseModel):
+    market_id: str
+    legs: List[OrderLeg] = Field(min_length=1, max_length=100)
+
 class ExploreMarket(BaseModel):
     market_id: str
     market_name: str
@@ -52,13 +61,16 @@ class StockPrice(BaseModel):
 class Comment(BaseModel):
     created_at: datetime
     user_email: str
-    chat_id: str
+    comment_id: str
     message: str
 
+class CommentPage(BaseModel):
+    comments: List[Comment]
+    next_cursor: Optional[str] = None
+
 class Stock(BaseModel):
     stock_id: str
     ticker: str
-    comments: List[Comment]
     prices: List[StockPrice]
     shares: int
 
@@ -1,13 +1,25 @@
 import aiohttp
 import os
+import sys
 import asyncio
+import bisect
+import itertools
 import logging
+import time
+from array import array
+import numpy as np
 from datetime import datetime
 from dotenv import load_dotenv
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from textblob import TextBlob
-from supabase import acreate_client
-from typing import Dict, List, Set, Tuple, Any
+from typing import Dict, List, Optional, Tuple, Any
+import random
+
+# run as a script (python realtime/<worker>.py), backend/ holds the shared utils
+# and a realtime/ package would shadow supabase's own realtime dependency
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import metrics, upstream
+from utils.db.storage import create_async_storage
+from utils.sentiment import get_scorer
 
 # Set up logging
 logging.basicConfig(
@@ -21,251 +33,578 @@ load_dotenv()
 
 # Constants and configuration
 REDDIT_TOKEN = os.getenv("REDDIT_TOKEN")
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_PRIVATE_KEY")
+REDDIT_API_URL = os.getenv("REDDIT_API_URL", "https://oauth.reddit.com")
 UPDATE_INTERVAL = 10  # seconds
 POSTS_LIMIT = 10  # Number of posts to fetch per subreddit
+LOG_SAMPLE_RATE = 0.05  # fraction of matched posts that are logged
+SEEN_POSTS_PER_SUBREDDIT = 10 * POSTS_LIMIT  # /new only lists the newest POSTS_LIMIT, older ids do not come back
+METRICS_PORT = int(os.getenv("REDDIT_METRICS_PORT", 9102))
+SENTIMENT_SCORER = os.getenv("REDDIT_SENTIMENT_SCORER", "textblob")  # or "lexicon", see utils/sentiment.py
+COMMENT_THREADS_PER_SUBREDDIT = 20  # most recently active posts whose comments are followed
+COMMENT_FETCHES_PER_CYCLE = 5  # threads read per subreddit per cycle, busiest first
+COMMENTS_LIMIT = 100  # newest comments fetched per thread read
+COMMENT_FETCH_CONCURRENCY = 8
+COMMENT_QUEUE_SIZE = 32  # fetched pages waiting to be scored, fetches wait when it is full
+COMMENT_BATCH_SIZE = 500  # comments scored together
+THREAD_IDLE_SECONDS = 3600  # a thread without new comments for this long is no longer followed
+SENTIMENT_HALF_LIFE = 120  # seconds for a text's weight in a stock's sentiment to halve
+SENTIMENT_PRIOR_WEIGHT = 3.0  # neutral texts every stock's sentiment is shrunk with, so one post cannot swing it
+SENTIMENT_MIN_WEIGHT = 0.05  # below this decayed weight a stock has no sentiment left and is dropped
+COMMENT_WEIGHT = 0.25  # of a comment relative to a post
+SENTIMENT_CHECKPOINT_SECONDS = 60
+
+POSTS_PROCESSED = metrics.Counter("reddit_posts_processed_total", "New posts analyzed")
+POST_MATCHES = metrics.Counter("reddit_post_matches_total", "(post or comment, stock) mentions found")
+COMMENTS_PROCESSED = metrics.Counter("reddit_comments_processed_total", "New comments analyzed")
+COMMENT_THREADS = metrics.Gauge("reddit_comment_threads", "Threads whose comments are followed")
+SENTIMENT_STOCKS = metrics.Gauge("reddit_sentiment_stocks", "Stocks with sentiment that has not yet decayed away")
+CYCLE_DURATION = metrics.Histogram("reddit_cycle_duration_seconds", "Wall time of one sentiment cycle")
+SENTIMENT_DURATION = metrics.Histogram("sentiment_duration_seconds", "Time to score one text", buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1))
+DB_WRITE_BATCH = metrics.Histogram("db_write_batch_size", "Writes issued together in one batch", ("worker", "table"), metrics.SIZE_BUCKETS)
+
+#====================================================#
+# WORKER STATE
+#====================================================#
+class StockIndex:
+    """
+    The stocks posts are matched against, array-backed: stock i has id
+    ids[i], belongs to market market_of[i] and is known by the lowercased
+    names[name_start[i]:name_start[i + 1]]. Ids, names and subreddits are
+    interned, so refreshing the index does not duplicate strings already held.
+    """
+    __slots__ = ("ids", "market_of", "names", "name_start", "markets", "subreddit_markets", "subreddit_stocks")
+
+    def __init__(self, integrations: List[Dict], stocks: List[Dict]):
+        markets: Dict[str, int] = {}
+        self.ids: List[str] = []
+        self.market_of = array("i")
+        self.names: List[str] = []
+        self.name_start = array("i", [0])
+        for stock in stocks:
+            stock_id = stock.get('id')
+            market_id = stock.get('market_id')
+            if not (stock_id and market_id):
+                continue
+            self.ids.append(sys.intern(stock_id))
+            self.market_of.append(markets.setdefault(sys.intern(market_id), len(markets)))
+            self.names.extend(sys.intern(name.lower()) for name in stock.get('names') or [])
+            self.name_start.append(len(self.names))
+
+        # subreddit -> the markets integrated with it, and all of their stocks
+        self.subreddit_markets: Dict[str, array] = {}
+        for integration in integrations:
+            market_id = integration.get('market_id')
+            community_id = integration.get('community_id')
+            if market_id and community_id:
+                market = markets.setdefault(sys.intern(market_id), len(markets))
+                linked = self.subreddit_markets.setdefault(sys.intern(community_id), array("i"))
+                if market not in linked:
+                    linked.append(market)
+
+        stocks_of_market: Dict[int, array] = {}
+        for i, market in enumerate(self.market_of):
+            stocks_of_market.setdefault(market, array("i")).append(i)
+        self.subreddit_stocks: Dict[str, array] = {}
+        for subreddit, linked in self.subreddit_markets.items():
+            self.subreddit_stocks[subreddit] = array("i")
+            for market in linked:
+                self.subreddit_stocks[subreddit].extend(stocks_of_market.get(market, ()))
+        self.markets = len(markets)
+
+    def stock_names(self, i: int) -> List[str]:
+        return self.names[self.name_start[i]:self.name_start[i + 1]]
+
+
+def post_key(post_id: str) -> int:
+    """Reddit ids are base36 counters and fit in 8 bytes, anything else is hashed"""
+    try:
+        key = int(post_id, 36)
+        if key < 2**63:
+            return key
+    except (TypeError, ValueError):
+        pass
+    return hash(post_id) & (2**63 - 1)
+
+
+class SeenPosts:
+    """
+    Posts already analyzed, the last SEEN_POSTS_PER_SUBREDDIT of each
+    subreddit in a fixed ring of 8-byte keys, so memory does not grow with uptime.
+    """
+    __slots__ = ("capacity", "rings")
+
+    def __init__(self, capacity: int = SEEN_POSTS_PER_SUBREDDIT):
+        self.capacity = capacity
+        self.rings: Dict[str, List] = {}  # subreddit -> [keys, next slot]
+
+    def add(self, subreddit: str, post_id: str) -> bool:
+        """Remember a post, False if it was already seen"""
+        key = post_key(post_id)
+        ring = self.rings.get(subreddit)
+        if ring is None:
+            ring = self.rings[subreddit] = [array("q", [-1]) * self.capacity, 0]
+        if key in ring[0]:
+            return False
+        ring[0][ring[1]] = key
+        ring[1] = (ring[1] + 1) % self.capacity
+        return True
+
+
+class Thread:
+    """A followed post: the newest comment read (as its post_key) and how busy the thread is"""
+    __slots__ = ("post_id", "cursor", "listed", "read", "active", "fetched")
+
+    def __init__(self, post_id: str, listed: int, now: float):
+        self.post_id = post_id
+        self.cursor = -1
+        self.listed = listed  # num_comments as last listed
+        self.read = 0  # num_comments when last fetched
+        self.active = now  # when the thread was last seen gaining comments
+        self.fetched = 0.0
+
+
+class ThreadTracker:
+    """
+    The most recently active posts of each subreddit, whose comment threads
+    are read incrementally: each thread keeps the key of the newest comment
+    read, and only comments past it are new (Reddit ids are base36
+    counters). A listed post with comments joins, taking the slot of the
+    least recently active thread when the subreddit is full; a thread quiet
+    for THREAD_IDLE_SECONDS is dropped.
+    """
+    __slots__ = ("capacity", "idle_seconds", "threads")
+
+    def __init__(self, capacity: int = COMMENT_THREADS_PER_SUBREDDIT, idle_seconds: float = THREAD_IDLE_SECONDS):
+        self.capacity = capacity
+        self.idle_seconds = idle_seconds
+        self.threads: Dict[str, Dict[str, Thread]] = {}  # subreddit -> post id -> thread
+
+    def observe(self, subreddit: str, post_data: Dict, now: float):
+        """Note a listed post and its comment count"""
+        post_id = post_data.get("id")
+        listed = post_data.get("num_comments") or 0
+        threads = self.threads.setdefault(subreddit, {})
+        thread = threads.get(post_id)
+        if thread is not None:
+            if listed > thread.listed:
+                thread.listed = listed
+                thread.active = now
+            return
+        if not post_id or listed <= 0:
+            return
+        if len(threads) >= self.capacity:
+            del threads[min(threads.values(), key=lambda t: t.active).post_id]
+        threads[post_id] = Thread(sys.intern(post_id), listed, now)
+
+    def due(self, subreddit: str, limit: int, now: float) -> List[Thread]:
+        """The threads to read this cycle: most comments not yet read first, then the least recently read"""
+        threads = self.threads.get(subreddit, {})
+        for post_id in [post_id for post_id, thread in threads.items() if now - thread.active > self.idle_seconds]:
+            del threads[post_id]
+        return sorted(threads.values(), key=lambda t: (t.read - t.listed, t.fetched))[:limit]
+
+    def advance(self, thread: Thread, listed: int, comments: List[Dict], now: float) -> List[Dict]:
+        """Move a thread's cursor past a page of its comments, returns the new ones"""
+        new = []
+        for comment in comments:
+            key = post_key(comment.get("id"))
+            if key > thread.cursor:
+                new.append((key, comment))
+        if new:
+            thread.cursor = max(key for key, _ in new)
+            thread.active = now
+        thread.listed = max(thread.listed, listed)
+        thread.read = thread.listed
+        thread.fetched = now
+        return [comment for _, comment in new]
+
+    def __len__(self) -> int:
+        return sum(len(threads) for threads in self.threads.values())
+
+
+class SentimentState:
+    """
+    Streaming sentiment of each stock, parallel to the stock index: the
+    exponentially decayed weight, polarity sum and squared polarity sum of
+    the texts that mention it, halving every SENTIMENT_HALF_LIFE. The sums
+    are held scaled up to a fixed epoch, so adding a score is one add per
+    array and reading them decays every stock at once; the epoch moves
+    forward before the scale gets large. From the sums come the mean
+    polarity, its dispersion and the mention rate (weight / time constant).
+    """
+    __slots__ = ("ids", "tau", "epoch", "sums")
+
+    def __init__(self, ids: List[str], half_life: float = SENTIMENT_HALF_LIFE, now: float = 0.0):
+        self.ids = ids
+        self.tau = half_life / np.log(2)
+        self.epoch = now
+        self.sums = np.zeros((len(ids), 3))  # weight, polarity sum, squared polarity sum
+
+    def add(self, stocks: List[int], polarities: List[float], now: float, weight: float = 1.0):
+        """Count each (stock, polarity) as a text of this weight, scored at `now`"""
+        if not stocks:
+            return
+        if now - self.epoch > 50 * self.tau:
+            self.rebase(now)
+        polarities = np.asarray(polarities, dtype=np.float64)
+        grown = weight * np.exp((now - self.epoch) / self.tau)
+        np.add.at(self.sums, np.asarray(stocks, dtype=np.intp),
+                  np.column_stack((np.full(len(polarities), grown), grown * polarities, grown * polarities ** 2)))
+
+    def rebase(self, now: float):
+        self.sums *= np.exp((self.epoch - now) / self.tau)
+        self.epoch = now
+
+    def decayed(self, now: float) -> np.ndarray:
+        return self.sums * np.exp((self.epoch - now) / self.tau)
+
+    def rates(self, now: float) -> np.ndarray:
+        """Mentions per second of each stock, weighted like its texts"""
+        return self.decayed(now)[:, 0] / self.tau
+
+    def params(self, now: float) -> Dict[str, Tuple[float, float]]:
+        """
+        (mu, sigma) terms of the stocks with sentiment left: mu follows the
+        mean polarity, shrunk towards neutral while there are few mentions;
+        sigma rises with strong sentiment either way and with disagreement.
+        Stocks whose weight has decayed away are dropped.
+        """
+        sums = self.decayed(now)
+        weight = sums[:, 0]
+        live = np.flatnonzero(weight >= SENTIMENT_MIN_WEIGHT)
+        self.sums[weight < SENTIMENT_MIN_WEIGHT] = 0.0
+        SENTIMENT_STOCKS.set(len(live))
+
+        weight, total, squares = sums[live].T
+        mean = total / (weight + SENTIMENT_PRIOR_WEIGHT)
+        spread = np.sqrt(np.maximum(squares / weight - (total / weight) ** 2, 0.0)) * weight / (weight + SENTIMENT_PRIOR_WEIGHT)
+        mu = (mean * 0.001).tolist()
+        sigma = ((np.abs(mean) + spread) * 0.005).tolist()
+        return {self.ids[i]: (mu[k], sigma[k]) for k, i in enumerate(live.tolist())}
+
+    def reindex(self, ids: List[str]) -> "SentimentState":
+        """The same state over a rebuilt stock index, stocks no longer listed are dropped"""
+        if ids == self.ids:
+            return self
+        state = SentimentState(ids, now=self.epoch)
+        state.tau = self.tau
+        position = {stock_id: i for i, stock_id in enumerate(self.ids)}
+        pairs = [(i, position[stock_id]) for i, stock_id in enumerate(ids) if stock_id in position]
+        if pairs:
+            new, old = np.array(pairs, dtype=np.intp).T
+            state.sums[new] = self.sums[old]
+        return state
+
+    def checkpoint(self, now: float) -> Dict[str, Tuple[float, float, float]]:
+        """The decayed sums of the stocks with sentiment left, as of now"""
+        sums = self.decayed(now)
+        return {self.ids[i]: tuple(sums[i].tolist()) for i in np.flatnonzero(sums[:, 0] >= SENTIMENT_MIN_WEIGHT).tolist()}
+
+    def restore(self, checkpoint: Dict[str, Tuple[Tuple[float, float, float], float]], now: float):
+        """Load checkpointed sums (each with the epoch seconds it was taken at), decayed to now"""
+        self.rebase(now)
+        position = {stock_id: i for i, stock_id in enumerate(self.ids)}
+        for stock_id, (sums, taken) in checkpoint.items():
+            if stock_id in position:
+                self.sums[position[stock_id]] = np.asarray(sums) * np.exp((taken - self.epoch) / self.tau)
 
-# Initialize global variables
-supabase_client = None
-seen_post_ids: Set[str] = set()
 
-# Data structures to cache database information
-markets_cache: List[Dict] = []
-integrations_cache: List[Dict] = []
-stocks_cache: List[Dict] = []
-market_subreddits: Dict[str, List[str]] = {}  # market_id -> [subreddit1, subreddit2, ...]
-stock_market_map: Dict[str, str] = {}  # stock_id -> market_id
-stock_names_map: Dict[str, List[str]] = {}  # stock_id -> [name1, name2, ...]
+# Initialize global variables
+storage = None  # backend picked by STORAGE_BACKEND
+seen_posts = SeenPosts()
+comment_threads = ThreadTracker()
+sentiment_state = SentimentState([])
+last_checkpoint = 0.0
+stock_index = StockIndex([], [])
+scorer = get_scorer(SENTIMENT_SCORER)
 
 
 async def init_client():
-    """Initialize the Supabase client"""
-    global supabase_client
-    supabase_client = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
-    logger.info("Supabase client initialized")
+    """Initialize the storage backend"""
+    global storage
+    storage = await create_async_storage()
+    logger.info("Storage initialized")
 
 
 async def fetch_db_data():
     """Fetch all necessary data from the database and update caches"""
-    global markets_cache, integrations_cache, stocks_cache, market_subreddits, stock_market_map, stock_names_map
-
     try:
-        # Fetch markets
-        markets_response = await supabase_client.table('markets').select('*').execute()
-        markets_cache = markets_response.data
-
-        # Fetch integrations (focusing only on Reddit)
-        integrations_response = await supabase_client.table('integrations').select('*').eq('service', 'reddit').execute()
-        integrations_cache = integrations_response.data
-
-        # Fetch stocks with their names
-        stocks_response = await supabase_client.table('stocks').select('*').execute()
-        stocks_cache = stocks_response.data
-
-        # Map market IDs to their corresponding subreddits
-        market_subreddits = {}
-        for integration in integrations_cache:
-            market_id = integration.get('market_id')
-            community_id = integration.get('community_id')
-
-            if market_id and community_id:
-                if market_id not in market_subreddits:
-                    market_subreddits[market_id] = []
-                market_subreddits[market_id].append(community_id)
-
-        # Map stocks to their markets and names
-        stock_market_map = {}
-        stock_names_map = {}
-        for stock in stocks_cache:
-            stock_id = stock.get('id')
-            market_id = stock.get('market_id')
-            names = stock.get('names', [])
+        # Fetch integrations (focusing only on Reddit) and stocks with their names
+        index_db_data(await storage.list_integrations('reddit'), await storage.list_stocks())
 
-            if stock_id and market_id:
-                stock_market_map[stock_id] = market_id
-                stock_names_map[stock_id] = names
-
-        logger.info(f"Database data refreshed: {len(markets_cache)} markets, {len(integrations_cache)} Reddit integrations, {len(stocks_cache)} stocks")
+        logger.info(f"Database data refreshed: {stock_index.markets} markets, {len(stock_index.subreddit_markets)} subreddits, {len(stock_index.ids)} stocks")
 
     except Exception as e:
         logger.error(f"Error fetching database data: {str(e)}")
 
 
-def extract_words(text: str) -> Set[str]:
-    """Extract individual words from text for analysis"""
-    if not text:
-        return set()
-    return set(text.lower().split())
-
-
-def get_sentiment(text: str) -> float:
-    """Calculate sentiment score for text using TextBlob"""
-    if not text.strip():
-        return 0.0
-    blob = TextBlob(text)
-    return blob.sentiment.polarity
+def index_db_data(integrations: List[Dict], stocks: List[Dict]):
+    """Rebuild the stock index from integration and stock rows, the rows themselves are not kept"""
+    global stock_index, sentiment_state
+    stock_index = StockIndex(integrations, stocks)
+    sentiment_state = sentiment_state.reindex(stock_index.ids)
 
 
 async def fetch_posts(session: aiohttp.ClientSession, subreddit: str) -> Dict:
     """Fetch recent posts from a subreddit"""
-    url = f"https://oauth.reddit.com/r/{subreddit}/new"
+    url = f"{REDDIT_API_URL}/r/{subreddit}/new"
     headers = {
         "Authorization": f"Bearer {REDDIT_TOKEN}",
         "User-Agent": "python:market-sentiment-analyzer:v1.0"
     }
     params = {"limit": POSTS_LIMIT}
 
-    try:
+    async def request():
         async with session.get(url, headers=headers, params=params) as response:
-            if response.status != 200:
-                logger.warning(f"Error fetching posts from r/{subreddit}, status code: {response.status}")
-                return {}
-
+            response.raise_for_status()
             return await response.json()
+
+    try:
+        return await upstream.call_async("reddit", "new_posts", request, read=True)
+    except aiohttp.ClientResponseError as e:
+        logger.warning(f"Error fetching posts from r/{subreddit}, status code: {e.status}")
     except Exception as e:
         logger.error(f"Exception when fetching posts from r/{subreddit}: {str(e)}")
-        return {}
+    return {}
+
+
+async def fetch_comments(session: aiohttp.ClientSession, post_id: str) -> Tuple[int, List[Dict]]:
+    """The comment count of a post and its newest comments, replies included, newest first"""
+    url = f"{REDDIT_API_URL}/comments/{post_id}"
+    headers = {
+        "Authorization": f"Bearer {REDDIT_TOKEN}",
+        "User-Agent": "python:market-sentiment-analyzer:v1.0"
+    }
+    params = {"sort": "new", "limit": COMMENTS_LIMIT, "threaded": "false"}
 
+    async def request():
+        async with session.get(url, headers=headers, params=params) as response:
+            response.raise_for_status()
+            return await response.json()
 
-async def analyze_post(post_data: Dict, subreddit: str) -> Dict[str, float]:
-    """Analyze a single Reddit post for stock sentiment"""
+    try:
+        post_listing, comment_listing = await upstream.call_async("reddit", "comments", request, read=True)
+    except aiohttp.ClientResponseError as e:
+        logger.warning(f"Error fetching comments of post {post_id}, status code: {e.status}")
+        return 0, []
+    except Exception as e:
+        logger.error(f"Exception when fetching comments of post {post_id}: {str(e)}")
+        return 0, []
+
+    posts = post_listing.get("data", {}).get("children", [])
+    listed = (posts[0].get("data", {}).get("num_comments") or 0) if posts else 0
+    # "more" stubs stand for comments past the limit, they are read on a later cycle
+    return listed, [child["data"] for child in comment_listing.get("data", {}).get("children", [])
+                    if child.get("kind") == "t1" and "data" in child]
+
+
+def match_texts(texts: List[str], subreddit: str) -> List[Dict[int, List[str]]]:
+    """
+    The names each lowercased text mentions of each stock of this
+    subreddit's markets, keyed by position in the stock index. Each name is
+    searched for once in all the texts joined, rather than once per text,
+    and a hit skips to the next text. Stocks without names never match.
+    """
+    joined = "\x00".join(texts)
+    ends = list(itertools.accumulate(len(text) + 1 for text in texts))  # where each text's successor starts
+    found: List[Dict[int, List[str]]] = [{} for _ in texts]
+    for i in stock_index.subreddit_stocks.get(subreddit, ()):
+        for name in stock_index.stock_names(i):
+            at = joined.find(name)
+            while at != -1:
+                t = bisect.bisect_right(ends, at)
+                found[t].setdefault(i, []).append(name)
+                at = joined.find(name, ends[t])
+    POST_MATCHES.inc(sum(len(stock_matches) for stock_matches in found))
+    return found
+
+
+def new_post_text(post_data: Dict, subreddit: str) -> Optional[str]:
+    """Title and body of a Reddit post, None if it is empty or was seen before"""
     post_id = post_data.get("id")
     title = post_data.get("title", "")
     body = post_data.get("selftext", "")
     full_text = f"{title} {body}"
 
-    # Skip if we've seen this post before or if it's empty
-    if post_id in seen_post_ids or not full_text.strip():
-        return {}
-
-    seen_post_ids.add(post_id)
-
-    # Extract words from the post
-    post_words = extract_words(full_text)
-
-    # Calculate sentiment for all stocks that have relevant terms in the post
-    stock_sentiments = {}
-
-    for stock_id, names in stock_names_map.items():
-        # Skip stocks that don't have any names defined
-        if not names:
-            continue
-
-        # Check if any of the stock's names appear in the post
-        matches = [name.lower() for name in names if name.lower() in full_text.lower()]
-
-        if matches:
-            # Calculate sentiment score for this stock based on the post
-            sentiment = get_sentiment(full_text)
-
-            # Log the match
-            logger.info(f"Post in r/{subreddit} mentions stock {stock_id} ({', '.join(matches)}): sentiment = {sentiment:.2f}")
+    # Skip if it's empty or if we've seen this post before
+    if not full_text.strip() or not seen_posts.add(subreddit, post_id):
+        return None
+
+    POSTS_PROCESSED.inc()
+    return full_text
+
+
+def score_matches(matched: List[Tuple[str, Dict[int, List[str]]]], subreddit: str, now: float, weight: float = 1.0) -> Dict[int, List[float]]:
+    """
+    Score the texts that mention a stock in one batch and add each text's
+    sentiment to every stock it mentions, in the streaming state and in the
+    returned lists
+    """
+    stock_sentiments: Dict[int, List[float]] = {}
+    if not matched:
+        return stock_sentiments
+    start = time.perf_counter()
+    sentiments = scorer.score([text for text, _ in matched])
+    per_text = (time.perf_counter() - start) / len(matched)
+    for _ in matched:
+        SENTIMENT_DURATION.observe(per_text)
+
+    stocks, polarities = [], []
+    for (_, stock_matches), sentiment in zip(matched, sentiments):
+        for i, matches in stock_matches.items():
+            # Log a sample of the matches
+            if random.random() < LOG_SAMPLE_RATE:
+                logger.info("post_match subreddit=%s stock_id=%s names=%s sentiment=%.2f", subreddit, stock_index.ids[i], ",".join(matches), sentiment)
+            stock_sentiments.setdefault(i, []).append(sentiment)
+            stocks.append(i)
+            polarities.append(sentiment)
+    sentiment_state.add(stocks, polarities, now, weight)
+    return stock_sentiments
 
-            stock_sentiments[stock_id] = sentiment
 
-    return stock_sentiments
+def average(stock_sentiments: Dict[int, List[float]]) -> Dict[int, float]:
+    return {i: sum(sentiments) / len(sentiments) for i, sentiments in stock_sentiments.items() if sentiments}
 
 
-async def process_subreddit_posts(posts_data: Dict, subreddit: str) -> Dict[str, float]:
-    """Process all posts from a subreddit and aggregate sentiment scores by stock"""
+async def process_subreddit_posts(posts_data: Dict, subreddit: str, now: Optional[float] = None) -> Dict[int, float]:
+    """Process all posts from a subreddit into the sentiment state, returns this batch's average sentiment by stock"""
     if not posts_data or 'data' not in posts_data or 'children' not in posts_data['data']:
         logger.warning(f"Invalid data format from r/{subreddit}")
         return {}
 
-    all_stock_sentiments = {}
+    texts = []
     post_count = 0
 
     for post in posts_data['data']['children']:
         if 'data' not in post:
             continue
 
-        post_stock_sentiments = await analyze_post(post['data'], subreddit)
-
-        # Merge sentiment scores
-        for stock_id, sentiment in post_stock_sentiments.items():
-            if stock_id not in all_stock_sentiments:
-                all_stock_sentiments[stock_id] = []
-            all_stock_sentiments[stock_id].append(sentiment)
-
+        full_text = new_post_text(post['data'], subreddit)
+        if full_text is not None:
+            texts.append(full_text)
         post_count += 1
 
-    # Average the sentiment scores for each stock
-    averaged_sentiments = {}
-    for stock_id, sentiments in all_stock_sentiments.items():
-        if sentiments:
-            averaged_sentiments[stock_id] = sum(sentiments) / len(sentiments)
+    # Stocks of this subreddit's markets that have relevant terms in the posts;
+    # a post's sentiment is the same for every stock it mentions
+    matches = match_texts([text.lower() for text in texts], subreddit)
+    averaged_sentiments = average(score_matches([(text, stock_matches) for text, stock_matches in zip(texts, matches) if stock_matches],
+                                                subreddit, time.time() if now is None else now))
 
     logger.info(f"Processed {post_count} posts from r/{subreddit}, found sentiments for {len(averaged_sentiments)} stocks")
     return averaged_sentiments
 
 
-async def update_stock_parameters(stock_sentiments: Dict[str, float]):
-    """Update stock parameters in the database based on sentiment analysis"""
-    if not stock_sentiments:
+async def process_comment_threads(session: aiohttp.ClientSession, subreddits: List[str], now: float) -> int:
+    """
+    Read the new comments of each subreddit's busiest threads into the
+    sentiment state, returns how many were read. Fetches run concurrently and
+    hand their pages to a bounded queue; matching and scoring drain it in
+    batches of COMMENT_BATCH_SIZE as pages arrive, and a full queue holds
+    the fetches back.
+    """
+    queue: asyncio.Queue = asyncio.Queue(COMMENT_QUEUE_SIZE)
+    slots = asyncio.Semaphore(COMMENT_FETCH_CONCURRENCY)
+
+    async def read_thread(subreddit: str, thread: Thread):
+        async with slots:
+            listed, comments = await fetch_comments(session, thread.post_id)
+        new = comment_threads.advance(thread, listed, comments, now)
+        if new:
+            await queue.put((subreddit, new))
+
+    async def read_threads():
+        try:
+            await asyncio.gather(*(read_thread(subreddit, thread) for subreddit in subreddits
+                                   for thread in comment_threads.due(subreddit, COMMENT_FETCHES_PER_CYCLE, now)))
+        finally:
+            await queue.put(None)
+
+    reader = asyncio.ensure_future(read_threads())
+    batch: Dict[str, List[str]] = {}  # subreddit -> comment bodies not yet scored
+    read = batched = 0
+    while True:
+        page = await queue.get()
+        if page is not None:
+            subreddit, comments = page
+            COMMENTS_PROCESSED.inc(len(comments))
+            read += len(comments)
+            batch.setdefault(subreddit, []).extend(comment.get("body") or "" for comment in comments)
+            batched += len(comments)
+        if page is None or batched >= COMMENT_BATCH_SIZE:
+            for subreddit, bodies in batch.items():
+                matches = match_texts([body.lower() for body in bodies], subreddit)
+                score_matches([(body, stock_matches) for body, stock_matches in zip(bodies, matches) if stock_matches],
+                              subreddit, now, COMMENT_WEIGHT)
+            batch, batched = {}, 0
+        if page is None:
+            break
+    await reader
+
+    COMMENT_THREADS.set(len(comment_threads))
+    logger.info(f"Read {read} new comments, following {len(comment_threads)} threads")
+    return read
+
+
+async def update_stock_parameters(params: Dict[str, Tuple[float, float]]):
+    """
+    Add the sentiment terms to the stocks' parameters. The ticker decays
+    every term by elapsed tick, so the last cycle's term is all but gone
+    after UPDATE_INTERVAL and each cycle adds a fresh one, like a trade's
+    impact; adding rather than overwriting keeps the impact of the trades
+    made meanwhile.
+    """
+    if not params:
         return
 
     try:
-        # Batch the updates for efficiency
-        tasks = []
-
-        for stock_id, sentiment in stock_sentiments.items():
-            # Scale sentiment to appropriate parameter adjustments
-            mu_adjustment = sentiment * 0.001  # Adjust scale as needed
-            sigma_adjustment = abs(sentiment) * 0.005  # Higher volatility for strong sentiments
-
-            # First check if the stock already has parameters
-            params_response = await supabase_client.table('stocks_params').select('*').eq('stock_id', stock_id).execute()
-
-            if params_response.data:
-                # Update existing parameters
-                param_update = {
-                    "mu_term": mu_adjustment,
-                    "sigma_term": sigma_adjustment,
-                }
-                tasks.append(
-                    supabase_client.table("stocks_params")
-                    .update(param_update)
-                    .eq("stock_id", stock_id)
-                    .execute()
-                )
-            else:
-                # Create new parameters
-                param_insert = {
-                    "stock_id": stock_id,
-                    "mu_term": mu_adjustment,
-                    "sigma_term": sigma_adjustment
-                }
-                tasks.append(
-                    supabase_client.table("stocks_params")
-                    .insert(param_insert)
-                    .execute()
-                )
-
-        # Execute all updates concurrently
-        if tasks:
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            # Check for exceptions
-            for result in results:
-                if isinstance(result, Exception):
-                    logger.error(f"Error in database update: {str(result)}")
-
-            logger.info(f"Updated parameters for {len(tasks)} stocks based on sentiment analysis")
+        # One batched increment for all stocks
+        DB_WRITE_BATCH.observe(len(params), worker="reddit", table="stocks_params")
+        await storage.add_params(params)
+
+        logger.info(f"Updated parameters for {len(params)} stocks based on sentiment analysis")
 
     except Exception as e:
         logger.error(f"Error updating stock parameters: {str(e)}")
 
 
+async def checkpoint_sentiment_state(now: float):
+    """Save the sentiment state every SENTIMENT_CHECKPOINT_SECONDS, a restarted worker resumes from it"""
+    global last_checkpoint
+    if now - last_checkpoint < SENTIMENT_CHECKPOINT_SECONDS:
+        return
+    try:
+        sums = sentiment_state.checkpoint(now)
+        DB_WRITE_BATCH.observe(len(sums), worker="reddit", table="sentiment_state")
+        await storage.save_sentiment_state(sums, datetime.fromtimestamp(now).isoformat())
+        last_checkpoint = now
+    except Exception as e:
+        logger.error(f"Error checkpointing sentiment state: {str(e)}")
+
+
+async def restore_sentiment_state():
+    """Resume from the last checkpoint, decayed for the time the worker was down"""
+    try:
+        rows = await storage.load_sentiment_state()
+        now = time.time()
+        sentiment_state.restore({stock_id: (sums, datetime.fromisoformat(updated_at).timestamp())
+                                 for stock_id, (sums, updated_at) in rows.items()}, now)
+        logger.info(f"Restored sentiment state of {len(rows)} stocks")
+    except Exception as e:
+        logger.error(f"Error restoring sentiment state: {str(e)}")
+
+
 async def process_all_subreddits():
     """Process all subreddits for all markets"""
+    with CYCLE_DURATION.time():
+        await process_cycle()
+
+
+async def process_cycle():
     # Refresh database data
     await fetch_db_data()
 
     # Collect all unique subreddits
-    all_subreddits = set()
-    for subreddits in market_subreddits.values():
-        all_subreddits.update(subreddits)
+    all_subreddits = set(stock_index.subreddit_markets)
 
     if not all_subreddits:
         logger.warning("No subreddits found for any markets")
@@ -284,60 +623,46 @@ async def process_all_subreddits():
                 logger.error(f"Failed to fetch posts for r/{subreddit}: {str(e)}")
                 posts_by_subreddit[subreddit] = {}
 
-        # Process posts and calculate sentiments
-        process_tasks = {subreddit: process_subreddit_posts(posts, subreddit)
-                         for subreddit, posts in posts_by_subreddit.items()}
+        # Listed posts with comments become followed threads
+        now = time.time()
+        for subreddit, posts in posts_by_subreddit.items():
+            for post in (posts or {}).get('data', {}).get('children', []):
+                if 'data' in post:
+                    comment_threads.observe(subreddit, post['data'], now)
 
-        sentiments_by_subreddit = {}
-        for subreddit, task in process_tasks.items():
+        # Score posts into the sentiment state
+        for subreddit, posts in posts_by_subreddit.items():
             try:
-                sentiments_by_subreddit[subreddit] = await task
+                await process_subreddit_posts(posts, subreddit, now)
             except Exception as e:
                 logger.error(f"Failed to process posts for r/{subreddit}: {str(e)}")
-                sentiments_by_subreddit[subreddit] = {}
-
-    # Aggregate sentiments across subreddits for each stock
-    all_stock_sentiments = {}
-
-    # For each market, aggregate sentiments from its subreddits
-    for market_id, subreddits in market_subreddits.items():
-        for subreddit in subreddits:
-            if subreddit not in sentiments_by_subreddit:
-                continue
-
-            # Get sentiments for this subreddit
-            subreddit_sentiments = sentiments_by_subreddit[subreddit]
-
-            # For each stock in this subreddit's sentiments
-            for stock_id, sentiment in subreddit_sentiments.items():
-                # Make sure this stock belongs to the current market
-                if stock_id in stock_market_map and stock_market_map[stock_id] == market_id:
-                    if stock_id not in all_stock_sentiments:
-                        all_stock_sentiments[stock_id] = []
-                    all_stock_sentiments[stock_id].append(sentiment)
 
-    # Average sentiments for each stock
-    final_stock_sentiments = {}
-    for stock_id, sentiments in all_stock_sentiments.items():
-        if sentiments:
-            final_stock_sentiments[stock_id] = sum(sentiments) / len(sentiments)
+        # New comments of the followed threads
+        try:
+            await process_comment_threads(session, sorted(all_subreddits), now)
+        except Exception as e:
+            logger.error(f"Failed to process comment threads: {str(e)}")
 
-    # Update stock parameters based on sentiment analysis
-    await update_stock_parameters(final_stock_sentiments)
+    # Update stock parameters from the state, quiet stocks keep their decaying sentiment
+    params = sentiment_state.params(now)
+    await update_stock_parameters(params)
+    await checkpoint_sentiment_state(now)
 
     # Log summary
     logger.info(f"Completed sentiment analysis cycle: processed {len(all_subreddits)} subreddits, "
-                f"calculated sentiments for {len(final_stock_sentiments)} stocks")
+                f"sentiment held for {len(params)} stocks")
 
 
 async def main():
     """Main function to run the application"""
     try:
-        # Initialize Supabase client
+        # Initialize the storage backend
         await init_client()
+        await metrics.serve(METRICS_PORT)
 
-        # Initial fetch of database data
+        # Initial fetch of database data, then the sentiment state of the stocks it lists
         await fetch_db_data()
+        await restore_sentiment_state()
 
         # Set up scheduler
         scheduler = AsyncIOScheduler()
@@ -351,7 +676,7 @@ async def main():
         scheduler.start()
 
         logger.info(f"Reddit sentiment analyzer started successfully. "
-                   f"Updating every {UPDATE_INTERVAL} seconds.")
+                   f"Updating every {UPDATE_INTERVAL} seconds, metrics on :{METRICS_PORT}/metrics")
 
         # Keep the main coroutine alive
         while True:
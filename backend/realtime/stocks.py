@@ -1,14 +1,27 @@
 import os
-import asyncio
-import random
+import sys
+import json
 import math
+import asyncio
+import logging
+import time
+import numpy as np
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from supabase import acreate_client  # async client
 
-# Load your Supabase credentials from environment variables
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_PRIVATE_KEY")
+# run as a script (python realtime/<worker>.py), backend/ holds the shared utils
+# and a realtime/ package would shadow supabase's own realtime dependency
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import analytics, metrics
+from utils.db.storage import create_async_storage
+from constants.constants import STATS_CHECKPOINT_SECONDS, VIEWER_WINDOW_SECONDS
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
 
 # Redis connection details
 # Default parameters
@@ -21,101 +34,291 @@ SIGMA_ATTRITION = 0.2
 MU_ACTIVITY_WEIGHT = 6
 SIGMA_ACTIVITY_WEIGHT = 6
 
-supabase_client = None
+# Correlated shocks: every market has one factor (its community's mood) and each
+# stock loads on it, so stocks of a market co-move with correlation CORRELATION.
+# Market factors are correlated among themselves by CROSS_MARKET_CORRELATION.
+# 0 keeps every stock's shock independent.
+CORRELATION = float(os.getenv("STOCKS_CORRELATION", 0))
+CROSS_MARKET_CORRELATION = float(os.getenv("STOCKS_CROSS_MARKET_CORRELATION", 0))
+
+TICK_INTERVAL = 1  # seconds
+
+# Tick pacing per market, see TickScheduler. A policy is "fixed[:seconds]",
+# "adaptive" or "catchup"; STOCKS_TICK_POLICIES maps the markets that differ
+# from the default to theirs, e.g. {"<market id>": "fixed:5"}.
+TICK_POLICY = os.getenv("STOCKS_TICK_POLICY", "adaptive")
+TICK_POLICIES: Dict[str, str] = json.loads(os.getenv("STOCKS_TICK_POLICIES", "{}"))
+IDLE_SECONDS = 60  # a market without viewers, orders or sentiment for this long is idle
+MAX_TICK_INTERVAL = 300  # slowest an idle adaptive market ticks, seconds
+CATCHUP_MAX_POINTS = 240  # most points of the path written when a dormant market is backfilled
+ACTIVITY_EPSILON = 1e-6  # activity terms below this count as no recent orders or sentiment
+LOG_SAMPLE_RATE = 0.01  # fraction of per-stock price updates that are logged
+METRICS_PORT = int(os.getenv("STOCKS_METRICS_PORT", 9101))
+
+TICK_DURATION = metrics.Histogram("tick_duration_seconds", "Wall time of one price tick")
+TICK_OVERRUNS = metrics.Counter("tick_overruns_total", "Ticks that took longer than the tick interval")
+STOCKS_TICKED = metrics.Counter("stocks_ticked_total", "Price updates computed")
+MARKETS_DUE = metrics.Counter("markets_ticked_total", "Markets that were due in a tick round", ("policy",))
+DB_WRITE_BATCH = metrics.Histogram("db_write_batch_size", "Writes issued together in one batch", ("worker", "table"), metrics.SIZE_BUCKETS)
+
+storage = None  # backend picked by STORAGE_BACKEND
+rng = np.random.default_rng()
+price_stats = analytics.RollingStats([])
+last_stats_checkpoint = 0.0
 
 async def init_client():
-    global supabase_client
-    supabase_client = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+    global storage
+    storage = await create_async_storage()
+
+
+#====================================================#
+# SHOCKS
+#====================================================#
+class ShockModel:
+    """
+    Factor model for one set of stocks: epsilon_i = a * f[market(i)] + b * z_i
+    with a^2 + b^2 = 1. Only the (markets x markets) factor covariance needs a
+    Cholesky factor, the per-stock part is a gather and an add, so a tick stays
+    O(stocks) however many stocks a market has.
+    """
+
+    def __init__(self, market_ids: List[str], correlation: float, cross_market_correlation: float):
+        markets, self.market_index = np.unique(np.array(market_ids, dtype=object), return_inverse=True)
+        covariance = np.full((len(markets), len(markets)), cross_market_correlation)
+        np.fill_diagonal(covariance, 1.0)
+        self.factor_cholesky = np.linalg.cholesky(covariance)
+        self.loading = np.sqrt(correlation)
+        self.idiosyncratic = np.sqrt(1 - correlation)
+
+    def draw(self, generator: np.random.Generator) -> np.ndarray:
+        factors = self.factor_cholesky @ generator.standard_normal(len(self.factor_cholesky))
+        noise = generator.standard_normal(len(self.market_index))
+        return self.loading * factors[self.market_index] + self.idiosyncratic * noise
+
+
+shock_model: Optional[ShockModel] = None
+shock_model_key: Optional[Tuple] = None  # the (stock, market) pairs the cached model was built for
+
+
+def draw_shocks(stocks: List[Dict]) -> np.ndarray:
+    """One standard normal shock per stock, correlated within markets when enabled"""
+    global shock_model, shock_model_key
+    if CORRELATION <= 0 and CROSS_MARKET_CORRELATION <= 0:
+        return rng.standard_normal(len(stocks))
+
+    # the factorization only changes when stocks (or markets) are added or removed
+    key = tuple((stock["id"], stock["market_id"]) for stock in stocks)
+    if key != shock_model_key:
+        shock_model = ShockModel([stock["market_id"] for stock in stocks], CORRELATION, CROSS_MARKET_CORRELATION)
+        shock_model_key = key
+    return shock_model.draw(rng)
+
+
+def next_prices(prices: np.ndarray, mu: np.ndarray, sigma: np.ndarray, epsilon: np.ndarray, dt=1.0) -> np.ndarray:
+    """One GBM step for every stock at once, over dt ticks (a scalar or one per stock, 0 leaves a price as is)"""
+    return np.maximum(0, prices * np.exp((mu - (1/2)*(sigma**2)) * dt + sigma * np.sqrt(dt) * epsilon))
+
+
+def step(stocks: List[Dict], prices: np.ndarray, terms: np.ndarray, dt=1.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    One tick of the model without any I/O, shared with the offline replay.
+    terms holds each stock's (mu, sigma) activity terms, returns the new
+    prices, the mu and sigma they were drawn with, and the decayed terms.
+    dt is the number of ticks the step covers, per stock when an array.
+    """
+    # Apply activity weight to the terms
+    mu = MU + terms[:, 0] * MU_ACTIVITY_WEIGHT
+    sigma = SIGMA + terms[:, 1] * SIGMA_ACTIVITY_WEIGHT
+
+    # Generate random price movement for the whole tick in one step
+    new_prices = next_prices(prices, mu, sigma, draw_shocks(stocks), dt)
+
+    # Calculate attrition (decay) for next iteration
+    decayed = terms * np.array([MU_ATTRITION, SIGMA_ATTRITION]) ** np.asarray(dt, dtype=np.float64)[..., None]
+    return new_prices, mu, sigma, decayed
+
+
+#====================================================#
+# TICK PACING
+#====================================================#
+class TickScheduler:
+    """
+    Decides every round which markets tick and over how many base ticks.
+    fixed:  every N seconds regardless of activity.
+    adaptive: every tick while anyone watches or trades or sentiment moves
+              the market, then the interval doubles every IDLE_SECONDS up to
+              MAX_TICK_INTERVAL.
+    catchup:  like adaptive while active, no ticks at all once idle, and the
+              skipped path is backfilled in one batch when activity resumes.
+    A step over dt ticks draws from the same distribution as dt single
+    ticks, so pacing changes how often prices are written, not how they move.
+    """
+
+    def __init__(self):
+        self.last_tick: Dict[str, float] = {}
+        self.last_active: Dict[str, float] = {}
 
-async def update_stock_prices():
+    def policy(self, market_id: str) -> Tuple[str, float]:
+        name, _, seconds = TICK_POLICIES.get(market_id, TICK_POLICY).partition(":")
+        return name, float(seconds) if seconds else TICK_INTERVAL
+
+    def interval(self, policy: str, seconds: float, idle: float) -> float:
+        if policy == "fixed":
+            return seconds
+        if idle < IDLE_SECONDS:
+            return TICK_INTERVAL
+        if policy == "catchup":
+            return math.inf
+        return min(MAX_TICK_INTERVAL, TICK_INTERVAL * 2 ** (idle // IDLE_SECONDS))
+
+    def plan(self, active: Dict[str, bool], now: float) -> Dict[str, Tuple[float, int]]:
+        """market_id -> (ticks elapsed since its last tick, points to write) for the markets due now"""
+        due = {}
+        for market_id, busy in active.items():
+            if busy or market_id not in self.last_active:
+                self.last_active[market_id] = now
+            policy, seconds = self.policy(market_id)
+            last = self.last_tick.get(market_id, now - TICK_INTERVAL)
+
+            # half a tick of slack, the scheduler does not fire exactly on time
+            if now - last < self.interval(policy, seconds, now - self.last_active[market_id]) - TICK_INTERVAL / 2:
+                continue
+            elapsed = (now - last) / TICK_INTERVAL
+            points = min(int(elapsed), CATCHUP_MAX_POINTS) if policy == "catchup" else 1
+            due[market_id] = (elapsed, max(points, 1))
+            self.last_tick[market_id] = now
+            MARKETS_DUE.inc(policy=policy)
+        return due
+
+
+scheduler = TickScheduler()
+
+
+def active_markets(stocks: List[Dict], terms: np.ndarray, activity: Dict[str, Tuple[int, str]], now: float) -> Dict[str, bool]:
+    """Whether each market has viewers (as last published by the API) or recent order/sentiment activity"""
+    active = {stock["market_id"]: False for stock in stocks}
+    for market_id, (viewers, updated_at) in activity.items():
+        if viewers > 0 and market_id in active and now - datetime.fromisoformat(updated_at).timestamp() < VIEWER_WINDOW_SECONDS:
+            active[market_id] = True
+    busy = np.flatnonzero(np.abs(terms).max(axis=1, initial=0) > ACTIVITY_EPSILON)
+    for i in busy.tolist():
+        active[stocks[i]["market_id"]] = True
+    return active
+
+
+async def restore_price_stats():
+    """Resume the rolling statistics from the last checkpoint"""
+    global price_stats
+    try:
+        stocks = await storage.list_stocks()
+        rows = await storage.load_stock_stats()
+        price_stats = price_stats.reindex([stock["id"] for stock in stocks])
+        price_stats.restore(rows, time.time())
+        logger.info(f"Restored price statistics of {len(rows)} stocks")
+    except Exception as e:
+        logger.error(f"Error restoring price statistics: {str(e)}")
+
+
+async def checkpoint_price_stats(now: float):
+    """Write the statistics of the stocks that moved every STATS_CHECKPOINT_SECONDS, the API reads them from there"""
+    global last_stats_checkpoint
+    if now - last_stats_checkpoint < STATS_CHECKPOINT_SECONDS:
+        return
     try:
+        stats = price_stats.checkpoint()
+        DB_WRITE_BATCH.observe(len(stats), worker="stocks", table="stock_stats")
+        await storage.save_stock_stats(stats, datetime.fromtimestamp(now).isoformat())
+        price_stats.dirty[:] = False
+        last_stats_checkpoint = now
+    except Exception as e:
+        logger.error(f"Error checkpointing price statistics: {str(e)}")
+
 
-        # Fetch all stocks from the 'stocks' table
-        response = await supabase_client.table('stocks').select('*').execute()
-        stocks = response.data
+async def update_stock_prices(now: Optional[float] = None):
+    global price_stats
+    start = time.perf_counter()
+    now = time.time() if now is None else now
+    try:
 
-        # Fetch all stock parameters from the 'stocks_params' table
-        params_response = await supabase_client.table('stocks_params').select('*').execute()
-        stock_params = {param['stock_id']: param for param in params_response.data}
+        # Fetch all stocks, their activity parameters and each market's viewers
+        stocks = await storage.list_stocks()
+        stock_params = await storage.list_params()
+        activity = await storage.list_market_activity()
 
         if not stocks:
-            print("No stocks found in database")
+            logger.warning("No stocks found in database")
             return
 
-        current_time = datetime.now().isoformat()
-        print(f"Updating prices for {len(stocks)} stocks at {current_time}")
-
-        # Prepare asynchronous RPC calls for all stocks
-        tasks = []
-        for stock in stocks:
-            stock_id = stock["id"]
-
-            # Get custom parameters for this stock if available, otherwise use defaults
-            if stock_id in stock_params:
-                mu_activity_term = float(stock_params[stock_id].get("mu_term", 0))
-                sigma_activity_term = float(stock_params[stock_id].get("sigma_term", 0))
-            else:
-                mu_activity_term = 0
-                sigma_activity_term = 0
-
-            # Apply activity weight to the terms
-            mu = MU + mu_activity_term * MU_ACTIVITY_WEIGHT
-            sigma = SIGMA + sigma_activity_term * SIGMA_ACTIVITY_WEIGHT
-
-            # Calculate attrition (decay) for next iteration
-            updated_mu_activity_term = mu_activity_term * MU_ATTRITION
-            updated_sigma_activity_term = sigma_activity_term * SIGMA_ATTRITION
-
-            # Update the parameters with attrition values if they exist
-            if stock_id in stock_params:
-                param_update = {
-                    "mu_term": updated_mu_activity_term,
-                    "sigma_term": updated_sigma_activity_term
-                }
-                tasks.append(
-                    supabase_client.table("stocks_params")
-                    .update(param_update)
-                    .eq("stock_id", stock_id)
-                    .execute()
-                )
-
-            # Generate random price movement
-            epsilon = random.gauss(0, 1)
-
-            last_price = float(stock.get("price", 0))
-            new_price = last_price * math.exp(mu - (1/2)*(sigma**2) + sigma * epsilon)
-
-            final_new_price = max(0, new_price)
-
-            print(f"Adding new price {final_new_price} for stock {stock_id}")
-
-            payload = {
-                "p_stock_id": stock_id,
-                "p_new_price": final_new_price,
-                "p_ts": current_time
-            }
-            # Use the RPC method to both insert and update in one call
-            tasks.append(supabase_client.rpc("update_stock_price", payload).execute())
-
-        # Execute all RPC calls concurrently on the same event loop
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        current_time = datetime.fromtimestamp(now).isoformat()
+
+        # Get custom parameters for each stock if available, otherwise use defaults
+        ids = [stock["id"] for stock in stocks]
+        terms = np.array([stock_params.get(stock_id, (0, 0)) for stock_id in ids], dtype=np.float64).reshape(-1, 2)
+        last_prices = np.array([float(stock.get("price", 0)) for stock in stocks])
+        price_stats = price_stats.reindex(ids)
+
+        # Ticks elapsed and points to write per stock, stocks of markets that are not due have 0 elapsed
+        due = scheduler.plan(active_markets(stocks, terms, activity, now), now)
+        elapsed, points = (np.array(column, dtype=np.float64) for column in zip(*(due.get(stock["market_id"], (0.0, 1)) for stock in stocks)))
+        step_dt = elapsed / points
+
+        # A market backfilling k points steps in the last k rounds, the last round is now for every due stock
+        new_prices, decayed = last_prices, terms
+        prices = []
+        rounds = int(points.max())
+        for remaining in range(rounds, 0, -1):
+            moving = points >= remaining
+            old_prices = new_prices
+            new_prices, mu, sigma, decayed = step(stocks, new_prices, decayed, np.where(moving, step_dt, 0.0))
+            moved = np.flatnonzero(moving & (elapsed > 0) & (old_prices > 0))
+            price_stats.add(moved, old_prices[moved], new_prices[moved], step_dt[moved] * TICK_INTERVAL, now)
+            values = new_prices.tolist()
+            for i in np.flatnonzero(moving & (elapsed > 0)).tolist():
+                ts = current_time if remaining == 1 else datetime.fromtimestamp(now - (remaining - 1) * step_dt[i] * TICK_INTERVAL).isoformat()
+                prices.append((ids[i], values[i], ts))
+
+        # Update the parameters with attrition (decay) values if they exist
+        ticked = np.flatnonzero(elapsed > 0)
+        decayed_terms = decayed.tolist()
+        param_updates = {ids[i]: tuple(decayed_terms[i]) for i in ticked.tolist() if ids[i] in stock_params}
+
+        for i in ticked[rng.random(len(ticked)) < LOG_SAMPLE_RATE]:
+            logger.info("price_update stock_id=%s price=%.6f mu=%.6f sigma=%.6f", ids[i], new_prices[i], mu[i], sigma[i])
+
+        STOCKS_TICKED.inc(len(ticked))
+        DB_WRITE_BATCH.observe(len(param_updates), worker="stocks", table="stocks_params")
+        DB_WRITE_BATCH.observe(len(prices), worker="stocks", table="stock_prices")
+
+        # Both batches go out concurrently, a failure in one does not drop the other
+        results = await asyncio.gather(storage.set_params_batch(param_updates), storage.record_prices(prices),
+                                       return_exceptions=True)
 
         # Check for exceptions
-        for result in results:
-            if isinstance(result, Exception):
-                print(f"Error in async operation: {str(result)}")
+        errors = [result for result in results if isinstance(result, Exception)]
+        for error in errors:
+            logger.error(f"Error in async operation: {str(error)}")
+
+        await checkpoint_price_stats(now)
 
-        print("Price update completed successfully")
+        logger.info("tick stocks=%d/%d markets=%d writes=%d errors=%d duration_ms=%.1f", len(ticked), len(stocks),
+                    len(due), len(param_updates) + len(prices), len(errors), (time.perf_counter() - start) * 1000)
     except Exception as e:
-        print(f"Error updating stock prices: {str(e)}")
+        logger.error(f"Error updating stock prices: {str(e)}")
+    finally:
+        duration = time.perf_counter() - start
+        TICK_DURATION.observe(duration)
+        if duration > TICK_INTERVAL:
+            TICK_OVERRUNS.inc()
 
 async def main():
     await init_client()
+    await restore_price_stats()
+    await metrics.serve(METRICS_PORT)
 
     scheduler = AsyncIOScheduler()
-    scheduler.add_job(update_stock_prices, 'interval', seconds=1, id="update_stock_prices", replace_existing=True)
+    scheduler.add_job(update_stock_prices, 'interval', seconds=TICK_INTERVAL, id="update_stock_prices", replace_existing=True)
     scheduler.start()
-    print("Stock price update scheduler started successfully")
+    logger.info(f"Stock price update scheduler started successfully, metrics on :{METRICS_PORT}/metrics")
 
     # Keep the main coroutine alive.
     while True:
@@ -0,0 +1,14 @@
+-- Atomic increment of several stocks' activity terms, used by batch orders and triggered fills (Supabase backend).
+-- The SQLite backend does the same with an upsert, see SqliteStorage.add_params.
+
+create or replace function public.add_stock_params(p_params jsonb)
+returns void
+language sql
+as $$
+    insert into public.stocks_params (stock_id, mu_term, sigma_term)
+    select (item->>'stock_id')::uuid, (item->>'mu_term')::double precision, (item->>'sigma_term')::double precision
+    from jsonb_array_elements(p_params) as item
+    on conflict (stock_id) do update
+        set mu_term = public.stocks_params.mu_term + excluded.mu_term,
+            sigma_term = public.stocks_params.sigma_term + excluded.sigma_term;
+$$;
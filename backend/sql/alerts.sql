@@ -0,0 +1,17 @@
+-- Price alerts used by utils/alerts.py (Supabase backend).
+-- The SQLite backend creates the same table itself, see utils/db/sqlite_storage.py.
+
+create table if not exists public.alerts (
+    id uuid primary key,
+    created_at timestamp not null default now(),
+    user_id uuid not null references public.profiles(id) on delete cascade,
+    market_id uuid not null references public.markets(id) on delete cascade,
+    stock_id uuid not null references public.stocks(id) on delete cascade,
+    kind text not null check (kind in ('above', 'below', 'rise', 'drop')),
+    threshold double precision not null, -- price level, or percent move for rise and drop
+    window_seconds integer, -- seconds a rise or drop is measured over
+    status text not null default 'active', -- active, triggered or cancelled
+    closed_at timestamp
+);
+
+create index if not exists alerts_active on public.alerts (status) where status = 'active';
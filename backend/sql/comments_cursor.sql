@@ -0,0 +1,4 @@
+-- Index behind the (created_at, id) comment cursor, see SupabaseStorage.list_comments (Supabase backend).
+-- The SQLite backend creates the same index itself, see utils/db/sqlite_storage.py.
+
+create index if not exists comments_market_cursor on public.comments (market_id, created_at desc, id desc);
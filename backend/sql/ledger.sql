@@ -0,0 +1,29 @@
+-- Trade ledger and account snapshots used by utils/ledger.py (Supabase backend).
+-- The SQLite backend creates the same tables itself, see utils/db/sqlite_storage.py.
+
+create table if not exists public.trades (
+    id uuid primary key,
+    created_at timestamp not null default now(),
+    user_id uuid not null references public.profiles(id) on delete cascade,
+    market_id uuid not null references public.markets(id) on delete cascade,
+    stock_id uuid not null references public.stocks(id) on delete cascade,
+    side text not null check (side in ('buy', 'sell')),
+    shares double precision not null,
+    price double precision not null,
+    seq bigint not null,
+    unique (user_id, market_id, seq)
+);
+
+create index if not exists trades_market_created on public.trades (market_id, created_at);
+
+create table if not exists public.account_snapshots (
+    user_id uuid not null references public.profiles(id) on delete cascade,
+    market_id uuid not null references public.markets(id) on delete cascade,
+    seq bigint not null,
+    created_at timestamp not null default now(),
+    free_currency double precision not null,
+    positions jsonb not null, -- stock_id -> [shares, cost basis]
+    realized_pnl double precision not null,
+    volume double precision not null,
+    primary key (user_id, market_id, seq)
+);
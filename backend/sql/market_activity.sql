@@ -0,0 +1,8 @@
+-- Viewer counts the API publishes for realtime/stocks.py to pace each market's ticks (Supabase backend).
+-- The SQLite backend creates the same table itself, see utils/db/sqlite_storage.py.
+
+create table if not exists public.market_activity (
+    market_id uuid primary key references public.markets(id) on delete cascade,
+    viewers integer not null,
+    updated_at timestamp not null
+);
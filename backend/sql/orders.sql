@@ -0,0 +1,18 @@
+-- Resting limit and stop orders used by utils/orders.py (Supabase backend).
+-- The SQLite backend creates the same table itself, see utils/db/sqlite_storage.py.
+
+create table if not exists public.orders (
+    id uuid primary key,
+    created_at timestamp not null default now(),
+    user_id uuid not null references public.profiles(id) on delete cascade,
+    market_id uuid not null references public.markets(id) on delete cascade,
+    stock_id uuid not null references public.stocks(id) on delete cascade,
+    side text not null check (side in ('buy', 'sell')),
+    kind text not null check (kind in ('limit', 'stop')),
+    shares double precision not null,
+    price double precision not null, -- trigger price
+    status text not null default 'open', -- open, filled, cancelled or rejected
+    closed_at timestamp
+);
+
+create index if not exists orders_open on public.orders (status) where status = 'open';
@@ -0,0 +1,22 @@
+-- Bulk variant of update_stock_price: one call writes a tick's price points, a catch-up
+-- backfill included, and leaves each stock at its latest point (Supabase backend).
+-- The arrays are parallel, one element per point. The SQLite backend does the same in one
+-- transaction, see SqliteStorage.record_prices.
+
+create or replace function public.record_stock_prices(p_stock_ids uuid[], p_prices double precision[], p_ts timestamp[])
+returns void
+language sql
+as $$
+    insert into public.stock_prices (stock_id, price, "timestamp")
+    select stock_id, price, ts
+    from unnest(p_stock_ids, p_prices, p_ts) as point(stock_id, price, ts);
+
+    update public.stocks
+    set price = latest.price
+    from (
+        select distinct on (stock_id) stock_id, price
+        from unnest(p_stock_ids, p_prices, p_ts) as point(stock_id, price, ts)
+        order by stock_id, ts desc
+    ) as latest
+    where public.stocks.id = latest.stock_id;
+$$;
@@ -0,0 +1,11 @@
+-- Checkpoints of realtime/reddit.py's per-stock sentiment state (Supabase backend): exponentially
+-- decayed sums of the weight, polarity and squared polarity of the texts mentioning a stock, as of updated_at.
+-- The SQLite backend creates the same table itself, see utils/db/sqlite_storage.py.
+
+create table if not exists public.sentiment_state (
+    stock_id uuid primary key references public.stocks(id) on delete cascade,
+    weight double precision not null,
+    polarity_sum double precision not null,
+    square_sum double precision not null,
+    updated_at timestamp not null
+);
@@ -0,0 +1,11 @@
+-- Rolling price statistics of each stock, written by realtime/stocks.py and read by the
+-- analytics endpoint (Supabase backend). `stats` maps a window (h, d, m, max) to its summary:
+-- [count, mean, m2, open, peak, trough, max_drawdown] of the per-second log returns and
+-- prices in the window, see utils/analytics.py.
+-- The SQLite backend creates the same table itself, see utils/db/sqlite_storage.py.
+
+create table if not exists public.stock_stats (
+    stock_id uuid primary key references public.stocks(id) on delete cascade,
+    stats jsonb not null,
+    updated_at timestamp not null
+);
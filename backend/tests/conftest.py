@@ -0,0 +1,5 @@
+import os
+import sys
+
+# backend/ holds the packages under test, as for the realtime workers
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
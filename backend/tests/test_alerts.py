@@ -0,0 +1,97 @@
+import threading
+import pytest
+from utils import alerts
+from utils.alerts import AlertEngine
+
+
+class MemoryStorage:
+    """The storage calls the alert engine makes, against dicts"""
+
+    def __init__(self):
+        self.rows = {}
+        self.statuses = {}
+        self.failing = False
+        self.inserting = None  # an Event the insert waits for, when set
+
+    def list_active_alerts(self):
+        return list(self.rows.values())
+
+    def insert_alert(self, alert):
+        if self.inserting is not None:
+            assert self.inserting.wait(5)
+        if self.failing:
+            raise RuntimeError("insert failed")
+        self.rows[alert["id"]] = alert
+
+    def get_prices(self, stock_ids):
+        return {}
+
+    def close_alerts(self, alert_ids, status):
+        for alert_id in alert_ids:
+            self.statuses[alert_id] = status
+            self.rows.pop(alert_id)
+
+
+@pytest.fixture
+def engine():
+    storage = MemoryStorage()
+    hits = []
+    engine = AlertEngine(lambda: storage, hits.append)
+    engine.closed = True  # no watcher thread, the tests drive check themselves
+    engine.storage, engine.hits = storage, hits
+    return engine
+
+
+def test_level_alerts_fire_once(engine):
+    above = engine.place("u", "m", "s", "above", 110.0)
+    below = engine.place("u", "m", "s", "below", 90.0)
+    assert engine.check({"s": 100.0}, 0) == 0
+    assert engine.check({"s": 110.0}, 1) == 1
+    assert engine.check({"s": 120.0}, 2) == 0
+    assert [hit["id"] for hit in engine.hits] == [above["id"]]
+    assert engine.hits[0]["price"] == 110.0
+    assert engine.storage.statuses == {above["id"]: "triggered"}
+    assert [alert["id"] for alert in engine.active("u")] == [below["id"]]
+
+
+def test_move_alerts_measure_against_the_price_a_window_ago(engine):
+    rise = engine.place("u", "m", "s", "rise", 5.0, 60)
+    for t in range(60):
+        assert engine.check({"s": 100.0 + t * 0.01}, t) == 0  # no reference until the history reaches back 60 s
+    assert engine.check({"s": 104.0}, 60) == 0
+    assert engine.check({"s": 105.5}, 61) == 1
+    assert engine.hits[0]["id"] == rise["id"]
+    assert engine.hits[0]["reference"] == pytest.approx(100.01)
+
+
+def test_cancelled_alerts_do_not_fire(engine):
+    alert = engine.place("u", "m", "s", "below", 90.0)
+    assert engine.cancel("other", alert["id"]) is None
+    assert engine.cancel("u", alert["id"])["id"] == alert["id"]
+    assert engine.check({"s": 80.0}, 0) == 0
+    assert engine.storage.statuses == {alert["id"]: "cancelled"}
+
+
+def test_a_failed_insert_releases_its_slot(engine, monkeypatch):
+    monkeypatch.setattr(alerts, "ALERTS_PER_USER", 1)
+    engine.storage.failing = True
+    with pytest.raises(RuntimeError):
+        engine.place("u", "m", "s", "above", 110.0)
+    engine.storage.failing = False
+    engine.place("u", "m", "s", "above", 110.0)
+    with pytest.raises(ValueError):
+        engine.place("u", "m", "s", "above", 120.0)
+
+
+def test_concurrent_placements_stay_within_the_limit(engine, monkeypatch):
+    monkeypatch.setattr(alerts, "ALERTS_PER_USER", 1)
+    engine.storage.inserting = threading.Event()
+    first = threading.Thread(target=engine.place, args=("u", "m", "s", "above", 110.0))
+    first.start()
+    while not engine.reserved:
+        pass
+    with pytest.raises(ValueError):
+        engine.place("u", "m", "s", "above", 120.0)  # the first insert still holds the only slot
+    engine.storage.inserting.set()
+    first.join()
+    assert len(engine.active("u")) == 1 and not engine.reserved
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from utils.analytics import COUNT, M2, MAX_DRAWDOWN, MEAN, OPEN, PEAK, TROUGH, RollingStats
+
+
+def feed(prices, windows, buckets=4):
+    """One stock ticking once a second through `prices`, returns its summary per window"""
+    stats = RollingStats(["s"], windows, buckets)
+    for t in range(1, len(prices)):
+        stats.add(np.array([0]), np.array([prices[t - 1]]), np.array([prices[t]]), np.array([1.0]), float(t))
+    return stats, stats.checkpoint()["s"]
+
+
+def test_merged_buckets_match_the_moves_of_the_window():
+    rng = np.random.default_rng(0)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 41)))
+    _, summary = feed(prices, {"all": None, "20s": 20.0})
+
+    returns = np.log(prices[1:] / prices[:-1])
+    # 4 buckets of 5 s: the window holds the moves of the current bucket and the 3 before it
+    ticks = np.arange(1, len(prices))
+    first = np.flatnonzero(ticks // 5 > ticks[-1] // 5 - 4)[0]
+    for name, moves, window in (("all", returns, prices), ("20s", returns[first:], prices[first:])):
+        row = summary[name]
+        assert row[COUNT] == len(moves)
+        assert row[MEAN] == pytest.approx(moves.mean())
+        assert row[M2] == pytest.approx(((moves - moves.mean()) ** 2).sum())  # Welford per bucket, Chan across
+        assert row[OPEN] == pytest.approx(window[0])
+        assert row[PEAK] == pytest.approx(window.max())
+        assert row[TROUGH] == pytest.approx(window.min())
+        peaks = np.maximum.accumulate(window)
+        assert row[MAX_DRAWDOWN] == pytest.approx((1 - window / peaks).max())
+
+
+def test_drawdown_spans_buckets():
+    # the peak is in the first bucket of the window, the trough in the last
+    prices = [100.0, 120.0, 115.0, 110.0, 105.0, 100.0, 90.0, 95.0, 96.0]
+    _, summary = feed(prices, {"8s": 8.0}, buckets=4)
+    assert summary["8s"][MAX_DRAWDOWN] == pytest.approx(1 - 90 / 120)
+
+
+def test_restored_stats_survive_a_reindex():
+    stats, summary = feed([100.0, 101.0, 99.0, 102.0], {"all": None})
+    moved = stats.reindex(["new", "s"])
+    assert moved.checkpoint()["s"]["all"] == pytest.approx(summary["all"])
+
+    restored = RollingStats(["s"], {"all": None})
+    restored.restore({"s": summary, "gone": summary}, 10.0)
+    restored.dirty[:] = True
+    assert restored.checkpoint()["s"]["all"] == pytest.approx(summary["all"])
@@ -0,0 +1,97 @@
+import threading
+import time
+import pytest
+from utils import upstream
+from utils.db.cache import SingleFlightCache
+
+
+class Blocking:
+    """A fetch that waits for `release`, so tests can act while it is in flight"""
+
+    def __init__(self, value):
+        self.value = value
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(5)
+        return self.value
+
+
+def in_thread(func, *args):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("value", func(*args)))
+    thread.start()
+    return thread, result
+
+
+def test_hits_until_the_ttl_expires():
+    cache = SingleFlightCache("test_ttl", 60)
+    assert cache.get("k", lambda: 1) == 1
+    assert cache.get("k", lambda: 2) == 1
+    cache.entries["k"] = (time.time() - 1, 1)
+    assert cache.get("k", lambda: 3) == 3
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_concurrent_callers_share_one_fetch():
+    cache = SingleFlightCache("test_coalesce", 60)
+    fetch = Blocking("v")
+    leader, leader_result = in_thread(cache.get, "k", fetch)
+    assert fetch.started.wait(5)
+    follower, follower_result = in_thread(cache.get, "k", lambda: "other")
+    while cache.coalesced == 0:
+        time.sleep(0.001)
+    fetch.release.set()
+    leader.join(), follower.join()
+    assert leader_result["value"] == follower_result["value"] == "v"
+    assert fetch.calls == 1
+
+
+def test_invalidating_a_key_in_flight_drops_only_its_result():
+    cache = SingleFlightCache("test_invalidate", 60)
+    fetch_a, fetch_b = Blocking("a"), Blocking("b")
+    thread_a, _ = in_thread(cache.get, "a", fetch_a)
+    thread_b, _ = in_thread(cache.get, "b", fetch_b)
+    assert fetch_a.started.wait(5) and fetch_b.started.wait(5)
+
+    cache.invalidate("a")  # a write to "a" while both are fetched
+    fetch_a.release.set(), fetch_b.release.set()
+    thread_a.join(), thread_b.join()
+
+    assert "a" not in cache.entries  # fetched before the write, may be stale
+    assert cache.entries["b"][1] == "b"  # unrelated key is still cached
+    assert cache.generations == {}
+
+    assert cache.get("a", lambda: "a2") == "a2"
+    assert cache.entries["a"][1] == "a2"
+
+
+def test_invalidating_everything_drops_results_in_flight():
+    cache = SingleFlightCache("test_invalidate_all", 60)
+    fetch = Blocking("v")
+    thread, _ = in_thread(cache.get, "k", fetch)
+    assert fetch.started.wait(5)
+    cache.get("other", lambda: 1)
+    cache.invalidate()
+    fetch.release.set()
+    thread.join()
+    assert cache.entries == {}
+
+
+def test_expired_entry_is_served_while_upstream_is_unavailable():
+    cache = SingleFlightCache("test_stale", 60)
+    cache.entries["k"] = (time.time() - 1, "old")
+
+    def down():
+        raise upstream.Unavailable("supabase")
+
+    assert cache.get("k", down) == "old"
+    assert cache.stale == 1
+
+    cache.entries["k"] = (time.time() - 10000, "ancient")
+    with pytest.raises(upstream.Unavailable):
+        cache.get("k", down)
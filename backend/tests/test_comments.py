@@ -0,0 +1,76 @@
+import time
+import uuid
+import pytest
+from fastapi import HTTPException
+from utils import comments
+from utils.db import storage
+from utils.db.sqlite_storage import SqliteStorage
+from utils.db import markets
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    db = SqliteStorage(str(tmp_path / "test.db"))
+    monkeypatch.setattr(storage, "_storage", db)
+    monkeypatch.setattr(comments, "buffers", comments.OrderedDict())
+    return db
+
+
+def comment_id(i: int) -> str:
+    return str(uuid.UUID(int=i))
+
+
+def post_at(db: SqliteStorage, market_id: str, created_at: str, n: int):
+    with db.connection() as conn:
+        conn.executemany("INSERT INTO comments (id, created_at, user_id, market_id, message) VALUES (?, ?, 'u', ?, ?)",
+                         [(comment_id(i), created_at, market_id, str(i)) for i in range(n)])
+
+
+def read_all(market_id: str, limit: int):
+    seen, before = [], None
+    while True:
+        page = markets.get_comments(market_id, before, limit)
+        seen += [comment["comment_id"] for comment in page["comments"]]
+        before = page["next_cursor"]
+        if before is None:
+            return seen
+
+
+def test_pages_through_comments_sharing_a_timestamp(db):
+    market_id = db.create_market("m", "owner", [], [])
+    post_at(db, market_id, "2026-01-01T00:00:00", comments.COMMENT_BUFFER_SIZE + 30)
+    expected = [comment_id(i) for i in reversed(range(comments.COMMENT_BUFFER_SIZE + 30))]
+    assert read_all(market_id, 7) == expected  # from memory, then the database past the buffer
+    comments.buffers.clear()
+    assert read_all(market_id, 50) == expected  # from the database only
+
+
+def test_a_stale_buffer_is_read_again(db):
+    market_id = db.create_market("m", "owner", [], [])
+    assert markets.get_comments(market_id)["comments"] == []
+    post_at(db, market_id, "2026-01-01T00:00:00", 1)  # as if through another process
+    assert markets.get_comments(market_id)["comments"] == []
+    comments.get_buffer(market_id).read_at -= comments.COMMENT_BUFFER_TTL
+    assert [comment["comment_id"] for comment in markets.get_comments(market_id)["comments"]] == [comment_id(0)]
+
+
+def test_idle_buffers_are_evicted(monkeypatch):
+    monkeypatch.setattr(comments, "buffers", comments.OrderedDict())
+    monkeypatch.setattr(comments, "COMMENT_BUFFER_MARKETS", 2)
+    watched = comments.get_buffer("a")
+    watched.subscribers[object()] = None
+    comments.get_buffer("b"), comments.get_buffer("c"), comments.get_buffer("d")
+    assert list(comments.buffers) == ["a", "d"]
+    assert comments.get_buffer("a") is watched
+
+
+@pytest.mark.parametrize("before", ["2026-01-01T00:00:00|x),id.gt.0", "2026-01-01T00:00:00|00000000-0000-0000-0000-00000000000G",
+                                    'now",id.gt.0', "2026-01-01T00:00:00|" + str(uuid.UUID(int=0xabc)).upper()])
+def test_malformed_cursors_are_rejected(before):
+    with pytest.raises(HTTPException) as raised:
+        comments.parse_cursor(before)
+    assert raised.value.status_code == 400
+
+
+def test_bare_timestamp_cursors_are_accepted():
+    assert comments.parse_cursor("2026-01-01T00:00:00.5+00:00") == ("2026-01-01T00:00:00.5+00:00", "")
@@ -0,0 +1,56 @@
+import random
+import pytest
+from utils.leaderboard import MarketBoard, SkipList
+
+
+def assert_ranks(skiplist: SkipList, expected):
+    assert list(skiplist) == expected
+    assert len(skiplist) == len(expected)
+    for position, key in enumerate(expected, 1):
+        assert skiplist.rank(key) == position
+
+
+def test_ranks_follow_random_inserts_and_removes():
+    rng = random.Random(1)
+    skiplist, keys = SkipList(seed=1), set()
+    for _ in range(2000):
+        key = (rng.randrange(200), f"u{rng.randrange(50)}")
+        if key in keys and rng.random() < 0.5:
+            skiplist.remove(key)
+            keys.discard(key)
+        elif key not in keys:
+            skiplist.insert(key)
+            keys.add(key)
+    assert_ranks(skiplist, sorted(keys))
+
+
+def test_from_sorted_links_like_inserts():
+    keys = [(float(i // 3), f"u{i:03}") for i in range(500)]
+    skiplist = SkipList.from_sorted(keys, seed=2)
+    assert_ranks(skiplist, keys)
+    skiplist.insert((-1.0, "first"))
+    skiplist.remove(keys[250])
+    assert_ranks(skiplist, [(-1.0, "first")] + keys[:250] + keys[251:])
+
+
+def test_absent_keys_have_no_rank():
+    skiplist = SkipList.from_sorted([(1.0, "a"), (2.0, "b")], seed=0)
+    assert skiplist.rank((1.5, "x")) is None
+    assert skiplist.rank((0.0, "a")) is None
+    with pytest.raises(KeyError):
+        skiplist.remove((3.0, "c"))
+
+
+def test_board_ranks_by_net_worth_and_drops_stale_updates():
+    board = MarketBoard({"s": 10.0})
+    board.update("a", 1, 100.0, {})
+    board.update("b", 1, 50.0, {"s": 10.0})  # worth 150
+    board.update("c", 1, 120.0, {})
+    assert board.top(3) == [(1, "b", 150.0), (2, "c", 120.0), (3, "a", 100.0)]
+    board.update("a", 0, 1000.0, {})  # older than the account it holds
+    assert board.standing("a") == (3, 100.0)
+
+    board.revalue({"s": 1.0}, None)
+    assert board.top(2) == [(1, "c", 120.0), (2, "a", 100.0)]
+    assert board.standing("b") == (3, 60.0)
+    assert board.standing("nobody") is None
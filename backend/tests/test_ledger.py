@@ -0,0 +1,162 @@
+import pytest
+from utils.ledger import Ledger
+
+
+class MemoryStorage:
+    """The storage calls the ledger makes, against dicts, with writes that can be made to fail"""
+
+    def __init__(self):
+        self.balances = {}
+        self.positions = {}
+        self.trades = []
+        self.snapshots = []
+        self.failing = set()  # write names that raise
+        self.fail_users = set()  # users whose row writes raise
+
+    def check(self, name, user_id=None):
+        if name in self.failing or user_id in self.fail_users:
+            raise ConnectionError(f"{name} failed")
+
+    def latest_snapshot(self, user_id, market_id):
+        matching = [s for s in self.snapshots if (s["user_id"], s["market_id"]) == (user_id, market_id)]
+        return max(matching, key=lambda s: s["seq"]) if matching else None
+
+    def list_trades(self, user_id, market_id, after_seq):
+        return [t for t in self.trades if (t["user_id"], t["market_id"]) == (user_id, market_id) and t["seq"] > after_seq]
+
+    def get_balance(self, user_id, market_id):
+        return self.balances.get((user_id, market_id))
+
+    def list_positions(self, user_id, market_id):
+        return {}
+
+    def get_stock(self, stock_id):
+        return {"price": 10.0, "market_id": "m"}
+
+    def save_snapshots(self, snapshots):
+        self.check("save_snapshots")
+        self.snapshots += snapshots
+
+    def append_trades(self, trades):
+        self.check("append_trades")
+        self.trades += trades
+
+    def set_balance(self, user_id, market_id, free_currency):
+        self.check("set_balance", user_id)
+        self.balances[(user_id, market_id)] = free_currency
+
+    def set_position(self, user_id, stock_id, market_id, shares):
+        self.check("set_position", user_id)
+        self.positions[(user_id, market_id, stock_id)] = shares
+
+
+@pytest.fixture
+def storage():
+    storage = MemoryStorage()
+    storage.balances[("alice", "m")] = 1000.0
+    storage.balances[("bob", "m")] = 1000.0
+    return storage
+
+
+def make_ledger(storage, flushed=None, snapshot_every=100):
+    ledger = Ledger(lambda: storage, on_flush=lambda user_id, market_id: flushed.append(user_id) if flushed is not None else None,
+                    snapshot_every=snapshot_every)
+    ledger.start = lambda: None  # flushed by hand
+    return ledger
+
+
+def test_failed_trade_write_keeps_the_batch(storage):
+    ledger = make_ledger(storage)
+    ledger.record("alice", "m", "s1", "buy", 2, 10.0)
+    storage.failing.add("append_trades")
+    with pytest.raises(ConnectionError):
+        ledger.flush()
+    assert storage.trades == []
+    assert storage.balances[("alice", "m")] == 1000.0
+
+    ledger.record("alice", "m", "s1", "buy", 1, 10.0)
+    storage.failing.clear()
+    assert ledger.flush() == 2
+    assert [t["seq"] for t in storage.trades] == [1, 2]
+    assert storage.balances[("alice", "m")] == 970.0
+    assert storage.positions[("alice", "m", "s1")] == 3
+
+
+def test_failed_row_write_is_retried_and_others_land(storage):
+    flushed = []
+    ledger = make_ledger(storage, flushed)
+    ledger.record("alice", "m", "s1", "buy", 2, 10.0)
+    ledger.record("bob", "m", "s1", "buy", 5, 10.0)
+    storage.fail_users.add("alice")
+    with pytest.raises(ConnectionError):
+        ledger.flush()
+
+    # the trades and bob's rows are written, alice's rows are pending again
+    assert len(storage.trades) == 2
+    assert storage.balances[("bob", "m")] == 950.0
+    assert storage.positions[("bob", "m", "s1")] == 5
+    assert storage.balances[("alice", "m")] == 1000.0
+    assert flushed == ["bob"]
+
+    storage.fail_users.clear()
+    assert ledger.flush() == 0
+    assert storage.balances[("alice", "m")] == 980.0
+    assert storage.positions[("alice", "m", "s1")] == 2
+    assert flushed == ["bob", "alice"]
+    assert len(storage.trades) == 2
+
+
+def test_failed_snapshot_is_retried(storage):
+    ledger = make_ledger(storage, snapshot_every=2)
+    ledger.account("alice", "m")
+    assert [s["seq"] for s in storage.snapshots] == [0]
+    ledger.record("alice", "m", "s1", "buy", 1, 10.0)
+    ledger.record("alice", "m", "s1", "buy", 1, 10.0)
+    storage.failing.add("save_snapshots")
+    with pytest.raises(ConnectionError):
+        ledger.flush()
+    assert storage.balances[("alice", "m")] == 980.0
+
+    storage.failing.clear()
+    ledger.flush()
+    assert [s["seq"] for s in storage.snapshots] == [0, 2]
+
+
+def test_account_restores_from_snapshot_and_tail(storage):
+    ledger = make_ledger(storage, snapshot_every=2)
+    for side, shares, price in (("buy", 4, 10.0), ("buy", 2, 20.0), ("sell", 3, 30.0)):
+        ledger.record("alice", "m", "s1", side, shares, price)
+    ledger.flush()
+    live = ledger.account("alice", "m")
+
+    restored = make_ledger(storage).account("alice", "m")
+    assert restored.seq == live.seq == 3
+    assert restored.free_currency == pytest.approx(live.free_currency)
+    assert restored.positions == pytest.approx(live.positions)
+    assert restored.realized_pnl == pytest.approx(live.realized_pnl)
+    # 3 of 6 shares at an average cost of 80 / 6 sold at 30
+    assert restored.realized_pnl == pytest.approx(90 - 40)
+
+
+def test_selling_an_unheld_stock_is_rejected(storage):
+    ledger = make_ledger(storage)
+    with pytest.raises(ValueError):
+        ledger.record("alice", "m", "s1", "sell", 1, 10.0)
+    with pytest.raises(ValueError):
+        ledger.record("carol", "m", "s1", "buy", 1, 10.0)
+
+
+def test_trades_beyond_the_account_are_rejected(storage):
+    ledger = make_ledger(storage)
+    ledger.record("alice", "m", "s1", "buy", 1, 10.0)
+    with pytest.raises(ValueError, match="enough shares"):
+        ledger.record("alice", "m", "s1", "sell", 1000, 10.0)
+    with pytest.raises(ValueError, match="currency"):
+        ledger.record("alice", "m", "s1", "buy", 100, 10.0)  # 990 left
+    with pytest.raises(ValueError, match="currency"):
+        ledger.check("alice", "m", [("s2", "buy", 1, 991.0)], numbered=False)
+
+    account = ledger.account("alice", "m")
+    assert (account.free_currency, account.shares(), account.realized_pnl) == (990.0, {"s1": 1}, 0.0)
+    ledger.record("alice", "m", "s1", "sell", 1, 12.0)
+    assert account.free_currency == pytest.approx(1002.0)
@@ -0,0 +1,45 @@
+import asyncio
+import pytest
+from utils import upstream
+from utils.upstream import Breaker
+
+
+@pytest.fixture
+def tripped(monkeypatch):
+    """The reddit breaker open and past its cooldown, so the next call is its probe"""
+    breaker = Breaker("reddit", failures=1, cooldown=0.0)
+    monkeypatch.setitem(upstream.breakers, "reddit", breaker)
+    breaker.failed()
+    return breaker
+
+
+def test_a_cancelled_probe_lets_the_next_call_probe(tripped):
+    async def main():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        probe = asyncio.ensure_future(upstream.call_async("reddit", "test", hang))
+        await started.wait()
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        async def answer():
+            return "ok"
+        return await upstream.call_async("reddit", "test", answer)
+
+    assert asyncio.run(main()) == "ok"
+    assert tripped.opened_at is None
+
+
+def test_an_interrupted_blocking_probe_lets_the_next_call_probe(tripped):
+    def interrupt():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        upstream.call("reddit", "test", interrupt)
+    assert upstream.call("reddit", "test", lambda: "ok") == "ok"
+    assert tripped.opened_at is None
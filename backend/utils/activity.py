@@ -0,0 +1,40 @@
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Tuple
+from constants.constants import ACTIVITY_PUBLISH_SECONDS, VIEWER_WINDOW_SECONDS
+from utils.db.storage import get_storage
+
+#====================================================#
+# VIEWERS PER MARKET (READ BY THE TICKER TO PACE EACH MARKET)
+#====================================================#
+seen: Dict[str, Dict[str, float]] = {}  # market_id -> user_id -> last seen
+published: Dict[str, Tuple[int, float]] = {}  # market_id -> (viewers, when) last written
+lock = threading.Lock()
+
+
+def viewed(market_id: str, user_id: str):
+    """
+    Note that a user is looking at a market. Its viewer count is written at
+    most every ACTIVITY_PUBLISH_SECONDS, and right away for a market nobody
+    was watching, so a dormant market wakes up on the next tick.
+    """
+    now = time.monotonic()
+    with lock:
+        users = seen.setdefault(market_id, {})
+        users[user_id] = now
+        last = published.get(market_id)
+        if last and now - last[1] < ACTIVITY_PUBLISH_SECONDS:
+            return
+        for user, at in list(users.items()):
+            if now - at > VIEWER_WINDOW_SECONDS:
+                del users[user]
+        viewers = len(users)
+        published[market_id] = (viewers, now)
+
+    try:
+        get_storage().set_market_activity(market_id, viewers, datetime.now().isoformat())
+    except Exception as e:
+        print(e)
+        with lock:
+            published.pop(market_id, None)  # retried on the next view
@@ -0,0 +1,155 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from constants.constants import ADMISSION_CAPACITY, ADMISSION_RETRY_SECONDS, RATE_LIMITS, SHED_DEPTH
+from utils import metrics
+
+PRIORITY = {"trade": 0, "read": 1, "search": 2}  # lower is admitted first
+
+# every other /api route is a read
+REQUEST_CLASSES = {
+    "/api/stocks/buy": "trade",
+    "/api/stocks/sell": "trade",
+    "/api/orders": "trade",
+    "/api/orders/batch": "trade",
+    "/api/reddit/subreddit_search": "search",
+    "/api/twitch/channel_search": "search",
+}
+UNLIMITED = {"/api/login", "/api/register", "/api/logout", "/api/refresh-token"}
+
+REJECTED = metrics.Counter("http_requests_rejected_total", "Requests answered 429 before reaching a route", ("class", "reason"))
+QUEUE_DEPTH = metrics.Gauge("http_admission_queue_depth", "Requests waiting for an admission slot")
+
+
+def classify(path: str) -> Optional[str]:
+    """Priority class of a request, None for routes that are never limited (auth, metrics)"""
+    if not path.startswith("/api/") or path in UNLIMITED:
+        return None
+    return REQUEST_CLASSES.get(path, "read")
+
+
+#====================================================#
+# TOKEN BUCKETS PER USER AND CLASS
+#====================================================#
+class RateLimiter:
+    """
+    One token bucket per (user, class), refilled lazily from the time of
+    its last request, so an idle user costs nothing but its entry. Buckets
+    that would be full again are dropped every few thousand requests.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]] = RATE_LIMITS, prune_every: int = 4096):
+        self.limits = limits  # class -> (tokens per second, burst)
+        self.buckets: Dict[Tuple[str, str], List[float]] = {}  # (key, class) -> [tokens, updated]
+        self.prune_every = prune_every
+        self.calls = 0
+
+    def take(self, key: str, request_class: str, now: Optional[float] = None) -> float:
+        """Spend a token, returns 0 if there was one, else the seconds until there is"""
+        rate, burst = self.limits[request_class]
+        now = time.monotonic() if now is None else now
+        self.calls += 1
+        if self.calls % self.prune_every == 0:
+            self.prune(now)
+
+        bucket = self.buckets.get((key, request_class))
+        if bucket is None:
+            bucket = self.buckets[(key, request_class)] = [burst, now]
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / rate
+
+    def prune(self, now: float):
+        self.buckets = {key: bucket for key, bucket in self.buckets.items()
+                        if bucket[0] + (now - bucket[1]) * self.limits[key[1]][0] < self.limits[key[1]][1]}
+
+
+#====================================================#
+# ADMISSION (BOUNDED IN-FLIGHT, PRIORITY QUEUE, SHEDDING)
+#====================================================#
+class AdmissionGate:
+    """
+    At most `capacity` limited requests run at once, below the size of the
+    threadpool the sync routes share. The rest wait in a priority queue,
+    trades before reads before searches, and a request is shed instead of
+    queued once the queue is as deep as its class's threshold. Lives on the
+    event loop, so it needs no lock.
+    """
+
+    def __init__(self, capacity: int = ADMISSION_CAPACITY, shed_depth: Dict[str, int] = SHED_DEPTH):
+        self.capacity = capacity
+        self.shed_depth = shed_depth
+        self.running = 0
+        self.waiting: List[Tuple[int, int, asyncio.Future]] = []
+        self.order = itertools.count()
+
+    async def acquire(self, request_class: str) -> bool:
+        """Wait for a slot, False if the request should be shed"""
+        if self.running < self.capacity and not self.waiting:
+            self.running += 1
+            return True
+        if len(self.waiting) >= self.shed_depth[request_class]:
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (PRIORITY[request_class], next(self.order), future))
+        QUEUE_DEPTH.set(len(self.waiting))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # the client went away; if the slot was already handed over, pass it on
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        return True
+
+    def release(self):
+        while self.waiting:
+            _, _, future = heapq.heappop(self.waiting)
+            if not future.done():
+                QUEUE_DEPTH.set(len(self.waiting))
+                future.set_result(None)  # the slot moves to the waiter, running stays the same
+                return
+        QUEUE_DEPTH.set(0)
+        self.running -= 1
+
+
+class Admission:
+    """
+    HTTP middleware: rate limit each user per class, then admit through the
+    gate. `identify` maps a request to the key its buckets are kept under.
+    """
+
+    def __init__(self, identify: Callable[[Request], str], limiter: Optional[RateLimiter] = None, gate: Optional[AdmissionGate] = None):
+        self.identify = identify
+        self.limiter = limiter or RateLimiter()
+        self.gate = gate or AdmissionGate()
+
+    async def __call__(self, request: Request, call_next):
+        request_class = classify(request.url.path)
+        if request_class is None:
+            return await call_next(request)
+
+        wait = self.limiter.take(self.identify(request), request_class)
+        if wait:
+            return self.reject(request_class, "rate_limit", wait)
+        if not await self.gate.acquire(request_class):
+            return self.reject(request_class, "shed", ADMISSION_RETRY_SECONDS)
+        try:
+            return await call_next(request)
+        finally:
+            self.gate.release()
+
+    def reject(self, request_class: str, reason: str, retry_after: float) -> JSONResponse:
+        REJECTED.inc(**{"class": request_class, "reason": reason})
+        return JSONResponse({"detail": "Too many requests"}, status_code=429,
+                            headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
@@ -0,0 +1,458 @@
+import asyncio
+import logging
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from constants.constants import ALERT_INBOX_SIZE, ALERT_WINDOWS, ALERTS_PER_USER, TICK_SECONDS
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("above", "below", "rise", "drop")  # price >= level, price <= level, up by pct, down by pct
+SIGN = {"above": 1, "below": -1, "rise": 1, "drop": -1}
+SUBSCRIBER_QUEUE_SIZE = 100  # slow subscribers are dropped once this many hits back up
+KEEPALIVE_SECONDS = 15
+
+GroupKey = Tuple[str, str, int]  # (stock_id, kind, window seconds, 0 for a price level)
+
+
+def validate(kind: str, threshold: float, window: Optional[int]):
+    if kind not in KINDS:
+        raise ValueError(f"Unknown alert kind {kind!r}, expected one of {', '.join(KINDS)}")
+    if not threshold > 0:
+        raise ValueError("The threshold must be positive")
+    if kind in ("rise", "drop") and window not in ALERT_WINDOWS:
+        raise ValueError(f"A {kind} alert needs a window of {', '.join(map(str, ALERT_WINDOWS))} seconds")
+
+
+#====================================================#
+# RULE INDEX (ONE VECTOR COMPARISON PER GROUP PER TICK)
+#====================================================#
+class RuleIndex:
+    """
+    Active rules grouped by (stock, kind, window), each group's thresholds
+    sorted and signed so that the rules a value fires are always a prefix:
+    "above" fires once price >= level, "below" once -price >= -level, "rise"
+    once the move over the window >= pct and "drop" once -move >= pct. A
+    tick compares every group's value with its lowest threshold in one
+    vector operation and only searches the groups that fire, so a group's
+    dormant rules cost nothing per tick however many it holds.
+    """
+
+    def __init__(self):
+        self.columns: Dict[str, int] = {}  # stock -> column of the price vector
+        self.stock_ids: List[str] = []
+        self.counts: List[int] = []  # active rules per column
+        self.groups: Dict[GroupKey, int] = {}
+        self.thresholds: List[np.ndarray] = []  # per group, ascending
+        self.rule_ids: List[List[str]] = []  # per group, in the order of its thresholds
+        self.rules: Dict[str, Tuple[int, float]] = {}  # rule id -> (group, signed threshold)
+        self.column = np.zeros(16, dtype=np.int32)
+        self.sign = np.zeros(16, dtype=np.int8)
+        self.window = np.zeros(16)
+        self.head = np.full(16, np.inf)  # lowest threshold per group, inf while empty
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def group(self, key: GroupKey) -> int:
+        group = self.groups.get(key)
+        if group is not None:
+            return group
+        stock_id, kind, window = key
+        if stock_id not in self.columns:
+            self.columns[stock_id] = len(self.stock_ids)
+            self.stock_ids.append(stock_id)
+            self.counts.append(0)
+
+        group = self.groups[key] = len(self.thresholds)
+        if group == len(self.head):
+            grow = len(self.head)
+            self.column = np.concatenate([self.column, np.zeros(grow, dtype=np.int32)])
+            self.sign = np.concatenate([self.sign, np.zeros(grow, dtype=np.int8)])
+            self.window = np.concatenate([self.window, np.zeros(grow)])
+            self.head = np.concatenate([self.head, np.full(grow, np.inf)])
+        self.column[group] = self.columns[stock_id]
+        self.sign[group] = SIGN[kind]
+        self.window[group] = window
+        self.thresholds.append(np.zeros(0))
+        self.rule_ids.append([])
+        return group
+
+    def add(self, rule_id: str, stock_id: str, kind: str, threshold: float, window: Optional[int]):
+        group = self.group((stock_id, kind, window or 0))
+        key = threshold * SIGN[kind] if kind in ("above", "below") else threshold
+        thresholds = self.thresholds[group]
+        position = int(np.searchsorted(thresholds, key, side="right"))
+        self.thresholds[group] = np.insert(thresholds, position, key)
+        self.rule_ids[group].insert(position, rule_id)
+        self.head[group] = self.thresholds[group][0]
+        self.rules[rule_id] = (group, key)
+        self.counts[self.column[group]] += 1
+
+    def add_many(self, rule_ids: List[str], stock_ids: List[str], kinds: List[str], thresholds: List[float], windows: List[Optional[int]]):
+        """Add rules in bulk, one sort per group"""
+        added: Dict[int, List[Tuple[float, str]]] = {}
+        for rule_id, stock_id, kind, threshold, window in zip(rule_ids, stock_ids, kinds, thresholds, windows):
+            group = self.group((stock_id, kind, window or 0))
+            key = threshold * SIGN[kind] if kind in ("above", "below") else threshold
+            added.setdefault(group, []).append((key, rule_id))
+            self.rules[rule_id] = (group, key)
+            self.counts[self.column[group]] += 1
+
+        for group, rules in added.items():
+            keys = np.concatenate([self.thresholds[group], [key for key, _ in rules]])
+            ids = self.rule_ids[group] + [rule_id for _, rule_id in rules]
+            order = np.argsort(keys, kind="stable")
+            self.thresholds[group] = keys[order]
+            self.rule_ids[group] = [ids[i] for i in order.tolist()]
+            self.head[group] = self.thresholds[group][0]
+
+    def remove(self, rule_id: str):
+        group, key = self.rules.pop(rule_id)
+        thresholds, rule_ids = self.thresholds[group], self.rule_ids[group]
+        position = int(np.searchsorted(thresholds, key, side="left"))
+        position = rule_ids.index(rule_id, position)  # past the rules with the same threshold
+        self.thresholds[group] = np.delete(thresholds, position)
+        del rule_ids[position]
+        self.head[group] = self.thresholds[group][0] if rule_ids else np.inf
+        self.counts[self.column[group]] -= 1
+
+    def watched(self) -> List[str]:
+        """Stocks with at least one active rule"""
+        return [stock_id for stock_id, count in zip(self.stock_ids, self.counts) if count]
+
+    def prices(self, prices: Dict[str, float]) -> np.ndarray:
+        """A price per column, NaN for stocks without one"""
+        vector = np.full(len(self.stock_ids), np.nan)
+        for stock_id, price in prices.items():
+            column = self.columns.get(stock_id)
+            if column is not None:
+                vector[column] = price
+        return vector
+
+    def values(self, prices: np.ndarray, references: np.ndarray) -> np.ndarray:
+        """Per group, the signed price or percent move its thresholds are compared with"""
+        n = len(self.thresholds)
+        price = prices[self.column[:n]]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            moves = (price / references - 1) * 100
+        return np.where(self.window[:n] > 0, moves, price) * self.sign[:n]
+
+    def pop_fired(self, values: np.ndarray) -> List[Tuple[str, int]]:
+        """Remove and return (rule id, group) of every rule the group values fire"""
+        fired = []
+        # NaN (no price, or no reference yet) compares false, as does an empty group's inf
+        for group in np.flatnonzero(values >= self.head[:len(values)]).tolist():
+            count = int(np.searchsorted(self.thresholds[group], values[group], side="right"))
+            rule_ids = self.rule_ids[group][:count]
+            del self.rule_ids[group][:count]
+            self.thresholds[group] = self.thresholds[group][count:].copy()
+            self.head[group] = self.thresholds[group][0] if self.rule_ids[group] else np.inf
+            self.counts[self.column[group]] -= count
+            for rule_id in rule_ids:
+                del self.rules[rule_id]
+            fired += [(rule_id, group) for rule_id in rule_ids]
+        return fired
+
+
+class PriceHistory:
+    """
+    The price vector of every tick for the longest alert window, one row
+    per tick in a ring, float32 since only moves of a few percent are read
+    from it. A move alert has no reference, and cannot fire, until the ring
+    reaches back as far as its window.
+    """
+
+    def __init__(self, seconds: float = max(ALERT_WINDOWS), tick_seconds: float = TICK_SECONDS):
+        self.length = int(seconds / tick_seconds) + 2
+        self.times = np.full(self.length, np.inf)
+        self.prices = np.full((self.length, 16), np.nan, dtype=np.float32)
+        self.next = 0
+        self.filled = 0
+
+    def record(self, now: float, vector: np.ndarray):
+        if len(vector) > self.prices.shape[1]:
+            grow = max(len(vector), 2 * self.prices.shape[1]) - self.prices.shape[1]
+            self.prices = np.concatenate([self.prices, np.full((self.length, grow), np.nan, dtype=np.float32)], axis=1)
+        self.times[self.next] = now
+        self.prices[self.next, :len(vector)] = vector
+        self.prices[self.next, len(vector):] = np.nan
+        self.next = (self.next + 1) % self.length
+        self.filled = min(self.filled + 1, self.length)
+
+    def references(self, columns: np.ndarray, windows: np.ndarray, now: float) -> np.ndarray:
+        """Per (column, window), the price of the latest tick at least `window` seconds ago, NaN if there is none"""
+        start = self.next if self.filled == self.length else 0
+        ordered = np.concatenate([self.times[start:], self.times[:start]])[:self.filled]
+        rows = np.searchsorted(ordered, now - windows, side="right") - 1
+        references = self.prices[(start + np.maximum(rows, 0)) % self.length, columns].astype(float)
+        references[(rows < 0) | (windows <= 0)] = np.nan
+        return references
+
+
+#====================================================#
+# DELIVERY (LATEST HITS AND LIVE STREAMS PER USER)
+#====================================================#
+class Inbox:
+    """A user's latest hits (oldest -> newest) and the streams they are pushed to"""
+
+    def __init__(self):
+        self.recent = deque(maxlen=ALERT_INBOX_SIZE)
+        self.subscribers: Dict[asyncio.Queue, asyncio.AbstractEventLoop] = {}
+        self.lock = threading.Lock()
+
+
+inboxes: Dict[str, Inbox] = {}
+inboxes_lock = threading.Lock()
+
+
+def get_inbox(user_id: str) -> Inbox:
+    with inboxes_lock:
+        if user_id not in inboxes:
+            inboxes[user_id] = Inbox()
+        return inboxes[user_id]
+
+
+def recent(user_id: str) -> List[Dict]:
+    """The user's latest hits, newest first"""
+    inbox = get_inbox(user_id)
+    with inbox.lock:
+        return list(reversed(inbox.recent))
+
+
+def _deliver(inbox: Inbox, queue: asyncio.Queue, hit: Dict):
+    try:
+        queue.put_nowait(hit)
+    except asyncio.QueueFull:
+        with inbox.lock:
+            inbox.subscribers.pop(queue, None)
+
+
+def publish(hit: Dict):
+    """Keep a hit in its user's inbox and push it to their open streams (thread safe)"""
+    inbox = get_inbox(hit["user_id"])
+    with inbox.lock:
+        inbox.recent.append(hit)
+        subscribers = list(inbox.subscribers.items())
+
+    for queue, loop in subscribers:
+        try:
+            loop.call_soon_threadsafe(_deliver, inbox, queue, hit)
+        except RuntimeError:  # the subscriber's loop has been closed
+            with inbox.lock:
+                inbox.subscribers.pop(queue, None)
+
+
+async def subscribe(user_id: str) -> AsyncIterator[Optional[Dict]]:
+    """Yield the user's hits as they fire; yields None every KEEPALIVE_SECONDS while idle"""
+    inbox = get_inbox(user_id)
+    queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    with inbox.lock:
+        inbox.subscribers[queue] = asyncio.get_running_loop()
+
+    try:
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                with inbox.lock:
+                    if queue not in inbox.subscribers:
+                        return
+                yield None
+    finally:
+        with inbox.lock:
+            inbox.subscribers.pop(queue, None)
+
+
+#====================================================#
+# ALERT ENGINE
+#====================================================#
+class AlertEngine:
+    """
+    Active price alerts of every user, kept in memory in front of the
+    storage backend and checked once per tick against the prices of the
+    stocks they watch. A rule fires once: it is closed as triggered and its
+    hit handed to `deliver`. Like the order book, it assumes one API
+    process owns the alerts.
+    """
+
+    def __init__(self, get_storage: Callable, deliver: Callable[[Dict], None] = publish, poll_seconds: float = TICK_SECONDS):
+        self.get_storage = get_storage
+        self.deliver = deliver
+        self.poll_seconds = poll_seconds
+
+        self.alerts: Dict[str, Dict] = {}
+        self.by_user: Dict[str, set] = {}
+        self.reserved: Dict[str, int] = {}  # per user, slots held by alerts still being inserted
+        self.index = RuleIndex()
+        self.history = PriceHistory(tick_seconds=poll_seconds)
+        self.closing: List[str] = []  # triggered ids to write, retried until they land
+        self.loaded = False
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.watcher: Optional[threading.Thread] = None
+        self.closed = False
+
+    def load(self):
+        """Read the active alerts once, on first use"""
+        if self.loaded:
+            return
+        with self.load_lock:
+            if self.loaded:
+                return
+            rows = self.get_storage().list_active_alerts()
+            with self.lock:
+                rows = [{**row, "threshold": float(row["threshold"])} for row in rows if row["id"] not in self.alerts]
+                for row in rows:
+                    self.alerts[row["id"]] = row
+                    self.by_user.setdefault(row["user_id"], set()).add(row["id"])
+                self.index.add_many([row["id"] for row in rows], [row["stock_id"] for row in rows], [row["kind"] for row in rows],
+                                    [row["threshold"] for row in rows], [row["window_seconds"] for row in rows])
+                self.loaded = True
+
+    def add(self, alert: Dict):
+        self.alerts[alert["id"]] = alert
+        self.by_user.setdefault(alert["user_id"], set()).add(alert["id"])
+        self.index.add(alert["id"], alert["stock_id"], alert["kind"], alert["threshold"], alert["window_seconds"])
+
+    def remove(self, alert_id: str) -> Dict:
+        alert = self.alerts.pop(alert_id)
+        self.by_user[alert["user_id"]].discard(alert_id)
+        if not self.by_user[alert["user_id"]]:
+            del self.by_user[alert["user_id"]]
+        return alert
+
+    def release(self, user_id: str):
+        self.reserved[user_id] -= 1
+        if not self.reserved[user_id]:
+            del self.reserved[user_id]
+
+    def place(self, user_id: str, market_id: str, stock_id: str, kind: str, threshold: float, window: Optional[int] = None) -> Dict:
+        validate(kind, threshold, window)
+        self.load()
+        # the slot is held while the insert runs, so concurrent placements cannot overshoot the limit
+        with self.lock:
+            if len(self.by_user.get(user_id, ())) + self.reserved.get(user_id, 0) >= ALERTS_PER_USER:
+                raise ValueError(f"At most {ALERTS_PER_USER} active alerts per user")
+            self.reserved[user_id] = self.reserved.get(user_id, 0) + 1
+        alert = {
+            "id": str(uuid.uuid4()),
+            "created_at": datetime.now().isoformat(),
+            "user_id": user_id,
+            "market_id": market_id,
+            "stock_id": stock_id,
+            "kind": kind,
+            "threshold": threshold,
+            "window_seconds": window if kind in ("rise", "drop") else None,
+            "status": "active",
+        }
+        try:
+            self.get_storage().insert_alert(alert)
+        except Exception:
+            with self.lock:
+                self.release(user_id)
+            raise
+        with self.lock:
+            self.release(user_id)
+            self.add(alert)
+        self.start()
+        return alert
+
+    def cancel(self, user_id: str, alert_id: str) -> Optional[Dict]:
+        """Withdraw an active alert of the user, None if there is none (or it already fired)"""
+        self.load()
+        with self.lock:
+            alert = self.alerts.get(alert_id)
+            if alert is None or alert["user_id"] != user_id:
+                return None
+            self.remove(alert_id)
+            self.index.remove(alert_id)
+
+        try:
+            self.get_storage().close_alerts([alert_id], "cancelled")
+        except Exception:
+            with self.lock:
+                self.add(alert)
+            raise
+        return alert
+
+    def active(self, user_id: str, market_id: Optional[str] = None) -> List[Dict]:
+        self.load()
+        with self.lock:
+            alerts = [self.alerts[alert_id] for alert_id in self.by_user.get(user_id, ())]
+        return sorted((alert for alert in alerts if market_id is None or alert["market_id"] == market_id),
+                      key=lambda alert: alert["created_at"])
+
+    def check(self, prices: Optional[Dict[str, float]] = None, now: Optional[float] = None) -> int:
+        """Fire every alert the current prices trigger, returns how many fired"""
+        self.load()
+        now = datetime.now().timestamp() if now is None else now
+        if prices is None:
+            with self.lock:
+                stock_ids = self.index.watched()
+            prices = self.get_storage().get_prices(stock_ids) if stock_ids else {}
+
+        with self.lock:
+            index = self.index
+            vector = index.prices(prices)
+            self.history.record(now, vector)
+            n = len(index.thresholds)
+            references = self.history.references(index.column[:n], index.window[:n], now)
+            fired = index.pop_fired(index.values(vector, references))
+            triggered_at = datetime.fromtimestamp(now).isoformat()
+            hits = []
+            for alert_id, group in fired:
+                alert = self.remove(alert_id)
+                price = float(vector[index.column[group]])
+                reference = float(references[group]) if alert["window_seconds"] else None
+                hits.append({**alert, "status": "triggered", "triggered_at": triggered_at, "price": price, "reference": reference,
+                             "change": (price / reference - 1) * 100 if reference else None})
+            self.closing += [hit["id"] for hit in hits]
+
+        for hit in hits:
+            self.deliver(hit)
+        self.write_closes()
+        return len(hits)
+
+    def write_closes(self):
+        with self.lock:
+            alert_ids, self.closing = self.closing, []
+        if not alert_ids:
+            return
+        try:
+            self.get_storage().close_alerts(alert_ids, "triggered")
+        except Exception:
+            with self.lock:
+                self.closing[:0] = alert_ids
+            raise
+
+    #====================================================#
+    # TICK WATCHER
+    #====================================================#
+    def start(self):
+        if self.watcher is None:
+            with self.lock:
+                if self.watcher is None and not self.closed:
+                    self.watcher = threading.Thread(target=self.run, name="alert-watcher", daemon=True)
+                    self.watcher.start()
+
+    def run(self):
+        while not self.closed:
+            try:
+                self.check()
+            except Exception:
+                logger.exception("alert check failed, retrying")
+            self.wake.wait(self.poll_seconds)
+
+    def close(self):
+        """Stop the watcher and write out the pending closes"""
+        self.closed = True
+        self.wake.set()
+        if self.watcher is not None:
+            self.watcher.join()
+        if self.closing:
+            self.write_closes()
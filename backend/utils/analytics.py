@@ -0,0 +1,189 @@
+import math
+import numpy as np
+from typing import Dict, List, Optional
+from constants.constants import INITIAL_CURRENCY, STATS_BUCKETS, STATS_WINDOWS
+
+FIELDS = ("count", "mean", "m2", "open", "peak", "trough", "max_drawdown")
+COUNT, MEAN, M2, OPEN, PEAK, TROUGH, MAX_DRAWDOWN = range(len(FIELDS))
+
+Summary = List[float]  # one value per FIELDS entry
+StockStats = Dict[str, Summary]  # window name -> summary
+
+
+#====================================================#
+# ROLLING STATISTICS PER STOCK (KEPT BY THE TICKER)
+#====================================================#
+class Window:
+    """
+    One rolling window of every stock, as time-aligned buckets (stocks are
+    columns) that are cleared as they come round again. A bucket holds the
+    Welford count, mean and M2 of the per-second log returns of its ticks,
+    and the open, peak, trough and largest drawdown of its prices; buckets
+    merge in order into the window's summary, so nothing is kept per tick.
+    """
+
+    def __init__(self, n: int, seconds: Optional[float], buckets: int = STATS_BUCKETS):
+        self.seconds = seconds
+        self.buckets = buckets if seconds else 1
+        self.width = seconds / buckets if seconds else math.inf
+        self.current = 0  # number of the newest bucket since the epoch
+        self.data = np.empty((self.buckets, len(FIELDS), n))
+        self.clear(slice(None))
+
+    def clear(self, slots):
+        self.data[slots] = 0.0
+        self.data[slots, OPEN:TROUGH + 1] = np.nan
+
+    def advance(self, now: float):
+        number = int(now // self.width) if self.seconds else 0
+        if number > self.current:
+            stale = range(max(self.current + 1, number - self.buckets + 1), number + 1)
+            self.clear([bucket % self.buckets for bucket in stale])
+            self.current = number
+
+    def add(self, stocks: np.ndarray, old: np.ndarray, new: np.ndarray, returns: np.ndarray):
+        slot = self.data[self.current % self.buckets]
+        count, mean, m2, open_, peak, trough, drawdown = slot[:, stocks]
+        count += 1
+        delta = returns - mean
+        mean += delta / count
+        m2 += delta * (returns - mean)
+        open_ = np.where(np.isnan(open_), old, open_)
+        peak = np.fmax(peak, old)
+        drawdown = np.fmax(drawdown, 1 - new / peak)
+        slot[:, stocks] = count, mean, m2, open_, np.fmax(peak, new), np.fmin(np.fmin(trough, old), new), drawdown
+
+    def summary(self) -> np.ndarray:
+        """(fields, stocks) over the whole window, the buckets merged oldest first"""
+        order = [(self.current - age) % self.buckets for age in reversed(range(self.buckets))]
+        data = self.data[order]
+        counts, means = data[:, COUNT], data[:, MEAN]
+
+        count = counts.sum(axis=0)
+        mean = np.divide((counts * means).sum(axis=0), count, out=np.zeros_like(count), where=count > 0)
+        m2 = data[:, M2].sum(axis=0) + (counts * (means - mean) ** 2).sum(axis=0)  # Chan et al.
+        first = np.argmax(~np.isnan(data[:, OPEN]), axis=0)
+        open_ = data[first, OPEN, np.arange(data.shape[2])]
+        # a later bucket's trough against the peak of every bucket before it
+        peaks = np.fmax.accumulate(data[:, PEAK], axis=0)
+        with np.errstate(invalid="ignore"):
+            across = 1 - data[1:, TROUGH] / peaks[:-1]
+        drawdown = np.fmax(data[:, MAX_DRAWDOWN].max(axis=0), np.fmax.reduce(across, axis=0, initial=0.0))
+        return np.stack([count, mean, m2, open_, peaks[-1], np.fmin.reduce(data[:, TROUGH], axis=0), drawdown])
+
+    def restore(self, column: int, summary: Summary):
+        self.data[self.current % self.buckets, :, column] = summary
+
+
+class RollingStats:
+    """
+    Rolling return and drawdown statistics of every stock over each of
+    STATS_WINDOWS, parallel to the ticker's stock list. Each tick costs a
+    few vector operations per window whatever the window's length, and
+    `checkpoint` hands out the merged summaries of the stocks that moved
+    since the last one for the API to read.
+    """
+
+    def __init__(self, ids: List[str], windows: Dict[str, Optional[float]] = STATS_WINDOWS, buckets: int = STATS_BUCKETS):
+        self.ids = ids
+        self.buckets = buckets
+        self.windows = {name: Window(len(ids), seconds, buckets) for name, seconds in windows.items()}
+        self.dirty = np.zeros(len(ids), dtype=bool)
+
+    def add(self, stocks: np.ndarray, old: np.ndarray, new: np.ndarray, seconds: np.ndarray, now: float):
+        """One price move per stock (index), from old to new over `seconds`"""
+        if not len(stocks):
+            return
+        returns = np.log(new / old) / np.sqrt(seconds)
+        for window in self.windows.values():
+            window.advance(now)
+            window.add(stocks, old, new, returns)
+        self.dirty[stocks] = True
+
+    def checkpoint(self) -> Dict[str, StockStats]:
+        """Summaries of the stocks that moved since the last checkpoint, windows without a move left out"""
+        stocks = np.flatnonzero(self.dirty)
+        summaries = {name: window.summary()[:, stocks].T.tolist() for name, window in self.windows.items()}
+        stats = {}
+        for k, i in enumerate(stocks.tolist()):
+            stats[self.ids[i]] = {name: rows[k] for name, rows in summaries.items() if rows[k][COUNT] > 0}
+        return stats
+
+    def restore(self, stats: Dict[str, StockStats], now: float):
+        """
+        Load checkpointed summaries into the newest bucket of their window, a
+        restarted ticker then keeps them for up to one window longer than the
+        moves they summarize
+        """
+        position = {stock_id: i for i, stock_id in enumerate(self.ids)}
+        for window in self.windows.values():
+            window.advance(now)
+        for stock_id, windows in stats.items():
+            if stock_id in position:
+                for name, summary in windows.items():
+                    if name in self.windows:
+                        self.windows[name].restore(position[stock_id], summary)
+
+    def reindex(self, ids: List[str]) -> "RollingStats":
+        """The same statistics over a new stock list, stocks no longer listed are dropped"""
+        if ids == self.ids:
+            return self
+        stats = RollingStats(ids, {name: window.seconds for name, window in self.windows.items()}, self.buckets)
+        position = {stock_id: i for i, stock_id in enumerate(self.ids)}
+        pairs = [(i, position[stock_id]) for i, stock_id in enumerate(ids) if stock_id in position]
+        for name, window in stats.windows.items():
+            window.current = self.windows[name].current
+            if pairs:
+                new, old = np.array(pairs, dtype=np.intp).T
+                window.data[:, :, new] = self.windows[name].data[:, :, old]
+        if pairs:
+            stats.dirty[new] = self.dirty[old]
+        return stats
+
+
+#====================================================#
+# PORTFOLIO FIGURES (POSITIONS x STOCK STATISTICS)
+#====================================================#
+def portfolio(cash: float, positions: Dict[str, List[float]], prices: Dict[str, float], stats: Dict[str, StockStats],
+              realized_pnl: float, windows: List[str] = list(STATS_WINDOWS), initial: float = INITIAL_CURRENCY) -> Dict:
+    """
+    A user's figures in one market from their positions (stock_id -> [shares,
+    cost basis]) and the stocks' window summaries, every window at once:
+    the return of the current holdings since the window opened, their hourly
+    volatility (stock moves taken as independent, as the ticker draws them
+    unless STOCKS_CORRELATION is set), the drawdown from the value they
+    would have at every stock's window peak, and the value-weighted largest
+    drawdown of the stocks. Stocks without statistics count as flat.
+    """
+    stock_ids = list(positions)
+    shares, cost = np.array([positions[stock_id] for stock_id in stock_ids], dtype=np.float64).reshape(-1, 2).T
+    price = np.array([prices.get(stock_id, 0.0) for stock_id in stock_ids], dtype=np.float64)
+
+    flat = [0.0, 0.0, 0.0]
+    table = np.array([[stats.get(stock_id, {}).get(name) or flat + [p, p, p, 0.0] for stock_id, p in zip(stock_ids, price.tolist())]
+                      for name in windows], dtype=np.float64).reshape(len(windows), len(stock_ids), len(FIELDS)).transpose(0, 2, 1)
+
+    value = shares * price
+    holdings = float(value.sum())
+    weights = value / holdings if holdings > 0 else np.zeros_like(value)
+    count = table[:, COUNT]
+    variance = np.divide(table[:, M2], count - 1, out=np.zeros_like(count), where=count > 1)
+    at_open, at_peak = np.einsum("s,wfs->fw", shares, table[:, [OPEN, PEAK]])
+    volatility = np.sqrt(np.einsum("s,ws->w", weights ** 2, variance) * 3600)
+    returns = np.divide(holdings - at_open, at_open, out=np.zeros_like(at_open), where=at_open > 0)
+    drawdown = np.divide(at_peak - holdings, at_peak, out=np.zeros_like(at_peak), where=at_peak > 0)
+    max_drawdown = table[:, MAX_DRAWDOWN] @ weights
+
+    net_worth = cash + holdings
+    unrealized_pnl = holdings - float(cost.sum())
+    return {
+        "net_worth": net_worth,
+        "cash": cash,
+        "holdings": holdings,
+        "realized_pnl": realized_pnl,
+        "unrealized_pnl": unrealized_pnl,
+        "pnl": realized_pnl + unrealized_pnl,
+        "return": (net_worth - initial) / initial,
+        "windows": {name: {"return": r, "volatility": v, "drawdown": d, "max_drawdown": m}
+                    for name, r, v, d, m in zip(windows, returns.tolist(), volatility.tolist(), drawdown.tolist(), max_drawdown.tolist())},
+    }
@@ -0,0 +1,183 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from constants.constants import COMMENT_BUFFER_MARKETS, COMMENT_BUFFER_SIZE, COMMENT_BUFFER_TTL
+
+SUBSCRIBER_QUEUE_SIZE = 100  # slow subscribers are dropped once this many comments back up
+KEEPALIVE_SECONDS = 15
+
+
+Cursor = Tuple[str, str]  # (created_at, comment_id), comments are ordered by both
+
+
+def key(comment: Dict) -> Cursor:
+    return comment["created_at"], comment["comment_id"]
+
+
+def cursor(comment: Dict) -> str:
+    """The `before` value of the page after this comment"""
+    return "|".join(key(comment))
+
+
+def parse_cursor(before: str) -> Cursor:
+    """
+    The (created_at, comment_id) of a client's `before`, checked since it
+    ends up in storage filters: an ISO datetime and a canonical UUID
+    """
+    # a bare created_at (an older client) has an empty id, which sorts before every other
+    created_at, _, comment_id = before.partition("|")
+    try:
+        datetime.fromisoformat(created_at)
+        if comment_id and str(uuid.UUID(comment_id)) != comment_id:
+            raise ValueError(comment_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid comments cursor")
+    return created_at, comment_id
+
+
+#====================================================#
+# PER-MARKET RING BUFFER
+#====================================================#
+class CommentBuffer:
+    """
+    Most recent comments of one market (oldest -> newest) and its live
+    subscribers. Comments are published to the buffers of the process that
+    posted them, so a buffer is read again from storage once it is
+    COMMENT_BUFFER_TTL seconds old and comments posted through another API
+    process show up within that; their live delivery assumes one process.
+    """
+
+    def __init__(self):
+        self.recent = deque(maxlen=COMMENT_BUFFER_SIZE)
+        self.read_at: Optional[float] = None  # monotonic time of the last database read, None before the first
+        self.complete = False  # recent holds the market's entire history
+        self.subscribers: Dict[asyncio.Queue, asyncio.AbstractEventLoop] = {}
+        self.lock = threading.Lock()
+
+    def fresh(self) -> bool:
+        return self.read_at is not None and time.monotonic() - self.read_at < COMMENT_BUFFER_TTL
+
+
+# least recently used first, markets without subscribers are evicted past COMMENT_BUFFER_MARKETS
+buffers: "OrderedDict[str, CommentBuffer]" = OrderedDict()
+buffers_lock = threading.Lock()
+
+
+def get_buffer(market_id: str) -> CommentBuffer:
+    with buffers_lock:
+        return _buffer(market_id)
+
+
+def _buffer(market_id: str) -> CommentBuffer:
+    buffer = buffers.get(market_id)
+    if buffer is None:
+        evict()
+        buffer = buffers[market_id] = CommentBuffer()
+    buffers.move_to_end(market_id)
+    return buffer
+
+
+def evict():
+    """Make room for one more buffer, dropping the least recently used nobody streams from (buffers_lock held)"""
+    excess = len(buffers) + 1 - COMMENT_BUFFER_MARKETS
+    for market_id in list(buffers):
+        if excess <= 0:
+            break
+        # subscribers are only added under buffers_lock, so an idle buffer stays idle here
+        if not buffers[market_id].subscribers:
+            del buffers[market_id]
+            excess -= 1
+
+
+def seed(market_id: str, comments: List[Dict], complete: bool, read_at: float):
+    """
+    Fill the buffer from a newest-first database page read at `read_at`
+    (time.monotonic, taken before the read), keeping anything published
+    meanwhile
+    """
+    buffer = get_buffer(market_id)
+    with buffer.lock:
+        merged = {comment["comment_id"]: comment for comment in buffer.recent}
+        merged.update((comment["comment_id"], comment) for comment in comments)
+
+        ordered = sorted(merged.values(), key=key)
+        buffer.recent.clear()
+        buffer.recent.extend(ordered)
+        buffer.complete = complete and len(ordered) <= COMMENT_BUFFER_SIZE
+        buffer.read_at = max(buffer.read_at or read_at, read_at)
+
+
+def page(market_id: str, before: Optional[str], limit: int) -> Optional[Tuple[List[Dict], Optional[str]]]:
+    """Serve a newest-first page from memory, or None if the buffer cannot answer it"""
+    buffer = get_buffer(market_id)
+    bound = parse_cursor(before) if before is not None else None
+    with buffer.lock:
+        if not buffer.fresh():
+            return None
+        matching = [comment for comment in reversed(buffer.recent)
+                    if bound is None or key(comment) < bound]
+        complete = buffer.complete
+
+    if len(matching) < limit and not complete:
+        return None
+
+    comments = matching[:limit]
+    has_more = len(matching) > limit or not complete
+    next_cursor = cursor(comments[-1]) if comments and has_more else None
+    return comments, next_cursor
+
+
+#====================================================#
+# LIVE DELIVERY
+#====================================================#
+def _deliver(buffer: CommentBuffer, queue: asyncio.Queue, comment: Dict):
+    try:
+        queue.put_nowait(comment)
+    except asyncio.QueueFull:
+        # the subscriber drains its backlog and then ends at its next keepalive check
+        with buffer.lock:
+            buffer.subscribers.pop(queue, None)
+
+
+def publish(market_id: str, comment: Dict):
+    """Append a new comment to the buffer and push it to every subscriber (thread safe)"""
+    buffer = get_buffer(market_id)
+    with buffer.lock:
+        if len(buffer.recent) == buffer.recent.maxlen:
+            buffer.complete = False
+        buffer.recent.append(comment)
+        subscribers = list(buffer.subscribers.items())
+
+    for queue, loop in subscribers:
+        try:
+            loop.call_soon_threadsafe(_deliver, buffer, queue, comment)
+        except RuntimeError:  # the subscriber's loop has been closed
+            with buffer.lock:
+                buffer.subscribers.pop(queue, None)
+
+
+async def subscribe(market_id: str) -> AsyncIterator[Optional[Dict]]:
+    """Yield comments as they are posted; yields None every KEEPALIVE_SECONDS while idle"""
+    queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    with buffers_lock:
+        buffer = _buffer(market_id)
+        with buffer.lock:
+            buffer.subscribers[queue] = asyncio.get_running_loop()
+
+    try:
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                with buffer.lock:
+                    if queue not in buffer.subscribers:
+                        return
+                yield None
+    finally:
+        with buffer.lock:
+            buffer.subscribers.pop(queue, None)
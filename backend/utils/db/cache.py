@@ -0,0 +1,163 @@
+import functools
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Union
+from constants.constants import CACHE_TTLS, STALE_SECONDS
+from utils import metrics, upstream
+
+MAX_ENTRIES = 10000  # expired entries are swept once a cache grows past this
+
+Ttl = Union[float, Callable[[float], float]]  # seconds, or now -> expiry time
+
+
+def get_ttl(name: str) -> float:
+    """TTL of a named cache, CACHE_TTL_<NAME> in the environment overrides constants"""
+    override = os.getenv(f"CACHE_TTL_{name.upper()}")
+    return float(override) if override is not None else float(CACHE_TTLS.get(name, 0))
+
+
+caches: Dict[str, "SingleFlightCache"] = {}  # every cache by name, for stats()
+
+
+class _Call:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+#====================================================#
+# SINGLE-FLIGHT MICRO-CACHE
+#====================================================#
+class SingleFlightCache:
+    """
+    Caches fetch results per key for a short TTL. While a key is being
+    fetched, other callers for the same key wait for that result (or error)
+    instead of issuing their own upstream call. A TTL of 0 only coalesces.
+    While the upstream's breaker is open, an entry that expired less than
+    STALE_SECONDS ago is served instead of the error.
+    """
+
+    def __init__(self, name: str, ttl: Ttl):
+        self.name = name
+        self.ttl = ttl
+        self.entries: Dict[Hashable, tuple] = {}  # key -> (expires_at, value)
+        self.inflight: Dict[Hashable, _Call] = {}
+        # bumped by invalidate so a fetch started before a write does not store its result: per key
+        # while the key is in flight, for the whole cache when everything is dropped
+        self.generations: Dict[Hashable, int] = {}
+        self.epoch = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale = 0
+        caches[name] = self
+
+    def expires_at(self, now: float) -> float:
+        return self.ttl(now) if callable(self.ttl) else now + self.ttl
+
+    def get(self, key: Hashable, fetch: Callable[[], Any]) -> Any:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.time():
+                self.hits += 1
+                return entry[1]
+
+            call = self.inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self.inflight[key] = _Call()
+                generation = (self.epoch, self.generations.get(key, 0))
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        stale = False
+        try:
+            call.value = fetch()
+        except upstream.Unavailable as e:
+            with self.lock:
+                entry = self.entries.get(key)
+            if entry is None or entry[0] + STALE_SECONDS < time.time():
+                call.error = e
+                raise
+            call.value, stale = entry[1], True
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+                current = (self.epoch, self.generations.pop(key, 0))
+                self.stale += stale
+                if call.error is None and not stale and generation == current:
+                    now = time.time()
+                    expires_at = self.expires_at(now)
+                    if expires_at > now:
+                        if len(self.entries) >= MAX_ENTRIES:
+                            self.sweep(now)
+                        self.entries[key] = (expires_at, call.value)
+            call.event.set()
+        return call.value
+
+    def sweep(self, now: float):
+        for key in [key for key, (expires_at, _) in self.entries.items() if expires_at <= now]:
+            del self.entries[key]
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Drop one key, or everything when key is None"""
+        with self.lock:
+            if key is None:
+                self.epoch += 1
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+                if key in self.inflight:
+                    self.generations[key] = self.generations.get(key, 0) + 1
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced, "stale": self.stale, "size": len(self.entries)}
+
+
+def cached(name: str, ttl: Optional[Ttl] = None):
+    """Wrap a read function in a named SingleFlightCache keyed by its arguments"""
+
+    def decorator(func):
+        cache = SingleFlightCache(name, ttl if ttl is not None else get_ttl(name))
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = args + tuple(sorted(kwargs.items()))
+            return cache.get(key, lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+def collect_metrics():
+    lines = []
+    for field, kind in (("hits", "counter"), ("misses", "counter"), ("coalesced", "counter"), ("stale", "counter"), ("size", "gauge")):
+        name = f"read_cache_{field}" + ("_total" if kind == "counter" else "")
+        lines += [f"# HELP {name} Read cache {field} per cache", f"# TYPE {name} {kind}"]
+        lines += [f'{name}{{cache="{cache}"}} {values[field]}' for cache, values in stats().items()]
+    return lines
+
+
+metrics.register_collector(collect_metrics)
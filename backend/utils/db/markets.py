@@ -1,260 +1,462 @@
-import os
-import supabase
 from models.classes import Market, Stock, StockMarket, StockPrice,  Comment, ExploreMarket, DashboardMarket
 from datetime import datetime, timedelta
 from fastapi import HTTPException
-from constants.constants import DEFAULT_STOCK_PRICE, INITIAL_CURRENCY
-import numpy as np
+from constants.constants import DEFAULT_STOCK_PRICE, INITIAL_CURRENCY, COMMENT_BUFFER_SIZE, COMMENT_PAGE_SIZE
+from utils import alerts, analytics, comments, leaderboard, ledger, orders, responses, snapshots
+from utils.db.cache import cached
+from utils.db.storage import get_storage
 from collections import defaultdict
+import logging
 import random
-from typing import List
+import threading
+import time
+from typing import Dict, Hashable, List, Optional, Set, Tuple
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_PRIVATE_KEY")
-supabase_client = supabase.create_client(SUPABASE_URL, SUPABASE_KEY)
+logger = logging.getLogger(__name__)
+
+
+#====================================================#
+# RESPONSE VERSIONS (ETAGS OF THE READS BELOW)
+#====================================================#
+# bumped by every write that changes a read, so a read's ETag is known without running it
+versions: Dict[Hashable, int] = defaultdict(int)
+versions_lock = threading.Lock()
+
+
+def bump(*keys: Hashable):
+    with versions_lock:
+        for key in keys:
+            versions[key] += 1
+
+
+def markets_etag(user_id: str) -> str:
+    """Explore list: any new market, or this user joining one"""
+    return responses.etag("markets", versions.get("markets"), versions.get(("markets", user_id)))
+
+
+def joined_etag(user_id: str) -> str:
+    """Joined list: this user joining a market, or a fill changing their free currency"""
+    return responses.etag("joined", versions.get(("joined", user_id)))
+
+
+def market_etag(public: snapshots.PublicSnapshot, overlay: Dict, *variant) -> str:
+    """Stock market: the last tick of its snapshot and the user's last fill (ledger seq), per range and media type"""
+    return responses.etag("market", public.version, overlay.get("seq"), *variant)
 
 
 #====================================================#
 # CREATE STOCK MARKET
 #====================================================#
 def create(market_data: Market, user_id: str):
-    try:
-        market_response = supabase_client.table("markets").insert({
-            "market_name": market_data.market_name,
-        }).execute()
-
-        if not market_response.data or len(market_response.data) == 0:
-            raise Exception("Failed to create market")
-
-        market_id = market_response.data[0]["id"]
-
-        supabase_client.table("owned_markets").insert({
-            "user_id": user_id,
-            "market_id": market_id
-        }).execute()
-
-        for integration in market_data.integrations:
-            supabase_client.table("integrations").insert({
-                "market_id": market_id,
-                "service": integration.service,
-                "community_id": integration.community.id
-            }).execute()
-
-        for stock in market_data.stocks:
-            supabase_client.table("stocks").insert({
-                "market_id": market_id,
-                "ticker": stock.ticker,
-                "names": stock.names,
-                "price": DEFAULT_STOCK_PRICE  # Default price as specified
-            }).execute()
+    get_storage().create_market(
+        market_data.market_name,
+        user_id,
+        [(integration.service, integration.community.id) for integration in market_data.integrations],
+        [(stock.ticker, stock.names, DEFAULT_STOCK_PRICE) for stock in market_data.stocks],
+    )
 
-    except Exception as e:
-        supabase_client.table("markets").delete().eq("id", market_id).execute()
-        raise e
+    get_all_markets.cache.invalidate()
+    bump("markets")
 
 
 #====================================================#
 # GET ALL MARKETS
 #====================================================#
+@cached("get_all_markets")
 def get_all_markets(user_id: str):
-    markets = supabase_client.rpc(
-        "get_all_markets_with_status",
-        {"p_user_id": user_id}
-    ).execute().data
+    markets = get_storage().list_markets_with_status(user_id)
 
     return markets
 
 #====================================================#
 # GET JOINED MARKETS
 #====================================================#
+@cached("get_joined_markets")
 def get_joined_markets(user_id: str):
-    markets = supabase_client.rpc(
-        "get_user_joined_markets",
-        {"p_user_id": user_id}
-    ).execute().data
+    markets = get_storage().list_joined_markets(user_id)
     return markets
 
 #====================================================#
 # USER JOINS A MARKET - need to get currency (not const)
 #====================================================#
 def user_join(user_id: str, market_id: str):
-    supabase_client.table("joined_markets").insert({
-        "user_id": user_id,
-        "market_id": market_id,
-        "free_currency": INITIAL_CURRENCY
-    }).execute()
+    get_storage().join_market(user_id, market_id, INITIAL_CURRENCY)
+
+    get_all_markets.cache.invalidate((user_id,))
+    bump(("markets", user_id))
+    invalidate_user_market(user_id, market_id)
+    leaderboard.update(user_id, market_id, 0, INITIAL_CURRENCY, {})
 
 
 #====================================================#
 # GET FULL STOCK MARKET
 #====================================================#
+@cached("get_stock_market")
 def get_stock_market(user_id: str, market_id: str):
-    result = supabase_client.rpc(
-        "get_stock_market_details",
-        {"p_user_id": user_id, "p_market_id": market_id}
-    ).execute().data
-    return result
+    public = get_public_market(user_id, market_id)
+    return snapshots.merge(public.market, get_market_overlay(user_id, market_id))
+
+
+def get_public_market(user_id: str, market_id: str) -> snapshots.PublicSnapshot:
+    """Price data of a market, fetched once per tick no matter how many users are watching"""
+
+    def fetch():
+        # any member's view carries the same public part, the user's fields are stripped off
+        result = get_storage().market_details(user_id, market_id)
+
+        # comments are served by the comment stream, not duplicated into every stock
+        for stock in (result or {}).get("stocks") or []:
+            stock.pop("comments", None)
+
+        return result
+
+    return snapshots.get_public(market_id, fetch)
+
+
+def get_market_overlay(user_id: str, market_id: str) -> Dict:
+    """The user's own fields of a market: free currency and shares per stock, straight from the ledger"""
+    account = trade_ledger.account(user_id, market_id)
+
+    # seq first: should a fill land meanwhile, the fields are newer than the seq, never older
+    return {
+        "seq": account.seq if account else None,
+        "free_currency": account.free_currency if account else None,
+        "shares": account.shares() if account else {},
+    }
+
+def invalidate_user_market(user_id: str, market_id: str):
+    """Drop the user's cached reads after a write to their balance or holdings"""
+    get_joined_markets.cache.invalidate((user_id,))
+    get_stock_market.cache.invalidate((user_id, market_id))
+    bump(("joined", user_id))
+
+
+# balances and positions are the ledger's, the rows it writes back are re-read once they land
+trade_ledger = ledger.Ledger(get_storage, on_flush=invalidate_user_market, on_trade=leaderboard.update)
+
 
 #====================================================#
 # BUY STOCK
 #====================================================#
 def buy_stock(user_id: str, stock_id: str, shares: float):
+    return trade(user_id, stock_id, "buy", shares)
+
+
+#====================================================#
+# SELL STOCK
+#====================================================#
+def sell_stock(user_id: str, stock_id: str, shares: float):
+    return trade(user_id, stock_id, "sell", shares)
+
+
+def order_impact(side: str, shares: float) -> Tuple[float, float]:
+    """Change an order makes to its stock's (mu, sigma) activity terms"""
+    # buying pushes the drift up and selling down, both add volatility
+    mu_factor = 100
+    sigma_factor = 1000
+
+    mu_update = (shares if side == "buy" else -shares) * (1 / mu_factor)
+    sigma_update = shares * (1 / sigma_factor)
+    return mu_update, sigma_update
+
 
-    stock_data = supabase_client.table("stocks").select("price, market_id").eq("id", stock_id).execute().data
+def trade(user_id: str, stock_id: str, side: str, shares: float) -> Dict:
+    """Fill a market order at the current price, recorded in the trade ledger"""
+    storage = get_storage()
+
+    stock_data = storage.get_stock(stock_id)
 
     if not stock_data:
         raise HTTPException(status_code=404, detail="Stock not found")
 
-    stock_price = float(stock_data[0]["price"])
-    market_id = stock_data[0]["market_id"]
+    stock_price = float(stock_data["price"])
+    market_id = stock_data["market_id"]
 
+    try:
+        fill = trade_ledger.record(user_id, market_id, stock_id, side, shares, stock_price)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    total_cost = stock_price * shares
+    invalidate_user_market(user_id, market_id)
 
+    add_impacts([fill])
 
-    market_data = supabase_client.table("joined_markets").select("free_currency").eq("user_id", user_id).eq("market_id", market_id).execute().data
-    if not market_data:
-        raise HTTPException(status_code=400, detail="User has not joined this market")
+    return fill
 
 
-    free_currency = float(market_data[0]["free_currency"])
-    new_free_currency = free_currency - total_cost
-    supabase_client.table("joined_markets").update({"free_currency": new_free_currency}).eq("user_id", user_id).eq("market_id", market_id).execute()
+def add_impacts(fills: List[Dict]):
+    """Add the fills' impact to their stocks' params, one write for all of them"""
+    impact: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0.0])
+    for fill in fills:
+        mu_update, sigma_update = order_impact(fill["side"], fill["shares"])
+        impact[fill["stock_id"]][0] += mu_update
+        impact[fill["stock_id"]][1] += sigma_update
+    if impact:
+        get_storage().add_params({stock_id: tuple(terms) for stock_id, terms in impact.items()})
 
-    user_stock_data = supabase_client.table("profiles_stocks").select("id, shares").eq("profile_id", user_id).eq("stock_id", stock_id).execute().data
 
-    if user_stock_data:
-        existing_shares = float(user_stock_data[0]["shares"])
-        new_shares = existing_shares + shares
-        supabase_client.table("profiles_stocks").update({"shares": new_shares}).eq("id", user_stock_data[0]["id"]).execute()
-    else:
-        supabase_client.table("profiles_stocks").insert({
-            "profile_id": user_id,
-            "shares": shares,
-            "stock_id": stock_id,
-            "market_id": market_id
-        }).execute()
+#====================================================#
+# BATCH ORDER (MANY LEGS IN ONE MARKET, ALL OR NONE)
+#====================================================#
+def batch_trade(user_id: str, market_id: str, legs: List[Tuple[str, str, float]]) -> List[Dict]:
+    """Fill (stock_id, side, shares) legs at the current prices in one ledger step"""
+    stocks = get_storage().get_stocks(list({stock_id for stock_id, _, _ in legs}))
 
+    for i, (stock_id, _, _) in enumerate(legs):
+        stock_data = stocks.get(stock_id)
+        if not stock_data:
+            raise HTTPException(status_code=404, detail=f"Leg {i + 1}: Stock not found")
+        if stock_data["market_id"] != market_id:
+            raise HTTPException(status_code=400, detail=f"Leg {i + 1}: Stock is not in this market")
 
+    try:
+        fills = trade_ledger.record_many(user_id, market_id, [(stock_id, side, shares, float(stocks[stock_id]["price"]))
+                                                              for stock_id, side, shares in legs])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    params_data = supabase_client.table("stocks_params").select("mu_term, sigma_term").eq("stock_id", stock_id).execute().data
+    invalidate_user_market(user_id, market_id)
 
-    mu_factor = 100
-    sigma_factor = 1000
+    add_impacts(fills)
+
+    return fills
+
+
+#====================================================#
+# LIMIT AND STOP ORDERS (REST UNTIL A TICK TRIGGERS THEM)
+#====================================================#
+def place_order(user_id: str, stock_id: str, side: str, kind: str, shares: float, price: float) -> Dict:
+    stock_data = get_storage().get_stock(stock_id)
+
+    if not stock_data:
+        raise HTTPException(status_code=404, detail="Stock not found")
+
+    market_id = stock_data["market_id"]
+    # checked against the account now at the order's price, and again when it fills
+    try:
+        trade_ledger.check(user_id, market_id, [(stock_id, side, shares, price)], numbered=False)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return order_book.place(user_id, market_id, stock_id, side, kind, shares, price)
+
+
+def cancel_order(user_id: str, order_id: str) -> Dict:
+    order = order_book.cancel(user_id, order_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
+
+def list_orders(user_id: str, market_id: str) -> List[Dict]:
+    return order_book.open_orders(user_id, market_id)
 
-    mu_update = shares * (1 / mu_factor)
-    sigma_update = shares * (1 / sigma_factor)
 
-    prev_mu = params_data[0]["mu_term"] if params_data else 0
-    prev_sigma = params_data[0]["sigma_term"] if params_data else 0
+def fill_triggered(fired: List[Dict], prices: Dict[str, float]) -> Set[str]:
+    """Fill the orders a tick triggered at that tick's price, returns the ids the ledger rejected"""
+    rejected = set()
+    fills = []
 
-    new_mu = prev_mu + mu_update
-    new_sigma = prev_sigma + sigma_update
+    for order in fired:
+        try:
+            fills.append(trade_ledger.record(order["user_id"], order["market_id"], order["stock_id"], order["side"],
+                                             order["shares"], prices[order["stock_id"]]))
+        except ValueError as e:
+            # the account no longer covers it, e.g. shares sold or cash spent while the order rested
+            logger.warning("order %s rejected: %s", order["id"], e)
+            rejected.add(order["id"])
+            continue
 
-    if params_data:
-        supabase_client.table("stocks_params").update({
-            "mu_term": new_mu,
-            "sigma_term": new_sigma
-        }).eq("stock_id", stock_id).execute()
+        invalidate_user_market(order["user_id"], order["market_id"])
 
-    else:
-        supabase_client.table("stocks_params").insert({
-            "mu_term": new_mu,
-            "sigma_term": new_sigma,
-            "stock_id": stock_id
-        }).execute()
+    # the fills are in the ledger, a failed params update must not put the orders back
+    try:
+        add_impacts(fills)
+    except Exception:
+        logger.exception("adding the impact of %d triggered fills failed", len(fills))
+
+    return rejected
 
 
+order_book = orders.OrderBook(get_storage, fill_triggered)
 
 
 #====================================================#
-# SELL STOCK
+# PRICE ALERTS (FIRE ONCE, PUSHED TO THEIR USER)
 #====================================================#
-def sell_stock(user_id: str, stock_id: str, shares: float):
-
-    stock_data = supabase_client.table("stocks").select("price, market_id").eq("id", stock_id).execute().data
+def place_alert(user_id: str, stock_id: str, kind: str, threshold: float, window: Optional[int] = None) -> Dict:
+    stock_data = get_storage().get_stock(stock_id)
 
     if not stock_data:
         raise HTTPException(status_code=404, detail="Stock not found")
+    if trade_ledger.account(user_id, stock_data["market_id"]) is None:
+        raise HTTPException(status_code=400, detail="User has not joined this market")
 
-    stock_price = float(stock_data[0]["price"])
-    market_id = stock_data[0]["market_id"]
+    try:
+        return alert_engine.place(user_id, stock_data["market_id"], stock_id, kind, threshold, window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    user_stock_data = supabase_client.table("profiles_stocks").select("id, shares").eq("profile_id", user_id).eq("stock_id", stock_id).execute().data
 
-    if not user_stock_data:
-        raise HTTPException(status_code=400, detail="You don't own any shares of this stock")
+def cancel_alert(user_id: str, alert_id: str) -> Dict:
+    alert = alert_engine.cancel(user_id, alert_id)
+    if alert is None:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    return alert
 
-    existing_shares = float(user_stock_data[0]["shares"])
 
-    total_sale = stock_price * shares
+def list_alerts(user_id: str, market_id: Optional[str] = None) -> Dict:
+    """The user's active alerts and latest hits"""
+    return {"alerts": alert_engine.active(user_id, market_id),
+            "triggered": [hit for hit in alerts.recent(user_id) if market_id is None or hit["market_id"] == market_id]}
 
-    market_data = supabase_client.table("joined_markets").select("free_currency").eq("user_id", user_id).eq("market_id", market_id).execute().data
-    if not market_data:
-        raise HTTPException(status_code=400, detail="User has not joined this market")
 
-    free_currency = float(market_data[0]["free_currency"])
-    new_free_currency = free_currency + total_sale
-    supabase_client.table("joined_markets").update({"free_currency": new_free_currency}).eq("user_id", user_id).eq("market_id", market_id).execute()
+alert_engine = alerts.AlertEngine(get_storage, alerts.publish)
 
 
-    new_shares = existing_shares - shares
-    if new_shares > 0:
-        supabase_client.table("profiles_stocks").update({"shares": new_shares}).eq("id", user_stock_data[0]["id"]).execute()
-    else:
-        supabase_client.table("profiles_stocks").delete().eq("id", user_stock_data[0]["id"]).execute()
+#====================================================#
+# PORTFOLIO ANALYTICS (POSITIONS x ROLLING STOCK STATISTICS)
+#====================================================#
+@cached("get_market_stats")
+def get_market_stats(market_id: str, stock_ids: Tuple[str, ...]) -> Dict[str, analytics.StockStats]:
+    return get_storage().get_stock_stats(list(stock_ids))
 
 
+def get_portfolio_analytics(user_id: str, market_id: str) -> Dict:
+    account = trade_ledger.account(user_id, market_id)
+    if account is None:
+        raise HTTPException(status_code=400, detail="User has not joined this market")
 
-    params_data = supabase_client.table("stocks_params").select("mu_term, sigma_term").eq("stock_id", stock_id).execute().data
+    public = get_public_market(user_id, market_id)
+    if public.market is None:
+        raise HTTPException(status_code=404, detail="Market not found")
 
-    mu_factor = 100
-    sigma_factor = 1000
+    prices = {stock["stock_id"]: float(stock["price"]) for stock in public.market.get("stocks") or []}
+    # fills apply under the ledger lock, read a consistent copy of the account
+    with trade_ledger.lock:
+        cash, realized_pnl = account.free_currency, account.realized_pnl
+        positions = {stock_id: list(position) for stock_id, position in account.positions.items()}
 
-    mu_update = -shares * (1 / mu_factor)
-    sigma_update = shares * (1 / sigma_factor)
+    stats = get_market_stats(market_id, tuple(sorted(prices)))
+    return {"market_id": market_id, **analytics.portfolio(cash, positions, prices, stats, realized_pnl)}
 
-    prev_mu = params_data[0]["mu_term"] if params_data else 0
-    prev_sigma = params_data[0]["sigma_term"] if params_data else 0
 
-    new_mu = prev_mu + mu_update
-    new_sigma = prev_sigma + sigma_update
 
-    if params_data:
-        supabase_client.table("stocks_params").update({
-            "mu_term": new_mu,
-            "sigma_term": new_sigma
-        }).eq("stock_id", stock_id).execute()
 
-    else:
-        supabase_client.table("stocks_params").insert({
-            "mu_term": new_mu,
-            "sigma_term": new_sigma,
-            "stock_id": stock_id
-        }).execute()
+#====================================================#
+# LEADERBOARD (NET WORTH = CASH + SHARES x PRICE)
+#====================================================#
+def get_leaderboard(user_id: str, market_id: str, limit: int = 10):
+    public = get_public_market(user_id, market_id)
+    if public.market is None:
+        raise HTTPException(status_code=404, detail="Market not found")
 
+    prices = {stock["stock_id"]: float(stock["price"]) for stock in public.market.get("stocks") or []}
+    board = leaderboard.get_board(market_id) or build_leaderboard(market_id, prices)
+    board.ready.wait()
 
+    # a new public snapshot means a new tick, mark everyone to it once
+    if board.priced_at is not public:
+        board.revalue(prices, public)
 
-    # add back new_mu and new_sigma to the table
+    top = board.top(limit)
+    emails = get_user_emails([player for _, player, _ in top])
+    standing = board.standing(user_id)
 
+    return {
+        "leaderboard": [{"rank": rank, "user_email": emails.get(player, ""), "net_worth": net_worth}
+                        for rank, player, net_worth in top],
+        "me": {"rank": standing[0], "net_worth": standing[1]} if standing else None,
+    }
 
 
+def build_leaderboard(market_id: str, prices: Dict[str, float]) -> leaderboard.MarketBoard:
+    """Register the market's board first so no fill is missed, then load every member into it"""
+    fresh = leaderboard.MarketBoard(prices)
+    board = leaderboard.add_board(market_id, fresh)
+    if board is not fresh:
+        return board  # another request is building it
+
+    try:
+        # fills that land meanwhile carry a newer seq than these rows and win
+        in_memory = trade_ledger.states(market_id)
+        for player, (free_currency, shares) in get_storage().list_accounts(market_id).items():
+            if player not in in_memory:
+                board.update(player, -1, free_currency, shares)
+        for player, (seq, free_currency, shares) in in_memory.items():
+            board.update(player, seq, free_currency, shares)
+    except Exception:
+        leaderboard.drop_board(market_id)
+        raise
+    finally:
+        board.ready.set()
+    return board
+
 
 #====================================================#
 # POST NEW COMMENT
 #====================================================#
-def post_comment(user_id: str, market_id: str, message: str):
-
-    comment_response = supabase_client.table("comments").insert({
-        "user_id": user_id,
-        "market_id": market_id,
-        "message": message,
-    }).execute()
+def post_comment(user_id: str, market_id: str, message: str, user_email: Optional[str] = None):
 
-    if not comment_response.data or len(comment_response.data) == 0:
+    try:
+        row = get_storage().insert_comment(user_id, market_id, message)
+    except Exception as e:
+        print(e)
         raise HTTPException(status_code=400, detail="Failed to post chat")
 
-    return comment_response.data[0]
+    if user_email is None:
+        user_email = get_user_emails([user_id]).get(user_id, "")
+
+    comment = to_comment(row, user_email)
+    comments.publish(market_id, comment)
+
+    return comment
+
+
+#====================================================#
+# GET COMMENTS (NEWEST FIRST, CURSOR = created_at|comment_id)
+#====================================================#
+def get_comments(market_id: str, before: Optional[str] = None, limit: int = COMMENT_PAGE_SIZE):
+
+    cached = comments.page(market_id, before, limit)
+    if cached is not None:
+        page, next_cursor = cached
+        return {"comments": page, "next_cursor": next_cursor}
+
+    # a miss on the first page reads enough to fill the ring buffer
+    fetch_count = max(limit, COMMENT_BUFFER_SIZE) if before is None else limit
+
+    read_at = time.monotonic()
+    rows = get_storage().list_comments(market_id, comments.parse_cursor(before) if before is not None else None, fetch_count + 1)
+
+    has_more = len(rows) > fetch_count
+    rows = rows[:fetch_count]
+
+    emails = get_user_emails([row["user_id"] for row in rows])
+    fetched = [to_comment(row, emails.get(row["user_id"], "")) for row in rows]
+
+    if before is None:
+        comments.seed(market_id, fetched, complete=not has_more, read_at=read_at)
+
+    page = fetched[:limit]
+    next_cursor = comments.cursor(page[-1]) if page and (has_more or len(fetched) > limit) else None
+    return {"comments": page, "next_cursor": next_cursor}
+
+
+def get_user_emails(user_ids: List[str]) -> Dict[str, str]:
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return {}
+    return get_storage().get_emails(user_ids)
+
+
+def to_comment(row: Dict, user_email: str) -> Dict:
+    return {
+        "comment_id": str(row["id"]),
+        "created_at": row["created_at"],
+        "user_email": user_email,
+        "message": row["message"],
+    }
 
 
 
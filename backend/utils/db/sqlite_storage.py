@@ -0,0 +1,520 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from functools import wraps
+from typing import Dict, List, Optional, Tuple
+from utils import metrics
+from utils.db.storage import AsyncStorage, Params, PricePoint, SentimentSums, Storage
+
+RANGE_SECONDS = {"h_prices": 3600, "d_prices": 86400, "m_prices": 30 * 86400, "max_prices": None}
+MAX_POINTS = 1000  # every range is downsampled to about this many points, like the RPC
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS markets (
+    id TEXT PRIMARY KEY, created_at TEXT NOT NULL, market_name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS owned_markets (
+    user_id TEXT NOT NULL, market_id TEXT NOT NULL REFERENCES markets(id) ON DELETE CASCADE,
+    PRIMARY KEY (user_id, market_id)
+);
+CREATE TABLE IF NOT EXISTS joined_markets (
+    user_id TEXT NOT NULL, market_id TEXT NOT NULL REFERENCES markets(id) ON DELETE CASCADE,
+    free_currency REAL NOT NULL, PRIMARY KEY (user_id, market_id)
+);
+CREATE TABLE IF NOT EXISTS integrations (
+    id TEXT PRIMARY KEY, market_id TEXT NOT NULL REFERENCES markets(id) ON DELETE CASCADE,
+    service TEXT NOT NULL, community_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stocks (
+    id TEXT PRIMARY KEY, market_id TEXT NOT NULL REFERENCES markets(id) ON DELETE CASCADE,
+    ticker TEXT NOT NULL, names TEXT NOT NULL, price REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stocks_market ON stocks(market_id);
+CREATE TABLE IF NOT EXISTS stocks_params (
+    stock_id TEXT PRIMARY KEY REFERENCES stocks(id) ON DELETE CASCADE, mu_term REAL NOT NULL, sigma_term REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stock_prices (
+    stock_id TEXT NOT NULL REFERENCES stocks(id) ON DELETE CASCADE, ts REAL NOT NULL, timestamp TEXT NOT NULL, price REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stock_prices_stock_ts ON stock_prices(stock_id, ts);
+CREATE TABLE IF NOT EXISTS profiles_stocks (
+    profile_id TEXT NOT NULL, stock_id TEXT NOT NULL REFERENCES stocks(id) ON DELETE CASCADE,
+    market_id TEXT NOT NULL, shares REAL NOT NULL, PRIMARY KEY (profile_id, stock_id)
+);
+CREATE TABLE IF NOT EXISTS profiles (
+    id TEXT PRIMARY KEY, email TEXT NOT NULL UNIQUE, created_at TEXT, avatar_url TEXT
+);
+CREATE TABLE IF NOT EXISTS comments (
+    id TEXT PRIMARY KEY, created_at TEXT NOT NULL, user_id TEXT NOT NULL,
+    market_id TEXT NOT NULL REFERENCES markets(id) ON DELETE CASCADE, message TEXT NOT NULL
+);
+DROP INDEX IF EXISTS comments_market_created;
+CREATE INDEX IF NOT EXISTS comments_market_cursor ON comments(market_id, created_at, id);
+CREATE TABLE IF NOT EXISTS trades (
+    id TEXT PRIMARY KEY, created_at TEXT NOT NULL, user_id TEXT NOT NULL, market_id TEXT NOT NULL,
+    stock_id TEXT NOT NULL, side TEXT NOT NULL CHECK (side IN ('buy', 'sell')), shares REAL NOT NULL, price REAL NOT NULL,
+    seq INTEGER NOT NULL, UNIQUE (user_id, market_id, seq)
+);
+CREATE TABLE IF NOT EXISTS account_snapshots (
+    user_id TEXT NOT NULL, market_id TEXT NOT NULL, seq INTEGER NOT NULL, created_at TEXT NOT NULL,
+    free_currency REAL NOT NULL, positions TEXT NOT NULL, realized_pnl REAL NOT NULL, volume REAL NOT NULL,
+    PRIMARY KEY (user_id, market_id, seq)
+);
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY, created_at TEXT NOT NULL, user_id TEXT NOT NULL, market_id TEXT NOT NULL,
+    stock_id TEXT NOT NULL REFERENCES stocks(id) ON DELETE CASCADE, side TEXT NOT NULL CHECK (side IN ('buy', 'sell')),
+    kind TEXT NOT NULL CHECK (kind IN ('limit', 'stop')), shares REAL NOT NULL, price REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'open', closed_at TEXT
+);
+CREATE INDEX IF NOT EXISTS orders_open ON orders(status) WHERE status = 'open';
+CREATE TABLE IF NOT EXISTS alerts (
+    id TEXT PRIMARY KEY, created_at TEXT NOT NULL, user_id TEXT NOT NULL, market_id TEXT NOT NULL,
+    stock_id TEXT NOT NULL REFERENCES stocks(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL CHECK (kind IN ('above', 'below', 'rise', 'drop')), threshold REAL NOT NULL, window_seconds INTEGER,
+    status TEXT NOT NULL DEFAULT 'active', closed_at TEXT
+);
+CREATE INDEX IF NOT EXISTS alerts_active ON alerts(status) WHERE status = 'active';
+CREATE TABLE IF NOT EXISTS market_activity (
+    market_id TEXT PRIMARY KEY REFERENCES markets(id) ON DELETE CASCADE, viewers INTEGER NOT NULL, updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stock_stats (
+    stock_id TEXT PRIMARY KEY REFERENCES stocks(id) ON DELETE CASCADE, stats TEXT NOT NULL, updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sentiment_state (
+    stock_id TEXT PRIMARY KEY REFERENCES stocks(id) ON DELETE CASCADE, weight REAL NOT NULL, polarity_sum REAL NOT NULL,
+    square_sum REAL NOT NULL, updated_at TEXT NOT NULL
+);
+"""
+
+
+def timed(op: str):
+    """Record a storage call under the same upstream metrics as the Supabase backend"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.upstream("sqlite", op):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def new_id() -> str:
+    return str(uuid.uuid4())
+
+
+def now() -> str:
+    return datetime.now().isoformat()
+
+
+#====================================================#
+# API BACKEND (EMBEDDED, NO NETWORK HOP)
+#====================================================#
+class SqliteStorage(Storage):
+    """
+    One connection per thread (the API's threadpool and the workers' executor
+    each reuse theirs), WAL so readers never wait on the ticker's writes, and
+    sqlite3's statement cache keeps every query below prepared.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        self.connection()  # create the schema up front
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, cached_statements=256)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(SCHEMA)
+            self.local.conn = conn
+        return conn
+
+    def query(self, sql: str, params: tuple = ()) -> List[Dict]:
+        return [dict(row) for row in self.connection().execute(sql, params).fetchall()]
+
+    def query_in(self, sql: str, values: List[str]) -> List[Dict]:
+        """Run sql with its `IN ({})` filled with values, in chunks under SQLite's variable limit"""
+        values = list(values)
+        rows = []
+        for start in range(0, len(values), 500):
+            chunk = values[start:start + 500]
+            rows += self.query(sql.format(",".join("?" * len(chunk))), tuple(chunk))
+        return rows
+
+    # markets
+    @timed("markets.create")
+    def create_market(self, market_name: str, owner_id: str, integrations: List[Tuple[str, str]],
+                      stocks: List[Tuple[str, List[str], float]]) -> str:
+        market_id = new_id()
+        with self.connection() as conn:
+            conn.execute("INSERT INTO markets (id, created_at, market_name) VALUES (?, ?, ?)", (market_id, now(), market_name))
+            conn.execute("INSERT INTO owned_markets (user_id, market_id) VALUES (?, ?)", (owner_id, market_id))
+            conn.executemany("INSERT INTO integrations (id, market_id, service, community_id) VALUES (?, ?, ?, ?)",
+                             [(new_id(), market_id, service, community_id) for service, community_id in integrations])
+            conn.executemany("INSERT INTO stocks (id, market_id, ticker, names, price) VALUES (?, ?, ?, ?, ?)",
+                             [(new_id(), market_id, ticker, json.dumps(names), price) for ticker, names, price in stocks])
+        return market_id
+
+    @timed("markets.with_status")
+    def list_markets_with_status(self, user_id: str) -> List[Dict]:
+        return self.query("""
+            SELECT m.id AS market_id, m.market_name,
+                   CASE WHEN o.user_id IS NOT NULL THEN 'owned' WHEN j.user_id IS NOT NULL THEN 'joined' ELSE 'none' END AS status
+            FROM markets m
+            LEFT JOIN owned_markets o ON o.market_id = m.id AND o.user_id = ?
+            LEFT JOIN joined_markets j ON j.market_id = m.id AND j.user_id = ?
+        """, (user_id, user_id))
+
+    @timed("markets.joined")
+    def list_joined_markets(self, user_id: str) -> List[Dict]:
+        return self.query("""
+            SELECT j.market_id, m.market_name, j.free_currency
+            FROM joined_markets j JOIN markets m ON m.id = j.market_id
+            WHERE j.user_id = ?
+        """, (user_id,))
+
+    @timed("joined_markets.insert")
+    def join_market(self, user_id: str, market_id: str, free_currency: float):
+        with self.connection() as conn:
+            conn.execute("INSERT INTO joined_markets (user_id, market_id, free_currency) VALUES (?, ?, ?)",
+                         (user_id, market_id, free_currency))
+
+    @timed("markets.details")
+    def market_details(self, user_id: str, market_id: str) -> Optional[Dict]:
+        conn = self.connection()
+        market = conn.execute("SELECT id, market_name FROM markets WHERE id = ?", (market_id,)).fetchone()
+        if market is None:
+            return None
+
+        free_currency = self.get_balance(user_id, market_id)
+        positions = self.list_positions(user_id, market_id)
+
+        stocks = []
+        for stock in conn.execute("SELECT id, ticker, price FROM stocks WHERE market_id = ? ORDER BY rowid", (market_id,)):
+            entry = {"stock_id": stock["id"], "ticker": stock["ticker"], "price": stock["price"],
+                     "shares": positions.get(stock["id"], 0)}
+            first, last = conn.execute("SELECT MIN(ts), MAX(ts) FROM stock_prices WHERE stock_id = ?", (stock["id"],)).fetchone()
+            for key, seconds in RANGE_SECONDS.items():
+                entry[key] = self.price_range(conn, stock["id"], max(first, last - seconds) if seconds else first, last) if last is not None else []
+            stocks.append(entry)
+
+        return {"market_name": market["market_name"], "market_id": market["id"],
+                "free_currency": free_currency, "stocks": stocks}
+
+    def price_range(self, conn: sqlite3.Connection, stock_id: str, start: float, end: float) -> List[Dict]:
+        """
+        Points of a stock between start and end, downsampled to the first
+        point of each of MAX_POINTS equal time buckets: one index seek per
+        bucket, so a range costs the same however long its history is
+        """
+        width = (end - start) / MAX_POINTS or 1.0
+        rows = conn.execute("""
+            WITH RECURSIVE buckets(t) AS (SELECT ? UNION ALL SELECT t + ? FROM buckets WHERE t + ? <= ?)
+            SELECT price, timestamp FROM stock_prices WHERE rowid IN (
+                SELECT (SELECT rowid FROM stock_prices WHERE stock_id = ? AND ts >= t ORDER BY ts LIMIT 1) FROM buckets
+            ) ORDER BY ts
+        """, (start, width, width, end, stock_id)).fetchall()
+        return [{"price": row[0], "timestamp": row[1]} for row in rows]
+
+    # stocks
+    @timed("stocks.select")
+    def get_stock(self, stock_id: str) -> Optional[Dict]:
+        rows = self.query("SELECT price, market_id FROM stocks WHERE id = ?", (stock_id,))
+        return rows[0] if rows else None
+
+    @timed("stocks.select")
+    def get_stocks(self, stock_ids: List[str]) -> Dict[str, Dict]:
+        return {row.pop("id"): row for row in self.query_in("SELECT id, price, market_id FROM stocks WHERE id IN ({})", stock_ids)}
+
+    @timed("stocks.select")
+    def get_prices(self, stock_ids: List[str]) -> Dict[str, float]:
+        return {row["id"]: float(row["price"]) for row in self.query_in("SELECT id, price FROM stocks WHERE id IN ({})", stock_ids)}
+
+    # balances and positions
+    @timed("joined_markets.select")
+    def get_balance(self, user_id: str, market_id: str) -> Optional[float]:
+        row = self.connection().execute("SELECT free_currency FROM joined_markets WHERE user_id = ? AND market_id = ?",
+                                        (user_id, market_id)).fetchone()
+        return float(row[0]) if row else None
+
+    @timed("joined_markets.update")
+    def set_balance(self, user_id: str, market_id: str, free_currency: float):
+        with self.connection() as conn:
+            conn.execute("UPDATE joined_markets SET free_currency = ? WHERE user_id = ? AND market_id = ?",
+                         (free_currency, user_id, market_id))
+
+    @timed("profiles_stocks.select")
+    def get_position(self, user_id: str, stock_id: str) -> Optional[float]:
+        row = self.connection().execute("SELECT shares FROM profiles_stocks WHERE profile_id = ? AND stock_id = ?",
+                                        (user_id, stock_id)).fetchone()
+        return float(row[0]) if row else None
+
+    @timed("profiles_stocks.upsert")
+    def set_position(self, user_id: str, stock_id: str, market_id: str, shares: float):
+        with self.connection() as conn:
+            if shares > 0:
+                conn.execute("""
+                    INSERT INTO profiles_stocks (profile_id, stock_id, market_id, shares) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (profile_id, stock_id) DO UPDATE SET shares = excluded.shares
+                """, (user_id, stock_id, market_id, shares))
+            else:
+                conn.execute("DELETE FROM profiles_stocks WHERE profile_id = ? AND stock_id = ?", (user_id, stock_id))
+
+    @timed("profiles_stocks.select")
+    def list_positions(self, user_id: str, market_id: str) -> Dict[str, float]:
+        rows = self.connection().execute("SELECT stock_id, shares FROM profiles_stocks WHERE profile_id = ? AND market_id = ?",
+                                         (user_id, market_id)).fetchall()
+        return {row[0]: float(row[1]) for row in rows}
+
+    @timed("markets.accounts")
+    def list_accounts(self, market_id: str) -> Dict[str, Tuple[float, Dict[str, float]]]:
+        conn = self.connection()
+        accounts = {row[0]: (float(row[1]), {}) for row in
+                    conn.execute("SELECT user_id, free_currency FROM joined_markets WHERE market_id = ?", (market_id,))}
+        for profile_id, stock_id, shares in conn.execute("SELECT profile_id, stock_id, shares FROM profiles_stocks WHERE market_id = ?", (market_id,)):
+            if profile_id in accounts:
+                accounts[profile_id][1][stock_id] = float(shares)
+        return accounts
+
+    # trade ledger
+    @timed("trades.insert")
+    def append_trades(self, trades: List[Dict]):
+        with self.connection() as conn:
+            conn.executemany("""
+                INSERT INTO trades (id, created_at, user_id, market_id, stock_id, side, shares, price, seq)
+                VALUES (:id, :created_at, :user_id, :market_id, :stock_id, :side, :shares, :price, :seq)
+            """, trades)
+
+    @timed("trades.select")
+    def list_trades(self, user_id: str, market_id: str, after_seq: int = 0) -> List[Dict]:
+        return self.query("SELECT * FROM trades WHERE user_id = ? AND market_id = ? AND seq > ? ORDER BY seq",
+                          (user_id, market_id, after_seq))
+
+    @timed("account_snapshots.select")
+    def latest_snapshot(self, user_id: str, market_id: str) -> Optional[Dict]:
+        rows = self.query("SELECT * FROM account_snapshots WHERE user_id = ? AND market_id = ? ORDER BY seq DESC LIMIT 1",
+                          (user_id, market_id))
+        if not rows:
+            return None
+        rows[0]["positions"] = json.loads(rows[0]["positions"])
+        return rows[0]
+
+    @timed("account_snapshots.insert")
+    def save_snapshots(self, snapshots: List[Dict]):
+        with self.connection() as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO account_snapshots (user_id, market_id, seq, created_at, free_currency, positions, realized_pnl, volume)
+                VALUES (:user_id, :market_id, :seq, :created_at, :free_currency, :positions, :realized_pnl, :volume)
+            """, [{**snapshot, "positions": json.dumps(snapshot["positions"])} for snapshot in snapshots])
+
+    # params
+    @timed("stocks_params.select")
+    def get_params(self, stock_id: str) -> Optional[Params]:
+        row = self.connection().execute("SELECT mu_term, sigma_term FROM stocks_params WHERE stock_id = ?", (stock_id,)).fetchone()
+        return (float(row[0]), float(row[1])) if row else None
+
+    def set_params(self, stock_id: str, mu_term: float, sigma_term: float):
+        self.set_params_batch({stock_id: (mu_term, sigma_term)})
+
+    @timed("stocks_params.upsert")
+    def add_params(self, deltas: Dict[str, Params]):
+        with self.connection() as conn:
+            conn.executemany("""
+                INSERT INTO stocks_params (stock_id, mu_term, sigma_term) VALUES (?, ?, ?)
+                ON CONFLICT (stock_id) DO UPDATE SET mu_term = mu_term + excluded.mu_term, sigma_term = sigma_term + excluded.sigma_term
+            """, [(stock_id, mu, sigma) for stock_id, (mu, sigma) in deltas.items()])
+
+    @timed("stocks_params.upsert")
+    def set_params_batch(self, params: Dict[str, Params]):
+        with self.connection() as conn:
+            conn.executemany("""
+                INSERT INTO stocks_params (stock_id, mu_term, sigma_term) VALUES (?, ?, ?)
+                ON CONFLICT (stock_id) DO UPDATE SET mu_term = excluded.mu_term, sigma_term = excluded.sigma_term
+            """, [(stock_id, mu, sigma) for stock_id, (mu, sigma) in params.items()])
+
+    # rolling price statistics
+    @timed("stock_stats.select")
+    def get_stock_stats(self, stock_ids: List[str]) -> Dict[str, Dict[str, List[float]]]:
+        return {row["stock_id"]: json.loads(row["stats"])
+                for row in self.query_in("SELECT stock_id, stats FROM stock_stats WHERE stock_id IN ({})", stock_ids)}
+
+    # resting orders
+    @timed("orders.insert")
+    def insert_order(self, order: Dict):
+        with self.connection() as conn:
+            conn.execute("""
+                INSERT INTO orders (id, created_at, user_id, market_id, stock_id, side, kind, shares, price, status)
+                VALUES (:id, :created_at, :user_id, :market_id, :stock_id, :side, :kind, :shares, :price, :status)
+            """, order)
+
+    @timed("orders.update")
+    def close_orders(self, order_ids: List[str], status: str):
+        closed_at = now()
+        with self.connection() as conn:
+            conn.executemany("UPDATE orders SET status = ?, closed_at = ? WHERE id = ? AND status = 'open'",
+                             [(status, closed_at, order_id) for order_id in order_ids])
+
+    @timed("orders.select")
+    def list_open_orders(self) -> List[Dict]:
+        return self.query("SELECT * FROM orders WHERE status = 'open'")
+
+    # price alerts
+    @timed("alerts.insert")
+    def insert_alert(self, alert: Dict):
+        with self.connection() as conn:
+            conn.execute("""
+                INSERT INTO alerts (id, created_at, user_id, market_id, stock_id, kind, threshold, window_seconds, status)
+                VALUES (:id, :created_at, :user_id, :market_id, :stock_id, :kind, :threshold, :window_seconds, :status)
+            """, alert)
+
+    @timed("alerts.update")
+    def close_alerts(self, alert_ids: List[str], status: str):
+        closed_at = now()
+        with self.connection() as conn:
+            conn.executemany("UPDATE alerts SET status = ?, closed_at = ? WHERE id = ? AND status = 'active'",
+                             [(status, closed_at, alert_id) for alert_id in alert_ids])
+
+    @timed("alerts.select")
+    def list_active_alerts(self) -> List[Dict]:
+        return self.query("SELECT * FROM alerts WHERE status = 'active'")
+
+    # activity
+    @timed("market_activity.upsert")
+    def set_market_activity(self, market_id: str, viewers: int, updated_at: str):
+        with self.connection() as conn:
+            conn.execute("""
+                INSERT INTO market_activity (market_id, viewers, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (market_id) DO UPDATE SET viewers = excluded.viewers, updated_at = excluded.updated_at
+            """, (market_id, viewers, updated_at))
+
+    # comments
+    @timed("comments.insert")
+    def insert_comment(self, user_id: str, market_id: str, message: str) -> Dict:
+        row = {"id": new_id(), "created_at": now(), "user_id": user_id, "market_id": market_id, "message": message}
+        with self.connection() as conn:
+            conn.execute("INSERT INTO comments (id, created_at, user_id, market_id, message) VALUES (:id, :created_at, :user_id, :market_id, :message)", row)
+        return row
+
+    @timed("comments.select")
+    def list_comments(self, market_id: str, before: Optional[Tuple[str, str]], limit: int) -> List[Dict]:
+        if before is None:
+            return self.query("SELECT id, created_at, user_id, message FROM comments WHERE market_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+                              (market_id, limit))
+        return self.query("SELECT id, created_at, user_id, message FROM comments WHERE market_id = ? AND (created_at, id) < (?, ?) "
+                          "ORDER BY created_at DESC, id DESC LIMIT ?", (market_id, *before, limit))
+
+    # profiles
+    @timed("profiles.select")
+    def get_profile(self, user_id: str) -> Optional[Dict]:
+        rows = self.query("SELECT * FROM profiles WHERE id = ?", (user_id,))
+        return rows[0] if rows else None
+
+    @timed("profiles.select")
+    def profile_exists(self, email: str) -> bool:
+        return self.connection().execute("SELECT 1 FROM profiles WHERE email = ?", (email,)).fetchone() is not None
+
+    @timed("profiles.insert")
+    def insert_profile(self, profile: Dict):
+        with self.connection() as conn:
+            conn.execute("INSERT INTO profiles (id, email, created_at, avatar_url) VALUES (?, ?, ?, ?)",
+                         (profile["id"], profile["email"], profile.get("created_at"), profile.get("avatar_url")))
+
+    @timed("profiles.select")
+    def get_emails(self, user_ids: List[str]) -> Dict[str, str]:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        placeholders = ",".join("?" * len(user_ids))
+        rows = self.connection().execute(f"SELECT id, email FROM profiles WHERE id IN ({placeholders})", user_ids).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    # bulk writes used by the workers
+    def save_sentiment_state(self, sums: Dict[str, SentimentSums], updated_at: str):
+        with self.connection() as conn:
+            conn.executemany("""
+                INSERT INTO sentiment_state (stock_id, weight, polarity_sum, square_sum, updated_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (stock_id) DO UPDATE SET weight = excluded.weight, polarity_sum = excluded.polarity_sum,
+                    square_sum = excluded.square_sum, updated_at = excluded.updated_at
+            """, [(stock_id, *stock_sums, updated_at) for stock_id, stock_sums in sums.items()])
+
+    def save_stock_stats(self, stats: Dict[str, Dict[str, List[float]]], updated_at: str):
+        with self.connection() as conn:
+            conn.executemany("""
+                INSERT INTO stock_stats (stock_id, stats, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (stock_id) DO UPDATE SET stats = excluded.stats, updated_at = excluded.updated_at
+            """, [(stock_id, json.dumps(windows), updated_at) for stock_id, windows in stats.items()])
+
+    def record_prices(self, points: List[PricePoint]):
+        with self.connection() as conn:
+            conn.executemany("INSERT INTO stock_prices (stock_id, ts, timestamp, price) VALUES (?, ?, ?, ?)",
+                             [(stock_id, datetime.fromisoformat(ts).timestamp(), ts, price) for stock_id, price, ts in points])
+            conn.executemany("UPDATE stocks SET price = ? WHERE id = ?", [(price, stock_id) for stock_id, price, _ in points])
+
+
+#====================================================#
+# WORKER BACKEND (SAME DATABASE, CALLS RUN OFF THE EVENT LOOP)
+#====================================================#
+class AsyncSqliteStorage(AsyncStorage):
+    def __init__(self, storage: SqliteStorage):
+        self.storage = storage
+
+    async def run(self, op: str, func, *args):
+        def call():
+            with metrics.upstream("sqlite", op):
+                return func(*args)
+        return await asyncio.to_thread(call)
+
+    async def list_markets(self) -> List[Dict]:
+        return await self.run("markets.select", self.storage.query, "SELECT * FROM markets")
+
+    async def list_integrations(self, service: str) -> List[Dict]:
+        return await self.run("integrations.select", self.storage.query, "SELECT * FROM integrations WHERE service = ?", (service,))
+
+    async def list_stocks(self) -> List[Dict]:
+        rows = await self.run("stocks.select", self.storage.query, "SELECT id, market_id, ticker, names, price FROM stocks")
+        for row in rows:
+            row["names"] = json.loads(row["names"])
+        return rows
+
+    async def list_params(self) -> Dict[str, Params]:
+        rows = await self.run("stocks_params.select", self.storage.query, "SELECT stock_id, mu_term, sigma_term FROM stocks_params")
+        return {row["stock_id"]: (row["mu_term"], row["sigma_term"]) for row in rows}
+
+    async def set_params_batch(self, params: Dict[str, Params]):
+        if params:
+            await self.run("stocks_params.upsert", self.storage.set_params_batch, params)
+
+    async def add_params(self, deltas: Dict[str, Params]):
+        if deltas:
+            await self.run("stocks_params.upsert", self.storage.add_params, deltas)
+
+    async def record_prices(self, points: List[PricePoint]):
+        if points:
+            await self.run("stock_prices.insert", self.storage.record_prices, points)
+
+    async def list_market_activity(self) -> Dict[str, Tuple[int, str]]:
+        rows = await self.run("market_activity.select", self.storage.query, "SELECT market_id, viewers, updated_at FROM market_activity")
+        return {row["market_id"]: (row["viewers"], row["updated_at"]) for row in rows}
+
+    async def load_sentiment_state(self) -> Dict[str, Tuple[SentimentSums, str]]:
+        rows = await self.run("sentiment_state.select", self.storage.query, "SELECT * FROM sentiment_state")
+        return {row["stock_id"]: ((row["weight"], row["polarity_sum"], row["square_sum"]), row["updated_at"]) for row in rows}
+
+    async def save_sentiment_state(self, sums: Dict[str, SentimentSums], updated_at: str):
+        if sums:
+            await self.run("sentiment_state.upsert", self.storage.save_sentiment_state, sums, updated_at)
+
+    async def load_stock_stats(self) -> Dict[str, Dict[str, List[float]]]:
+        rows = await self.run("stock_stats.select", self.storage.query, "SELECT stock_id, stats FROM stock_stats")
+        return {row["stock_id"]: json.loads(row["stats"]) for row in rows}
+
+    async def save_stock_stats(self, stats: Dict[str, Dict[str, List[float]]], updated_at: str):
+        if stats:
+            await self.run("stock_stats.upsert", self.storage.save_stock_stats, stats, updated_at)
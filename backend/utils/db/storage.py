@@ -0,0 +1,275 @@
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")  # supabase | sqlite
+SQLITE_PATH = os.getenv("SQLITE_PATH", "fanstocks.db")
+
+Params = Tuple[float, float]  # (mu_term, sigma_term)
+PricePoint = Tuple[str, float, str]  # (stock_id, price, iso timestamp)
+SentimentSums = Tuple[float, float, float]  # decayed (weight, polarity sum, squared polarity sum)
+
+
+#====================================================#
+# REPOSITORY INTERFACE USED BY THE API
+#====================================================#
+class Storage(ABC):
+    """Markets, stocks, prices, balances/positions, the trade ledger, params, comments and profiles"""
+
+    # markets
+    @abstractmethod
+    def create_market(self, market_name: str, owner_id: str, integrations: List[Tuple[str, str]],
+                      stocks: List[Tuple[str, List[str], float]]) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_markets_with_status(self, user_id: str) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_joined_markets(self, user_id: str) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def join_market(self, user_id: str, market_id: str, free_currency: float):
+        raise NotImplementedError
+
+    @abstractmethod
+    def market_details(self, user_id: str, market_id: str) -> Optional[Dict]:
+        """Same shape as the get_stock_market_details RPC"""
+        raise NotImplementedError
+
+    # stocks
+    @abstractmethod
+    def get_stock(self, stock_id: str) -> Optional[Dict]:
+        """{"price", "market_id"} of a stock"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_stocks(self, stock_ids: List[str]) -> Dict[str, Dict]:
+        """{"price", "market_id"} of each stock that exists, by id"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_prices(self, stock_ids: List[str]) -> Dict[str, float]:
+        """Current price of each stock"""
+        raise NotImplementedError
+
+    # balances and positions
+    @abstractmethod
+    def get_balance(self, user_id: str, market_id: str) -> Optional[float]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_balance(self, user_id: str, market_id: str, free_currency: float):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_position(self, user_id: str, stock_id: str) -> Optional[float]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_position(self, user_id: str, stock_id: str, market_id: str, shares: float):
+        """Create, update or (at zero shares) delete a position"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_positions(self, user_id: str, market_id: str) -> Dict[str, float]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_accounts(self, market_id: str) -> Dict[str, Tuple[float, Dict[str, float]]]:
+        """(free currency, shares per stock) of every member of a market"""
+        raise NotImplementedError
+
+    # trade ledger
+    @abstractmethod
+    def append_trades(self, trades: List[Dict]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_trades(self, user_id: str, market_id: str, after_seq: int = 0) -> List[Dict]:
+        """An account's trades after a sequence number, oldest first"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def latest_snapshot(self, user_id: str, market_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_snapshots(self, snapshots: List[Dict]):
+        raise NotImplementedError
+
+    # resting orders
+    @abstractmethod
+    def insert_order(self, order: Dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    def close_orders(self, order_ids: List[str], status: str):
+        """Mark open orders filled, cancelled or rejected"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_open_orders(self) -> List[Dict]:
+        raise NotImplementedError
+
+    # price alerts
+    @abstractmethod
+    def insert_alert(self, alert: Dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    def close_alerts(self, alert_ids: List[str], status: str):
+        """Mark active alerts triggered or cancelled"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_active_alerts(self) -> List[Dict]:
+        raise NotImplementedError
+
+    # params
+    @abstractmethod
+    def get_params(self, stock_id: str) -> Optional[Params]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_params(self, stock_id: str, mu_term: float, sigma_term: float):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_params(self, deltas: Dict[str, Params]):
+        """Add (mu, sigma) to each stock's params in one atomic write, missing params start at zero"""
+        raise NotImplementedError
+
+    # rolling price statistics
+    @abstractmethod
+    def get_stock_stats(self, stock_ids: List[str]) -> Dict[str, Dict[str, List[float]]]:
+        """stock_id -> window -> summary as of the ticker's last checkpoint, see utils/analytics.py"""
+        raise NotImplementedError
+
+    # activity
+    @abstractmethod
+    def set_market_activity(self, market_id: str, viewers: int, updated_at: str):
+        """Publish how many users are watching a market, the ticker paces the market by it"""
+        raise NotImplementedError
+
+    # comments
+    @abstractmethod
+    def insert_comment(self, user_id: str, market_id: str, message: str) -> Dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_comments(self, market_id: str, before: Optional[Tuple[str, str]], limit: int) -> List[Dict]:
+        """Newest first by (created_at, id), those before the `before` pair; rows of {id, created_at, user_id, message}"""
+        raise NotImplementedError
+
+    # profiles
+    @abstractmethod
+    def get_profile(self, user_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def profile_exists(self, email: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_profile(self, profile: Dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_emails(self, user_ids: List[str]) -> Dict[str, str]:
+        raise NotImplementedError
+
+
+#====================================================#
+# REPOSITORY INTERFACE USED BY THE REALTIME WORKERS
+#====================================================#
+class AsyncStorage(ABC):
+    @abstractmethod
+    async def list_markets(self) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_integrations(self, service: str) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_stocks(self) -> List[Dict]:
+        """Rows of {id, market_id, names, price}"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_params(self) -> Dict[str, Params]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_params_batch(self, params: Dict[str, Params]):
+        """Upsert mu/sigma terms for many stocks at once"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_params(self, deltas: Dict[str, Params]):
+        """Add to the mu/sigma terms of many stocks at once (missing rows start at 0), atomically per stock"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def record_prices(self, points: List[PricePoint]):
+        """Append each point to its stock's history, the latest point of a stock becomes its current price"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_market_activity(self) -> Dict[str, Tuple[int, str]]:
+        """market_id -> (viewers, updated_at) as last published by the API"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def load_sentiment_state(self) -> Dict[str, Tuple[SentimentSums, str]]:
+        """stock_id -> (sums, updated_at) as of the sentiment worker's last checkpoint"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save_sentiment_state(self, sums: Dict[str, SentimentSums], updated_at: str):
+        """Upsert a checkpoint of the sentiment worker's per-stock sums, as of updated_at"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def load_stock_stats(self) -> Dict[str, Dict[str, List[float]]]:
+        """stock_id -> window -> summary as of the ticker's last checkpoint"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save_stock_stats(self, stats: Dict[str, Dict[str, List[float]]], updated_at: str):
+        """Upsert the rolling statistics of the stocks that moved since the last checkpoint"""
+        raise NotImplementedError
+
+
+#====================================================#
+# BACKEND SELECTION
+#====================================================#
+_storage: Optional[Storage] = None
+
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "sqlite":
+            from utils.db.sqlite_storage import SqliteStorage
+            _storage = SqliteStorage(SQLITE_PATH)
+        else:
+            from utils.db.supabase_storage import SupabaseStorage
+            _storage = SupabaseStorage.from_env()
+    return _storage
+
+
+def set_storage(storage: Storage):
+    global _storage
+    _storage = storage
+
+
+async def create_async_storage() -> AsyncStorage:
+    if STORAGE_BACKEND == "sqlite":
+        from utils.db.sqlite_storage import AsyncSqliteStorage, SqliteStorage
+        return AsyncSqliteStorage(SqliteStorage(SQLITE_PATH))
+    from utils.db.supabase_storage import AsyncSupabaseStorage
+    return await AsyncSupabaseStorage.from_env()
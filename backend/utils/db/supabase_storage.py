@@ -0,0 +1,356 @@
+import os
+import asyncio
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from utils import upstream
+from utils.db.storage import AsyncStorage, Params, PricePoint, SentimentSums, Storage
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_client():
+    """
+    The process's Supabase client, shared by the storage backend and auth.
+    supabase pulls in most of httpx/httpcore/pydantic's extras, so both the
+    import and the client are deferred to first use (or the app's lifespan).
+    Its requests block, so they time out at the client, after the seconds
+    per attempt of the supabase upstream policy.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                from supabase import ClientOptions, create_client
+                options = ClientOptions(postgrest_client_timeout=upstream.policies["supabase"].timeout)
+                _client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_PRIVATE_KEY"), options=options)
+    return _client
+
+
+#====================================================#
+# API BACKEND (POSTGREST OVER HTTP)
+#====================================================#
+class SupabaseStorage(Storage):
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_env(cls) -> "SupabaseStorage":
+        return cls(get_client())
+
+    # markets
+    def create_market(self, market_name: str, owner_id: str, integrations: List[Tuple[str, str]],
+                      stocks: List[Tuple[str, List[str], float]]) -> str:
+        market_response = upstream.execute(self.client.table("markets").insert({"market_name": market_name}), "markets.insert")
+        if not market_response.data:
+            raise Exception("Failed to create market")
+
+        market_id = market_response.data[0]["id"]
+        try:
+            upstream.execute(self.client.table("owned_markets").insert({"user_id": owner_id, "market_id": market_id}), "owned_markets.insert")
+            if integrations:
+                upstream.execute(self.client.table("integrations").insert([
+                    {"market_id": market_id, "service": service, "community_id": community_id}
+                    for service, community_id in integrations
+                ]), "integrations.insert")
+            if stocks:
+                upstream.execute(self.client.table("stocks").insert([
+                    {"market_id": market_id, "ticker": ticker, "names": names, "price": price}
+                    for ticker, names, price in stocks
+                ]), "stocks.insert")
+        except Exception:
+            upstream.execute(self.client.table("markets").delete().eq("id", market_id), "markets.delete")
+            raise
+        return market_id
+
+    def list_markets_with_status(self, user_id: str) -> List[Dict]:
+        return upstream.execute(self.client.rpc("get_all_markets_with_status", {"p_user_id": user_id}), "rpc.get_all_markets_with_status").data
+
+    def list_joined_markets(self, user_id: str) -> List[Dict]:
+        return upstream.execute(self.client.rpc("get_user_joined_markets", {"p_user_id": user_id}), "rpc.get_user_joined_markets").data
+
+    def join_market(self, user_id: str, market_id: str, free_currency: float):
+        upstream.execute(self.client.table("joined_markets").insert({
+            "user_id": user_id,
+            "market_id": market_id,
+            "free_currency": free_currency
+        }), "joined_markets.insert")
+
+    def market_details(self, user_id: str, market_id: str) -> Optional[Dict]:
+        return upstream.execute(self.client.rpc(
+            "get_stock_market_details",
+            {"p_user_id": user_id, "p_market_id": market_id}
+        ), "rpc.get_stock_market_details").data
+
+    # stocks
+    def get_stock(self, stock_id: str) -> Optional[Dict]:
+        rows = upstream.execute(self.client.table("stocks").select("price, market_id").eq("id", stock_id), "stocks.select").data
+        return rows[0] if rows else None
+
+    def get_stocks(self, stock_ids: List[str]) -> Dict[str, Dict]:
+        rows = self.select_in("stocks", "id, price, market_id", "id", stock_ids)
+        return {row.pop("id"): row for row in rows}
+
+    def get_prices(self, stock_ids: List[str]) -> Dict[str, float]:
+        return {row["id"]: float(row["price"]) for row in self.select_in("stocks", "id, price", "id", stock_ids)}
+
+    def select_in(self, table: str, columns: str, column: str, values: List[str]) -> List[Dict]:
+        # values go in the query string, keep each request well under URL limits
+        values = list(values)
+        rows = []
+        for start in range(0, len(values), 100):
+            rows += upstream.execute(self.client.table(table).select(columns).in_(column, values[start:start + 100]), f"{table}.select").data
+        return rows
+
+    # balances and positions
+    def get_balance(self, user_id: str, market_id: str) -> Optional[float]:
+        rows = upstream.execute(self.client.table("joined_markets").select("free_currency").eq("user_id", user_id).eq("market_id", market_id), "joined_markets.select").data
+        return float(rows[0]["free_currency"]) if rows else None
+
+    def set_balance(self, user_id: str, market_id: str, free_currency: float):
+        upstream.execute(self.client.table("joined_markets").update({"free_currency": free_currency}).eq("user_id", user_id).eq("market_id", market_id), "joined_markets.update")
+
+    def get_position(self, user_id: str, stock_id: str) -> Optional[float]:
+        rows = upstream.execute(self.client.table("profiles_stocks").select("shares").eq("profile_id", user_id).eq("stock_id", stock_id), "profiles_stocks.select").data
+        return float(rows[0]["shares"]) if rows else None
+
+    def set_position(self, user_id: str, stock_id: str, market_id: str, shares: float):
+        rows = upstream.execute(self.client.table("profiles_stocks").select("id").eq("profile_id", user_id).eq("stock_id", stock_id), "profiles_stocks.select").data
+        if rows and shares > 0:
+            upstream.execute(self.client.table("profiles_stocks").update({"shares": shares}).eq("id", rows[0]["id"]), "profiles_stocks.update")
+        elif rows:
+            upstream.execute(self.client.table("profiles_stocks").delete().eq("id", rows[0]["id"]), "profiles_stocks.delete")
+        elif shares > 0:
+            upstream.execute(self.client.table("profiles_stocks").insert({
+                "profile_id": user_id,
+                "shares": shares,
+                "stock_id": stock_id,
+                "market_id": market_id
+            }), "profiles_stocks.insert")
+
+    def list_positions(self, user_id: str, market_id: str) -> Dict[str, float]:
+        rows = upstream.execute(self.client.table("profiles_stocks").select("stock_id, shares").eq("profile_id", user_id).eq("market_id", market_id), "profiles_stocks.select").data
+        return {row["stock_id"]: float(row["shares"]) for row in rows}
+
+    def list_accounts(self, market_id: str) -> Dict[str, Tuple[float, Dict[str, float]]]:
+        members = upstream.execute(self.client.table("joined_markets").select("user_id, free_currency").eq("market_id", market_id), "joined_markets.select").data
+        holdings = upstream.execute(self.client.table("profiles_stocks").select("profile_id, stock_id, shares").eq("market_id", market_id), "profiles_stocks.select").data
+        accounts = {row["user_id"]: (float(row["free_currency"]), {}) for row in members}
+        for row in holdings:
+            if row["profile_id"] in accounts:
+                accounts[row["profile_id"]][1][row["stock_id"]] = float(row["shares"])
+        return accounts
+
+    # trade ledger
+    def append_trades(self, trades: List[Dict]):
+        upstream.execute(self.client.table("trades").insert(trades), "trades.insert")
+
+    def list_trades(self, user_id: str, market_id: str, after_seq: int = 0) -> List[Dict]:
+        return upstream.execute(self.client.table("trades").select("*").eq("user_id", user_id).eq("market_id", market_id)
+                               .gt("seq", after_seq).order("seq"), "trades.select").data
+
+    def latest_snapshot(self, user_id: str, market_id: str) -> Optional[Dict]:
+        rows = upstream.execute(self.client.table("account_snapshots").select("*").eq("user_id", user_id).eq("market_id", market_id)
+                               .order("seq", desc=True).limit(1), "account_snapshots.select").data
+        return rows[0] if rows else None
+
+    def save_snapshots(self, snapshots: List[Dict]):
+        upstream.execute(self.client.table("account_snapshots").insert(snapshots), "account_snapshots.insert")
+
+    # params
+    def get_params(self, stock_id: str) -> Optional[Params]:
+        rows = upstream.execute(self.client.table("stocks_params").select("mu_term, sigma_term").eq("stock_id", stock_id), "stocks_params.select").data
+        return (float(rows[0]["mu_term"]), float(rows[0]["sigma_term"])) if rows else None
+
+    def set_params(self, stock_id: str, mu_term: float, sigma_term: float):
+        updated = upstream.execute(self.client.table("stocks_params").update({
+            "mu_term": mu_term,
+            "sigma_term": sigma_term
+        }).eq("stock_id", stock_id), "stocks_params.update").data
+        if not updated:
+            upstream.execute(self.client.table("stocks_params").insert({
+                "mu_term": mu_term,
+                "sigma_term": sigma_term,
+                "stock_id": stock_id
+            }), "stocks_params.insert")
+
+    def add_params(self, deltas: Dict[str, Params]):
+        # see sql/add_stock_params.sql, one call whatever the number of stocks
+        upstream.execute(self.client.rpc("add_stock_params", {
+            "p_params": [{"stock_id": stock_id, "mu_term": mu, "sigma_term": sigma} for stock_id, (mu, sigma) in deltas.items()]
+        }), "rpc.add_stock_params")
+
+    # rolling price statistics
+    def get_stock_stats(self, stock_ids: List[str]) -> Dict[str, Dict[str, List[float]]]:
+        return {row["stock_id"]: row["stats"] for row in self.select_in("stock_stats", "stock_id, stats", "stock_id", stock_ids)}
+
+    # resting orders
+    def insert_order(self, order: Dict):
+        upstream.execute(self.client.table("orders").insert(order), "orders.insert")
+
+    def close_orders(self, order_ids: List[str], status: str):
+        for start in range(0, len(order_ids), 100):
+            upstream.execute(self.client.table("orders").update({"status": status, "closed_at": datetime.now().isoformat()})
+                            .in_("id", order_ids[start:start + 100]).eq("status", "open"), "orders.update")
+
+    def list_open_orders(self) -> List[Dict]:
+        return upstream.execute(self.client.table("orders").select("*").eq("status", "open"), "orders.select").data
+
+    # price alerts
+    def insert_alert(self, alert: Dict):
+        upstream.execute(self.client.table("alerts").insert(alert), "alerts.insert")
+
+    def close_alerts(self, alert_ids: List[str], status: str):
+        for start in range(0, len(alert_ids), 100):
+            upstream.execute(self.client.table("alerts").update({"status": status, "closed_at": datetime.now().isoformat()})
+                            .in_("id", alert_ids[start:start + 100]).eq("status", "active"), "alerts.update")
+
+    def list_active_alerts(self) -> List[Dict]:
+        return upstream.execute(self.client.table("alerts").select("*").eq("status", "active"), "alerts.select").data
+
+    # activity
+    def set_market_activity(self, market_id: str, viewers: int, updated_at: str):
+        updated = upstream.execute(self.client.table("market_activity").update({
+            "viewers": viewers,
+            "updated_at": updated_at
+        }).eq("market_id", market_id), "market_activity.update").data
+        if not updated:
+            upstream.execute(self.client.table("market_activity").insert({
+                "market_id": market_id,
+                "viewers": viewers,
+                "updated_at": updated_at
+            }), "market_activity.insert")
+
+    # comments
+    def insert_comment(self, user_id: str, market_id: str, message: str) -> Dict:
+        rows = upstream.execute(self.client.table("comments").insert({
+            "user_id": user_id,
+            "market_id": market_id,
+            "message": message,
+        }), "comments.insert").data
+        if not rows:
+            raise Exception("Failed to post comment")
+        return rows[0]
+
+    def list_comments(self, market_id: str, before: Optional[Tuple[str, str]], limit: int) -> List[Dict]:
+        query = self.client.table("comments").select("id, created_at, user_id, message").eq("market_id", market_id)
+        if before is not None:
+            created_at, comment_id = before
+            # a bare timestamp cursor (no id) only bounds created_at
+            query = (query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{comment_id})') if comment_id
+                     else query.lt("created_at", created_at))
+        return upstream.execute(query.order("created_at", desc=True).order("id", desc=True).limit(limit), "comments.select").data
+
+    # profiles
+    def get_profile(self, user_id: str) -> Optional[Dict]:
+        rows = upstream.execute(self.client.table("profiles").select("*").eq("id", user_id), "profiles.select").data
+        return rows[0] if rows else None
+
+    def profile_exists(self, email: str) -> bool:
+        return bool(upstream.execute(self.client.table("profiles").select("email").eq("email", email), "profiles.select").data)
+
+    def insert_profile(self, profile: Dict):
+        upstream.execute(self.client.table("profiles").insert(profile), "profiles.insert")
+
+    def get_emails(self, user_ids: List[str]) -> Dict[str, str]:
+        if not user_ids:
+            return {}
+        rows = upstream.execute(self.client.table("profiles").select("id, email").in_("id", list(user_ids)), "profiles.select").data
+        return {row["id"]: row["email"] for row in rows}
+
+
+#====================================================#
+# WORKER BACKEND (ASYNC CLIENT, WRITES FANNED OUT CONCURRENTLY)
+#====================================================#
+class AsyncSupabaseStorage(AsyncStorage):
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    async def from_env(cls) -> "AsyncSupabaseStorage":
+        from supabase import acreate_client
+        return cls(await acreate_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_PRIVATE_KEY")))
+
+    async def list_markets(self) -> List[Dict]:
+        return (await upstream.execute_async(self.client.table("markets").select("*"), "markets.select")).data
+
+    async def list_integrations(self, service: str) -> List[Dict]:
+        return (await upstream.execute_async(self.client.table("integrations").select("*").eq("service", service), "integrations.select")).data
+
+    async def list_stocks(self) -> List[Dict]:
+        return (await upstream.execute_async(self.client.table("stocks").select("*"), "stocks.select")).data
+
+    async def list_params(self) -> Dict[str, Params]:
+        rows = (await upstream.execute_async(self.client.table("stocks_params").select("*"), "stocks_params.select")).data
+        return {row["stock_id"]: (float(row.get("mu_term") or 0), float(row.get("sigma_term") or 0)) for row in rows}
+
+    async def set_params_batch(self, params: Dict[str, Params]):
+        if not params:
+            return
+        existing = (await upstream.execute_async(
+            self.client.table("stocks_params").select("stock_id").in_("stock_id", list(params)), "stocks_params.select")).data
+        existing = {row["stock_id"] for row in existing}
+
+        tasks = [upstream.execute_async(
+            self.client.table("stocks_params").update({"mu_term": mu, "sigma_term": sigma}).eq("stock_id", stock_id),
+            "stocks_params.update"
+        ) for stock_id, (mu, sigma) in params.items() if stock_id in existing]
+
+        missing = [{"stock_id": stock_id, "mu_term": mu, "sigma_term": sigma}
+                   for stock_id, (mu, sigma) in params.items() if stock_id not in existing]
+        if missing:
+            tasks.append(upstream.execute_async(self.client.table("stocks_params").insert(missing), "stocks_params.insert"))
+
+        await gather_writes(tasks)
+
+    async def add_params(self, deltas: Dict[str, Params]):
+        if not deltas:
+            return
+        # see sql/add_stock_params.sql
+        await upstream.execute_async(self.client.rpc("add_stock_params", {
+            "p_params": [{"stock_id": stock_id, "mu_term": mu, "sigma_term": sigma} for stock_id, (mu, sigma) in deltas.items()]
+        }), "rpc.add_stock_params")
+
+    async def record_prices(self, points: List[PricePoint]):
+        # see sql/record_stock_prices.sql, one call for the whole tick, backfilled points included
+        if not points:
+            return
+        stock_ids, prices, stamps = (list(column) for column in zip(*points))
+        await upstream.execute_async(self.client.rpc("record_stock_prices", {
+            "p_stock_ids": stock_ids, "p_prices": prices, "p_ts": stamps
+        }), "rpc.record_stock_prices")
+
+    async def list_market_activity(self) -> Dict[str, Tuple[int, str]]:
+        rows = (await upstream.execute_async(self.client.table("market_activity").select("*"), "market_activity.select")).data
+        return {row["market_id"]: (int(row["viewers"]), row["updated_at"]) for row in rows}
+
+    async def load_sentiment_state(self) -> Dict[str, Tuple[SentimentSums, str]]:
+        rows = (await upstream.execute_async(self.client.table("sentiment_state").select("*"), "sentiment_state.select")).data
+        return {row["stock_id"]: ((float(row["weight"]), float(row["polarity_sum"]), float(row["square_sum"])), row["updated_at"])
+                for row in rows}
+
+    async def save_sentiment_state(self, sums: Dict[str, SentimentSums], updated_at: str):
+        if not sums:
+            return
+        rows = [{"stock_id": stock_id, "weight": weight, "polarity_sum": polarity_sum, "square_sum": square_sum, "updated_at": updated_at}
+                for stock_id, (weight, polarity_sum, square_sum) in sums.items()]
+        await upstream.execute_async(self.client.table("sentiment_state").upsert(rows, on_conflict="stock_id"), "sentiment_state.upsert")
+
+    async def load_stock_stats(self) -> Dict[str, Dict[str, List[float]]]:
+        rows = (await upstream.execute_async(self.client.table("stock_stats").select("stock_id, stats"), "stock_stats.select")).data
+        return {row["stock_id"]: row["stats"] for row in rows}
+
+    async def save_stock_stats(self, stats: Dict[str, Dict[str, List[float]]], updated_at: str):
+        if not stats:
+            return
+        rows = [{"stock_id": stock_id, "stats": windows, "updated_at": updated_at} for stock_id, windows in stats.items()]
+        await upstream.execute_async(self.client.table("stock_stats").upsert(rows, on_conflict="stock_id"), "stock_stats.upsert")
+
+
+async def gather_writes(tasks: List):
+    """Run writes concurrently, raise the first error after all have settled"""
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        raise Exception(f"{len(errors)} of {len(tasks)} writes failed: {errors[0]}")
@@ -1,28 +1,24 @@
-import os
-import supabase
 from models.classes import Credentials, ProfileData
 from datetime import datetime
 from fastapi import HTTPException
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_PRIVATE_KEY")
-supabase_client = supabase.create_client(SUPABASE_URL, SUPABASE_KEY)
+from utils import upstream
+from utils.db.cache import cached
+from utils.db.storage import get_storage
+from utils.db.supabase_storage import get_client  # auth stays on Supabase whichever backend holds the profiles
 
 
 
 def login_user(user_data: Credentials):
     # First, check if the email exists in the profiles table
     try:
-        profile_response = supabase_client.table("profiles").select("email").eq("email", user_data.email).execute()
-
-        if not profile_response.data:
+        if not get_storage().profile_exists(user_data.email):
             raise HTTPException(status_code=404, detail="Email not found")
 
 
-        auth_response = supabase_client.auth.sign_in_with_password({
+        auth_response = upstream.call("supabase", "auth.sign_in", lambda: get_client().auth.sign_in_with_password({
             "email": user_data.email,
             "password": user_data.password
-        })
+        }))
 
     except Exception as e:
         print(str(e))
@@ -38,10 +34,10 @@ def register_user(user_data: Credentials):
     # print("here")
     # Register the user
     try:
-        auth_response = supabase_client.auth.sign_up({
+        auth_response = upstream.call("supabase", "auth.sign_up", lambda: get_client().auth.sign_up({
             "email": user_data.email,
             "password": user_data.password
-        })
+        }))
         print("auth succesfull")
     except Exception as e:
         print(str(e))
@@ -61,7 +57,7 @@ def register_user(user_data: Credentials):
 
 
     try:
-        supabase_client.table("profiles").insert(profile_data.model_dump()).execute()
+        get_storage().insert_profile(profile_data.model_dump())
     except Exception as e:
         print(str(e))
         raise HTTPException(status_code=500, detail=str(e))
@@ -69,11 +65,14 @@ def register_user(user_data: Credentials):
     return auth_response.user, auth_response.session
 
 
+@cached("get_user")
 def get_user(user_id: str):
     # Get user details from auth
     try:
 
-        profile_response = supabase_client.table("profiles").select().eq("id", user_id).single().execute()
+        profile_data = get_storage().get_profile(user_id)
+        if profile_data is None:
+            raise Exception(f"Profile {user_id} not found")
 
     except Exception as e:
         print(str(e))
@@ -81,13 +80,11 @@ def get_user(user_id: str):
 
 
 
-    profile_data = profile_response.data
-
     return profile_data
 
 def session_refresh(refresh_token):
     try:
-        refresh_response = supabase_client.auth.refresh_session(refresh_token)
+        refresh_response = upstream.call("supabase", "auth.refresh", lambda: get_client().auth.refresh_session(refresh_token))
     except Exception as e:
         print(str(e))
         raise HTTPException(status_code=501, detail=str(e))
@@ -0,0 +1,31 @@
+import threading
+
+TIMEOUT = 10.0  # seconds
+
+_client = None
+_lock = threading.Lock()
+
+
+#====================================================#
+# SHARED HTTP CLIENT FOR THE REDDIT AND TWITCH SEARCHES
+#====================================================#
+def get_client():
+    """
+    One httpx.AsyncClient for the process, built on first use so importing
+    the app stays cheap. Reusing it keeps connections (and their TLS
+    sessions) alive between searches instead of redoing the handshake.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                import httpx
+                _client = httpx.AsyncClient(timeout=TIMEOUT)
+    return _client
+
+
+async def aclose():
+    global _client
+    client, _client = _client, None
+    if client is not None:
+        await client.aclose()
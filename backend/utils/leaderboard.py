@@ -0,0 +1,219 @@
+import random
+import threading
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Tuple
+
+MAX_LEVELS = 24  # enough for ~16M players per market
+
+Key = Tuple[float, str]  # (-net worth, user_id): richest first, ties broken by id
+
+
+#====================================================#
+# INDEXABLE SKIP LIST (O(log n) INSERT, REMOVE AND RANK)
+#====================================================#
+class Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, height: int):
+        self.key = key
+        self.next: List[Optional["Node"]] = [None] * height
+        self.width: List[int] = [1] * height  # positions skipped by each link
+
+
+class SkipList:
+    """Sorted keys with positional access, links carry their width so ranks are counted on the way down"""
+
+    def __init__(self, seed: Optional[int] = None):
+        self.head = Node(None, MAX_LEVELS)
+        self.size = 0
+        self.random = random.Random(seed)
+
+    def height(self) -> int:
+        height = 1
+        while height < MAX_LEVELS and self.random.random() < 0.5:
+            height += 1
+        return height
+
+    @classmethod
+    def from_sorted(cls, keys: List, seed: Optional[int] = None) -> "SkipList":
+        """Link already sorted keys level by level, O(n) instead of n inserts"""
+        skiplist = cls(seed)
+        last: List[Node] = [skiplist.head] * MAX_LEVELS
+        last_position = [0] * MAX_LEVELS
+        for position, key in enumerate(keys, 1):
+            node = Node(key, skiplist.height())
+            for level in range(len(node.next)):
+                last[level].next[level] = node
+                last[level].width[level] = position - last_position[level]
+                last[level], last_position[level] = node, position
+        for level in range(MAX_LEVELS):
+            last[level].width[level] = len(keys) + 1 - last_position[level]
+        skiplist.size = len(keys)
+        return skiplist
+
+    def insert(self, key):
+        chain: List[Node] = [self.head] * MAX_LEVELS
+        steps = [0] * MAX_LEVELS  # position of chain[level]
+        node, position = self.head, 0
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            chain[level], steps[level] = node, position
+
+        new = Node(key, self.height())
+        for level in range(len(new.next)):
+            before = chain[level]
+            skipped = position - steps[level]  # nodes between chain[level] and the new one
+            new.next[level] = before.next[level]
+            new.width[level] = before.width[level] - skipped
+            before.next[level] = new
+            before.width[level] = skipped + 1
+        for level in range(len(new.next), MAX_LEVELS):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        chain: List[Node] = [self.head] * MAX_LEVELS
+        node = self.head
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+        for level in range(len(target.next)):
+            before = chain[level]
+            before.width[level] += target.width[level] - 1
+            before.next[level] = target.next[level]
+        for level in range(len(target.next), MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def rank(self, key) -> Optional[int]:
+        """1-based position of key, None if absent"""
+        node, position = self.head, 0
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key <= key:
+                position += node.width[level]
+                node = node.next[level]
+        return position if node is not self.head and node.key == key else None
+
+    def __iter__(self) -> Iterator:
+        node = self.head.next[0]
+        while node is not None:
+            yield node.key
+            node = node.next[0]
+
+    def __len__(self) -> int:
+        return self.size
+
+
+#====================================================#
+# PER-MARKET BOARD
+#====================================================#
+class MarketBoard:
+    """
+    Cash and holdings of every player as arrays (players x stocks), so a new
+    tick revalues the whole market with one matrix-vector product. A fill
+    only touches its player's row and re-slots them in the skip list.
+    """
+
+    def __init__(self, prices: Dict[str, float]):
+        self.columns = {stock_id: i for i, stock_id in enumerate(prices)}
+        self.prices = np.array(list(prices.values()), dtype=np.float64)
+        self.rows: Dict[str, int] = {}
+        self.users: List[str] = []
+        self.seqs: List[int] = []  # ledger sequence each row reflects, older updates are dropped
+        self.cash = np.zeros(16)
+        self.holdings = np.zeros((16, len(self.columns)))
+        self.keys: Dict[str, Key] = {}
+        self.ranking = SkipList(seed=0)
+        self.priced_at = None  # the public snapshot the prices came from
+        self.ready = threading.Event()  # set once the builder has loaded every player
+        self.lock = threading.Lock()
+
+    def row(self, user_id: str) -> int:
+        if user_id not in self.rows:
+            if len(self.users) == len(self.cash):
+                self.cash = np.concatenate([self.cash, np.zeros(len(self.cash))])
+                self.holdings = np.vstack([self.holdings, np.zeros_like(self.holdings)])
+            self.rows[user_id] = len(self.users)
+            self.users.append(user_id)
+            self.seqs.append(-1)
+        return self.rows[user_id]
+
+    def update(self, user_id: str, seq: int, cash: float, shares: Dict[str, float]):
+        """Set a player's account; O(stocks) to value it, O(log n) to re-rank"""
+        with self.lock:
+            row = self.row(user_id)
+            if seq < self.seqs[row]:
+                return
+            self.seqs[row] = seq
+            self.cash[row] = cash
+            self.holdings[row] = 0.0
+            for stock_id, held in shares.items():
+                if stock_id in self.columns:
+                    self.holdings[row, self.columns[stock_id]] = held
+
+            key = (-float(cash + self.holdings[row] @ self.prices), user_id)
+            previous = self.keys.get(user_id)
+            if previous is not None:
+                self.ranking.remove(previous)
+            self.ranking.insert(key)
+            self.keys[user_id] = key
+
+    def revalue(self, prices: Dict[str, float], priced_at):
+        """Mark every player to new prices at once and rebuild the ranking"""
+        with self.lock:
+            for stock_id, price in prices.items():
+                if stock_id in self.columns:
+                    self.prices[self.columns[stock_id]] = price
+            n = len(self.users)
+            worth = self.cash[:n] + self.holdings[:n] @ self.prices
+
+            keys = {user_id: (-float(value), user_id) for user_id, value in zip(self.users, worth.tolist())}
+            self.ranking = SkipList.from_sorted(sorted(keys.values()), seed=0)
+            self.keys, self.priced_at = keys, priced_at
+
+    def top(self, k: int) -> List[Tuple[int, str, float]]:
+        with self.lock:
+            entries = []
+            for key in self.ranking:
+                if len(entries) == k:
+                    break
+                entries.append((len(entries) + 1, key[1], -key[0]))
+            return entries
+
+    def standing(self, user_id: str) -> Optional[Tuple[int, float]]:
+        with self.lock:
+            key = self.keys.get(user_id)
+            return (self.ranking.rank(key), -key[0]) if key else None
+
+
+boards: Dict[str, MarketBoard] = {}
+boards_lock = threading.Lock()
+
+
+def get_board(market_id: str) -> Optional[MarketBoard]:
+    return boards.get(market_id)
+
+
+def add_board(market_id: str, board: MarketBoard) -> MarketBoard:
+    """Register a freshly built board, or return the one another thread registered first"""
+    with boards_lock:
+        return boards.setdefault(market_id, board)
+
+
+def drop_board(market_id: str):
+    with boards_lock:
+        boards.pop(market_id, None)
+
+
+def update(user_id: str, market_id: str, seq: int, cash: float, shares: Dict[str, float]):
+    """Re-rank a player after a fill or a join, if their market has a board"""
+    board = boards.get(market_id)
+    if board is not None:
+        board.update(user_id, seq, cash, shares)
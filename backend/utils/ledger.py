@@ -0,0 +1,354 @@
+import logging
+import threading
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from constants.constants import LEDGER_BATCH_SIZE, LEDGER_FLUSH_SECONDS, LEDGER_SNAPSHOT_EVERY
+
+logger = logging.getLogger(__name__)
+
+AccountKey = Tuple[str, str]  # (user_id, market_id)
+
+
+#====================================================#
+# ACCOUNT STATE (REBUILT FROM SNAPSHOT + LEDGER TAIL)
+#====================================================#
+class Account:
+    """A user's balance and positions in one market, as of ledger sequence `seq`"""
+
+    __slots__ = ("free_currency", "positions", "realized_pnl", "volume", "seq", "snapshot_seq", "changed")
+
+    def __init__(self, free_currency: float, positions: Optional[Dict[str, List[float]]] = None,
+                 realized_pnl: float = 0.0, volume: float = 0.0, seq: int = 0):
+        self.free_currency = free_currency
+        self.positions = positions or {}  # stock_id -> [shares, cost basis]
+        self.realized_pnl = realized_pnl
+        self.volume = volume  # notional traded
+        self.seq = seq
+        self.snapshot_seq = seq
+        self.changed: Set[str] = set()  # stocks whose position is not yet written back
+
+    def apply(self, trade: Dict):
+        shares, price = trade["shares"], trade["price"]
+        position = self.positions.setdefault(trade["stock_id"], [0.0, 0.0])
+        if trade["side"] == "buy":
+            self.free_currency -= shares * price
+            position[0] += shares
+            position[1] += shares * price
+        else:
+            # the average cost of the shares sold leaves the basis, the rest is realized
+            held = position[0]
+            cost = position[1] * min(shares, held) / held if held > 0 else 0.0
+            self.free_currency += shares * price
+            self.realized_pnl += shares * price - cost
+            position[0] -= shares
+            position[1] -= cost
+        if position[0] <= 0:
+            del self.positions[trade["stock_id"]]
+        self.volume += shares * price
+        self.seq = trade["seq"]
+        self.changed.add(trade["stock_id"])
+
+    def shares(self) -> Dict[str, float]:
+        return {stock_id: position[0] for stock_id, position in self.positions.items()}
+
+    def unrealized_pnl(self, prices: Dict[str, float]) -> float:
+        return sum(position[0] * prices.get(stock_id, 0.0) - position[1] for stock_id, position in self.positions.items())
+
+    def snapshot(self, user_id: str, market_id: str) -> Dict:
+        return {
+            "user_id": user_id,
+            "market_id": market_id,
+            "seq": self.seq,
+            "free_currency": self.free_currency,
+            "positions": {stock_id: list(position) for stock_id, position in self.positions.items()},
+            "realized_pnl": self.realized_pnl,
+            "volume": self.volume,
+            "created_at": datetime.now().isoformat(),
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Dict) -> "Account":
+        return cls(float(snapshot["free_currency"]), {stock_id: [float(shares), float(cost)] for stock_id, (shares, cost) in snapshot["positions"].items()},
+                   float(snapshot["realized_pnl"]), float(snapshot["volume"]), int(snapshot["seq"]))
+
+
+Leg = Tuple[str, str, float, float]  # (stock_id, side, shares, price)
+
+
+def check_legs(account: Account, legs: List[Leg], numbered: bool = True) -> List[int]:
+    """
+    Raise ValueError unless the account can fill the legs together: sells
+    go first so they fund the buys, no stock may be sold beyond what is
+    held and the cash left after the buys may not go negative. Returns the
+    order the legs fill in.
+    """
+    order = sorted(range(len(legs)), key=lambda i: legs[i][1] != "sell")
+    held = account.shares()
+    cash = account.free_currency
+    for i in order:
+        stock_id, side, shares, price = legs[i]
+        prefix = f"Leg {i + 1}: " if numbered else ""
+        if side == "sell":
+            if stock_id not in held:
+                raise ValueError(f"{prefix}You don't own any shares of this stock")
+            if shares > held[stock_id] + 1e-9:
+                raise ValueError(f"{prefix}You don't own enough shares of this stock")
+            held[stock_id] -= shares
+            cash += shares * price
+        else:
+            cash -= shares * price
+    if cash < -1e-9:
+        raise ValueError("Not enough currency for these orders" if numbered else "Not enough currency for this order")
+    return order
+
+
+#====================================================#
+# LEDGER
+#====================================================#
+class Ledger:
+    """
+    Append-only trade ledger in front of the storage backend. Trades are
+    applied to the in-memory account at once and written in batches: the
+    trades themselves, the balance/position rows the RPCs read, and a
+    snapshot every LEDGER_SNAPSHOT_EVERY trades of an account. Assumes one
+    API process owns the order path, like the in-process caches do.
+    """
+
+    def __init__(self, get_storage: Callable, on_flush: Optional[Callable[[str, str], None]] = None,
+                 on_trade: Optional[Callable] = None, flush_seconds: float = LEDGER_FLUSH_SECONDS, batch_size: int = LEDGER_BATCH_SIZE,
+                 snapshot_every: int = LEDGER_SNAPSHOT_EVERY):
+        self.get_storage = get_storage
+        self.on_flush = on_flush
+        self.on_trade = on_trade  # (user_id, market_id, seq, free_currency, shares) after every trade
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.snapshot_every = snapshot_every
+
+        self.accounts: Dict[AccountKey, Account] = {}
+        self.pending: List[Dict] = []
+        self.dirty: Set[AccountKey] = set()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.writer: Optional[threading.Thread] = None
+        self.closed = False
+
+    def account(self, user_id: str, market_id: str) -> Optional[Account]:
+        """The user's account in a market, None if they have not joined it"""
+        key = (user_id, market_id)
+        with self.lock:
+            if key in self.accounts:
+                return self.accounts[key]
+
+        account = self.load(user_id, market_id)
+        with self.lock:
+            # another thread may have loaded (and traded on) it meanwhile
+            if account is not None and key not in self.accounts:
+                self.accounts[key] = account
+            return self.accounts.get(key)
+
+    def load(self, user_id: str, market_id: str) -> Optional[Account]:
+        storage = self.get_storage()
+        snapshot = storage.latest_snapshot(user_id, market_id)
+        if snapshot is not None:
+            account = Account.from_snapshot(snapshot)
+            for trade in storage.list_trades(user_id, market_id, after_seq=account.seq):
+                account.apply(trade)
+            account.snapshot_seq = snapshot["seq"]
+            account.changed.clear()
+            return account
+
+        # no ledger yet: start from the mutable rows, holdings valued at the current price,
+        # and snapshot that as seq 0 so every later trade has a base to replay onto
+        free_currency = storage.get_balance(user_id, market_id)
+        if free_currency is None:
+            return None
+        positions = {}
+        for stock_id, shares in storage.list_positions(user_id, market_id).items():
+            stock = storage.get_stock(stock_id)
+            positions[stock_id] = [shares, shares * float(stock["price"]) if stock else 0.0]
+        account = Account(free_currency, positions)
+        storage.save_snapshots([account.snapshot(user_id, market_id)])
+        return account
+
+    def check(self, user_id: str, market_id: str, legs: List[Leg], numbered: bool = True):
+        """Raise ValueError unless the account could fill the legs now, see check_legs"""
+        account = self.account(user_id, market_id)
+        if account is None:
+            raise ValueError("User has not joined this market")
+        with self.lock:
+            check_legs(account, legs, numbered)
+
+    def record(self, user_id: str, market_id: str, stock_id: str, side: str, shares: float, price: float) -> Dict:
+        """Fill one trade, checked like a single leg of record_many"""
+        account = self.account(user_id, market_id)
+        if account is None:
+            raise ValueError("User has not joined this market")
+
+        with self.lock:
+            check_legs(account, [(stock_id, side, shares, price)], numbered=False)
+            trade = {
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "market_id": market_id,
+                "stock_id": stock_id,
+                "side": side,
+                "shares": shares,
+                "price": price,
+                "seq": account.seq + 1,
+                "created_at": datetime.now().isoformat(),
+            }
+            account.apply(trade)
+            self.pending.append(trade)
+            self.dirty.add((user_id, market_id))
+            full = len(self.pending) >= self.batch_size
+            state = (account.seq, account.free_currency, account.shares())
+
+        if self.on_trade:
+            self.on_trade(user_id, market_id, *state)
+        self.start()
+        if full:
+            self.wake.set()
+        return trade
+
+    def record_many(self, user_id: str, market_id: str, legs: List[Leg]) -> List[Dict]:
+        """
+        Fill several legs of one account at once, all or none, checked
+        together by check_legs. The trades land in the same flush, so
+        storage writes them in one append_trades call. Returns the trades in
+        the order of the legs.
+        """
+        account = self.account(user_id, market_id)
+        if account is None:
+            raise ValueError("User has not joined this market")
+
+        with self.lock:
+            order = check_legs(account, legs)
+            trades: List[Optional[Dict]] = [None] * len(legs)
+            created_at = datetime.now().isoformat()
+            for i in order:
+                stock_id, side, shares, price = legs[i]
+                trades[i] = {
+                    "id": str(uuid.uuid4()),
+                    "user_id": user_id,
+                    "market_id": market_id,
+                    "stock_id": stock_id,
+                    "side": side,
+                    "shares": shares,
+                    "price": price,
+                    "seq": account.seq + 1,
+                    "created_at": created_at,
+                }
+                account.apply(trades[i])
+            self.pending += [trades[i] for i in order]
+            self.dirty.add((user_id, market_id))
+            full = len(self.pending) >= self.batch_size
+            state = (account.seq, account.free_currency, account.shares())
+
+        if self.on_trade:
+            self.on_trade(user_id, market_id, *state)
+        self.start()
+        if full:
+            self.wake.set()
+        return trades
+
+    def states(self, market_id: str) -> Dict[str, Tuple[int, float, Dict[str, float]]]:
+        """(seq, free currency, shares) of every account of a market held in memory"""
+        with self.lock:
+            return {user_id: (account.seq, account.free_currency, account.shares())
+                    for (user_id, account_market), account in self.accounts.items() if account_market == market_id}
+
+    #====================================================#
+    # BATCHED WRITER
+    #====================================================#
+    def start(self):
+        if self.writer is None:
+            with self.lock:
+                if self.writer is None and not self.closed:
+                    self.writer = threading.Thread(target=self.run, name="ledger-writer", daemon=True)
+                    self.writer.start()
+
+    def run(self):
+        while not self.closed:
+            self.wake.wait(self.flush_seconds)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("ledger flush failed, retrying")
+
+    def flush(self) -> int:
+        """Write out everything recorded so far, returns the number of trades written"""
+        with self.flush_lock:
+            with self.lock:
+                trades, self.pending = self.pending, []
+                dirty, self.dirty = self.dirty, set()
+                rows = []
+                snapshots = []
+                for key in dirty:
+                    account = self.accounts[key]
+                    changed, account.changed = account.changed, set()
+                    rows.append((key, account.free_currency, {stock_id: account.positions.get(stock_id, [0.0])[0] for stock_id in changed}))
+                    if account.seq - account.snapshot_seq >= self.snapshot_every:
+                        snapshots.append((account.snapshot_seq, account.snapshot(*key)))
+                        account.snapshot_seq = account.seq
+
+            if not trades and not rows:
+                return 0
+
+            storage = self.get_storage()
+            try:
+                if trades:
+                    storage.append_trades(trades)
+            except Exception:
+                # nothing was written, put the batch back in front of newer trades
+                with self.lock:
+                    self.pending[:0] = trades
+                    self.dirty |= dirty
+                    for key, _, shares in rows:
+                        self.accounts[key].changed |= set(shares)
+                    for previous_seq, snapshot in snapshots:
+                        self.accounts[(snapshot["user_id"], snapshot["market_id"])].snapshot_seq = previous_seq
+                raise
+
+            # the rows below are derived state, the trades are already durable: each row is written
+            # on its own, and the ones that fail are marked dirty again for the next flush
+            errors = []
+            for key, free_currency, shares in rows:
+                user_id, market_id = key
+                try:
+                    storage.set_balance(user_id, market_id, free_currency)
+                    for stock_id, held in shares.items():
+                        storage.set_position(user_id, stock_id, market_id, held)
+                except Exception as e:
+                    errors.append(e)
+                    with self.lock:
+                        self.dirty.add(key)
+                        self.accounts[key].changed |= set(shares)
+                    continue
+                if self.on_flush:
+                    self.on_flush(user_id, market_id)
+
+            if snapshots:
+                try:
+                    storage.save_snapshots([snapshot for _, snapshot in snapshots])
+                except Exception as e:
+                    errors.append(e)
+                    with self.lock:
+                        for previous_seq, snapshot in snapshots:
+                            key = (snapshot["user_id"], snapshot["market_id"])
+                            self.accounts[key].snapshot_seq = previous_seq
+                            self.dirty.add(key)
+
+            if errors:
+                raise errors[0]
+            return len(trades)
+
+    def close(self):
+        """Stop the writer and flush what is left"""
+        self.closed = True
+        self.wake.set()
+        if self.writer is not None:
+            self.writer.join()
+        self.flush()
@@ -0,0 +1,294 @@
+import logging
+import threading
+import uuid
+import numpy as np
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from constants.constants import TICK_SECONDS
+
+logger = logging.getLogger(__name__)
+
+OrderKey = Tuple[str, str]  # (user_id, market_id)
+
+
+def direction(side: str, kind: str) -> int:
+    """+1 if the order fires once the price rises to its trigger, -1 once it falls to it"""
+    # a sell limit or a buy stop waits for the price to rise, a buy limit or a sell stop for it to fall
+    return 1 if (side == "sell") == (kind == "limit") else -1
+
+
+#====================================================#
+# TRIGGER INDEX (ONE VECTOR COMPARISON PER TICK)
+#====================================================#
+class TriggerIndex:
+    """
+    Every resting order as a slot of three parallel arrays: its stock's
+    column, its trigger price and its direction. A tick gathers each slot's
+    price with one fancy index and compares all of them at once, so the cost
+    is a few passes over contiguous memory instead of a Python loop over the
+    orders. Removed slots are blanked (NaN never fires) and compacted away
+    once they make up half the arrays.
+    """
+
+    def __init__(self):
+        self.columns: Dict[str, int] = {}
+        self.stock_ids: List[str] = []
+        self.counts: List[int] = []  # live orders per column
+        self.order_ids: List[Optional[str]] = []
+        self.slots: Dict[str, int] = {}
+        self.stock = np.zeros(16, dtype=np.int32)
+        self.trigger = np.full(16, np.nan)
+        self.direction = np.zeros(16, dtype=np.int8)
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def column(self, stock_id: str) -> int:
+        if stock_id not in self.columns:
+            self.columns[stock_id] = len(self.stock_ids)
+            self.stock_ids.append(stock_id)
+            self.counts.append(0)
+        return self.columns[stock_id]
+
+    def reserve(self, n: int):
+        size = len(self.stock)
+        if n <= size:
+            return
+        while size < n:
+            size *= 2
+        grow = size - len(self.stock)
+        self.stock = np.concatenate([self.stock, np.zeros(grow, dtype=np.int32)])
+        self.trigger = np.concatenate([self.trigger, np.full(grow, np.nan)])
+        self.direction = np.concatenate([self.direction, np.zeros(grow, dtype=np.int8)])
+
+    def add(self, order_id: str, stock_id: str, trigger: float, sign: int):
+        self.add_many([order_id], [stock_id], [trigger], [sign])
+
+    def add_many(self, order_ids: List[str], stock_ids: Iterable[str], triggers: Iterable[float], signs: Iterable[int]):
+        start = len(self.order_ids)
+        self.reserve(start + len(order_ids))
+        end = start + len(order_ids)
+
+        columns = [self.column(stock_id) for stock_id in stock_ids]
+        for column in columns:
+            self.counts[column] += 1
+        self.stock[start:end] = columns
+        self.trigger[start:end] = list(triggers)
+        self.direction[start:end] = list(signs)
+        self.slots.update(zip(order_ids, range(start, end)))
+        self.order_ids.extend(order_ids)
+
+    def remove(self, order_id: str):
+        slot = self.slots.pop(order_id)
+        self.trigger[slot] = np.nan
+        self.order_ids[slot] = None
+        self.counts[self.stock[slot]] -= 1
+        if len(self.order_ids) > 1024 and len(self.slots) < len(self.order_ids) // 2:
+            self.compact()
+
+    def compact(self):
+        live = np.fromiter(self.slots.values(), dtype=np.int64, count=len(self.slots))
+        live.sort()
+        n = len(live)
+        self.stock[:n] = self.stock[live]
+        self.trigger[:n] = self.trigger[live]
+        self.direction[:n] = self.direction[live]
+        self.trigger[n:] = np.nan
+        self.order_ids = [self.order_ids[slot] for slot in live.tolist()]
+        self.slots = {order_id: slot for slot, order_id in enumerate(self.order_ids)}
+
+    def watched(self) -> List[str]:
+        """Stocks with at least one resting order"""
+        return [stock_id for stock_id, count in zip(self.stock_ids, self.counts) if count]
+
+    def prices(self, prices: Dict[str, float]) -> np.ndarray:
+        """A price per column, NaN for stocks without one"""
+        vector = np.full(len(self.stock_ids), np.nan)
+        for stock_id, price in prices.items():
+            column = self.columns.get(stock_id)
+            if column is not None:
+                vector[column] = price
+        return vector
+
+    def fired(self, vector: np.ndarray) -> np.ndarray:
+        """Slots whose trigger the column prices in vector have reached"""
+        n = len(self.order_ids)
+        if not n:
+            return np.zeros(0, dtype=np.int64)
+        # NaN (a blanked slot or an unknown price) compares false
+        distance = vector[self.stock[:n]] - self.trigger[:n]
+        distance *= self.direction[:n]
+        return np.flatnonzero(distance >= 0)
+
+    def triggered(self, prices: Dict[str, float]) -> List[str]:
+        """Ids of the orders the given prices fire"""
+        return [self.order_ids[slot] for slot in self.fired(self.prices(prices)).tolist()]
+
+
+#====================================================#
+# RESTING ORDER BOOK
+#====================================================#
+class OrderBook:
+    """
+    Open limit and stop orders of every market, kept in memory in front of
+    the storage backend and checked against the current prices once per
+    tick. Fired orders are handed to `fill` together, as one batch, with
+    the prices that fired them; `fill` returns the ids it rejected. Like the
+    ledger, it assumes one API process owns the order path.
+    """
+
+    def __init__(self, get_storage: Callable, fill: Callable[[List[Dict], Dict[str, float]], Set[str]],
+                 poll_seconds: float = TICK_SECONDS):
+        self.get_storage = get_storage
+        self.fill = fill
+        self.poll_seconds = poll_seconds
+
+        self.orders: Dict[str, Dict] = {}
+        self.by_account: Dict[OrderKey, Set[str]] = {}
+        self.index = TriggerIndex()
+        self.closing: Dict[str, List[str]] = {"filled": [], "rejected": []}  # closes to write, retried until they land
+        self.loaded = False
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.watcher: Optional[threading.Thread] = None
+        self.closed = False
+
+    def load(self):
+        """Read the open orders once, on first use"""
+        if self.loaded:
+            return
+        with self.load_lock:
+            if self.loaded:
+                return
+            rows = self.get_storage().list_open_orders()
+            with self.lock:
+                for row in rows:
+                    if row["id"] not in self.orders:
+                        self.add({**row, "shares": float(row["shares"]), "price": float(row["price"])})
+                self.loaded = True
+
+    def add(self, order: Dict):
+        self.orders[order["id"]] = order
+        self.by_account.setdefault((order["user_id"], order["market_id"]), set()).add(order["id"])
+        self.index.add(order["id"], order["stock_id"], order["price"], direction(order["side"], order["kind"]))
+
+    def remove(self, order_id: str) -> Dict:
+        order = self.orders.pop(order_id)
+        key = (order["user_id"], order["market_id"])
+        self.by_account[key].discard(order_id)
+        if not self.by_account[key]:
+            del self.by_account[key]
+        self.index.remove(order_id)
+        return order
+
+    def place(self, user_id: str, market_id: str, stock_id: str, side: str, kind: str, shares: float, price: float) -> Dict:
+        self.load()
+        order = {
+            "id": str(uuid.uuid4()),
+            "created_at": datetime.now().isoformat(),
+            "user_id": user_id,
+            "market_id": market_id,
+            "stock_id": stock_id,
+            "side": side,
+            "kind": kind,
+            "shares": shares,
+            "price": price,
+            "status": "open",
+        }
+        self.get_storage().insert_order(order)
+        with self.lock:
+            self.add(order)
+        self.start()
+        return order
+
+    def cancel(self, user_id: str, order_id: str) -> Optional[Dict]:
+        """Withdraw an open order of the user, None if there is none (or it already fired)"""
+        self.load()
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None or order["user_id"] != user_id:
+                return None
+            self.remove(order_id)
+
+        try:
+            self.get_storage().close_orders([order_id], "cancelled")
+        except Exception:
+            with self.lock:
+                self.add(order)
+            raise
+        return order
+
+    def open_orders(self, user_id: str, market_id: str) -> List[Dict]:
+        self.load()
+        with self.lock:
+            orders = [self.orders[order_id] for order_id in self.by_account.get((user_id, market_id), ())]
+        return sorted(orders, key=lambda order: order["created_at"])
+
+    def check(self, prices: Optional[Dict[str, float]] = None) -> int:
+        """Fill every order the current prices trigger, returns how many fired"""
+        self.load()
+        if prices is None:
+            with self.lock:
+                stock_ids = self.index.watched()
+            prices = self.get_storage().get_prices(stock_ids) if stock_ids else {}
+
+        with self.lock:
+            fired = [self.remove(order_id) for order_id in self.index.triggered(prices)]
+
+        if fired:
+            try:
+                rejected = self.fill(fired, prices)
+            except Exception:
+                # nothing was filled, the orders rest again
+                with self.lock:
+                    for order in fired:
+                        self.add(order)
+                raise
+            with self.lock:
+                for order in fired:
+                    self.closing["rejected" if order["id"] in rejected else "filled"].append(order["id"])
+
+        self.write_closes()
+        return len(fired)
+
+    def write_closes(self):
+        storage = self.get_storage()
+        for status in self.closing:
+            with self.lock:
+                order_ids, self.closing[status] = self.closing[status], []
+            if not order_ids:
+                continue
+            try:
+                storage.close_orders(order_ids, status)
+            except Exception:
+                with self.lock:
+                    self.closing[status][:0] = order_ids
+                raise
+
+    #====================================================#
+    # TICK WATCHER
+    #====================================================#
+    def start(self):
+        if self.watcher is None:
+            with self.lock:
+                if self.watcher is None and not self.closed:
+                    self.watcher = threading.Thread(target=self.run, name="order-watcher", daemon=True)
+                    self.watcher.start()
+
+    def run(self):
+        while not self.closed:
+            try:
+                self.check()
+            except Exception:
+                logger.exception("order check failed, retrying")
+            self.wake.wait(self.poll_seconds)
+
+    def close(self):
+        """Stop the watcher and write out the pending closes"""
+        self.closed = True
+        self.wake.set()
+        if self.watcher is not None:
+            self.watcher.join()
+        if any(self.closing.values()):
+            self.write_closes()
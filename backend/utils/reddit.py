@@ -1,14 +1,15 @@
-import httpx
 import os
 from dotenv import load_dotenv
 from typing import List
 from models.classes import Community
+from utils import upstream
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Constants
-SUBREDDIT_SEARCH_URL = "https://oauth.reddit.com/subreddits/search"
+REDDIT_API_URL = os.getenv("REDDIT_API_URL", "https://oauth.reddit.com")
+SUBREDDIT_SEARCH_URL = f"{REDDIT_API_URL}/subreddits/search"
 REDDIT_TOKEN = os.getenv("REDDIT_TOKEN")
 
 
@@ -24,8 +25,7 @@ async def get_subreddits(term: str) -> List[Community]:
         "limit": 3
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(SUBREDDIT_SEARCH_URL, headers=headers, params=params)
+    response = await upstream.get("reddit", "subreddit_search", SUBREDDIT_SEARCH_URL, headers=headers, params=params)
 
     if response.status_code == 200:
         subreddits = response.json()["data"]["children"]
@@ -0,0 +1,60 @@
+import hashlib
+import os
+from typing import Any, Dict, Optional
+import orjson
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+# every ETag carries the process it was made by, versions counted in memory restart at 0 with it
+EPOCH = os.urandom(8).hex()
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response encoded with orjson. Handlers may also return bytes that
+    are already valid JSON, which are sent as-is without another encode.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def splice_object(head: Dict, key: str, raw_value: bytes) -> bytes:
+    """Encode dict `head` with one more key whose value is pre-encoded JSON"""
+    encoded = dumps(head)
+    separator = b"," if len(encoded) > 2 else b""
+    return b"".join((encoded[:-1], separator, dumps(key), b":", raw_value, b"}"))
+
+
+
+#====================================================#
+# CONDITIONAL GETS (ETAG / IF-NONE-MATCH)
+#====================================================#
+def etag(*parts: Any) -> str:
+    """
+    Weak ETag of the versions a response is built from. Weak, because the
+    gzip middleware may send the same version in another encoding.
+    """
+    digest = hashlib.blake2b(repr((EPOCH,) + parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_headers(tag: str) -> Dict[str, str]:
+    # cached by the browser, but revalidated on every use
+    return {"ETag": tag, "Cache-Control": "private, no-cache"}
+
+
+def not_modified(if_none_match: Optional[str], tag: str) -> Optional[Response]:
+    """A 304 if the client's If-None-Match holds `tag` (weak comparison), else None"""
+    if not if_none_match:
+        return None
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    if "*" in candidates or tag.removeprefix("W/") in candidates:
+        return Response(status_code=304, headers=etag_headers(tag))
+    return None
@@ -0,0 +1,148 @@
+import os
+import re
+from typing import Dict, List, Sequence, Tuple
+
+LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sentiment_lexicon.tsv")
+
+NEGATIONS = frozenset(("no", "not", "n't", "never"))
+EXCLAMATION_BOOST = 1.25
+NEGATED_WEIGHT = -0.5  # "not good" is slightly bad, "not bad" slightly good
+
+# emoticon -> polarity, lowercased like the text they are matched in (pattern's moods, minus the all-letter "xd")
+EMOTICONS = {
+    **dict.fromkeys(("<3", "♥"), 1.0),
+    **dict.fromkeys(("8-d", ":-d", ":d", "=-d", "=d", ">:d", "x-d"), 1.0),
+    **dict.fromkeys((":-p", ":-b", ":^)", ":b", ":c)", ":o)", ":p", ">:p"), 0.75),
+    **dict.fromkeys(("8)", "8-)", ":)", ":-)", ":3", ":>", ":]", ":}", "=)", "=]", ">:)"), 0.5),
+    **dict.fromkeys(("*)", "*-)", ";)", ";-)", ";-]", ";d", ";]", ";^)", ">;]"), 0.25),
+    **dict.fromkeys((":-o", ":o", ">:o", "o.o", "o_o", "°o°"), 0.05),
+    **dict.fromkeys((":-.", ":-/", ":-s", ":/", ":s", ":\\", ">.>", ">:/", ">:\\"), -0.25),
+    **dict.fromkeys((":(", ":-(", ":-<", ":-[", ":-c", ":[", ":c", ":{", "=(", "=/", ">:["), -0.75),
+    **dict.fromkeys((":'''(", ":'(", ";'("), -1.0),
+}
+
+SEPARATOR = "\x00"  # between the texts of a batch, never part of a token
+EMOTICON_EDGE = f"[^\\s{SEPARATOR}]"  # an emoticon stands on its own, between spaces or texts
+TOKEN = re.compile(
+    # the lookahead on the first character spares trying every emoticon at every position
+    f"(?=[{''.join(sorted({re.escape(emoticon[0]) for emoticon in EMOTICONS}))}])(?<!{EMOTICON_EDGE})"
+    f"(?:{'|'.join(re.escape(emoticon) for emoticon in sorted(EMOTICONS, key=len, reverse=True))})(?!{EMOTICON_EDGE})"
+    r"|n't|[a-z0-9]+(?=n't)|[a-z0-9]+(?:-[a-z0-9]+)*|!|" + SEPARATOR
+)
+
+Entry = Tuple[float, float, bool]  # (polarity, intensity, modifies the next word)
+
+
+#====================================================#
+# SCORERS
+#====================================================#
+class Scorer:
+    """Polarity in [-1, 1] of each text of a batch"""
+    name = ""
+
+    def score(self, texts: Sequence[str]) -> List[float]:
+        raise NotImplementedError
+
+
+class TextBlobScorer(Scorer):
+    """TextBlob's pattern analyzer, one blob per text"""
+    name = "textblob"
+
+    def score(self, texts: Sequence[str]) -> List[float]:
+        from textblob import TextBlob  # heavy (nltk), loaded on the first scored text rather than at startup
+        return [TextBlob(text).sentiment.polarity if text.strip() else 0.0 for text in texts]
+
+
+class LexiconScorer(Scorer):
+    """
+    The same lexicon and rules as TextBlob's pattern analyzer (a known word
+    scores its polarity, a preceding adverb scales it, a negation flips
+    and halves it, "!" boosts it, emoticons score on their own, the text is
+    the mean of its scores) without building a blob per text. The lexicon is
+    precompiled to one (polarity, intensity, modifier) entry per word, and a
+    batch is tokenized with a single regex pass over all of its texts.
+    Unlike TextBlob, whose tokenizer splits "isn't" into "isn ' t", it
+    also negates contractions ("isn't good"), unless negate_contractions
+    is off.
+    """
+    name = "lexicon"
+
+    def __init__(self, path: str = LEXICON_PATH, negate_contractions: bool = True):
+        self.lexicon = load_lexicon(path)
+        self.negate_contractions = negate_contractions
+
+    def score(self, texts: Sequence[str]) -> List[float]:
+        joined = SEPARATOR.join(texts).lower().replace("’", "'")
+        lexicon = self.lexicon
+        skip = "" if self.negate_contractions else "n't"
+        scores: List[float] = []
+        polarities: List[float] = []  # one per assessed word or emoticon of the current text
+        intensity = 1.0  # of the last assessed word
+        negated: List[bool] = []
+        modifier = ""  # preceding known adverb, it scales the next known word
+        negation = False  # a negation is pending for the next known word
+
+        for token in TOKEN.findall(joined + SEPARATOR):
+            if token == SEPARATOR:
+                scores.append(sum(p * NEGATED_WEIGHT if n else p for p, n in zip(polarities, negated)) / len(polarities)
+                              if polarities else 0.0)
+                polarities, negated, modifier, negation = [], [], "", False
+                continue
+
+            if token == skip:
+                continue  # like TextBlob's "' t", too short to end a negation or a modifier
+            entry = lexicon.get(token)
+            if entry is not None:
+                polarity, word_intensity, modifies = entry
+                if not modifier:
+                    polarities.append(polarity)
+                    negated.append(False)
+                    intensity = word_intensity
+                else:
+                    polarities[-1] = max(-1.0, min(polarity * intensity, 1.0))
+                    intensity = word_intensity
+                if negation:
+                    intensity = 1.0 / intensity
+                    negated[-1] = True
+                modifier = token if modifies else ""
+                negation = token in NEGATIONS
+                continue
+
+            if token in NEGATIONS:
+                negation = True
+            elif negation and len(token) > 1:
+                negation = False  # kept across small words ("not a good")
+            if negation and modifier and modifier.endswith("ly"):
+                negated[-1] = True  # "really not good"
+                negation = False
+            elif modifier and len(token) > 2:
+                modifier = ""  # kept across small words ("really is a good")
+            if token == "!":
+                if polarities:
+                    polarities[-1] = max(-1.0, min(polarities[-1] * EXCLAMATION_BOOST, 1.0))
+            elif token in EMOTICONS:
+                polarities.append(EMOTICONS[token])
+                negated.append(False)
+                intensity = 1.0
+        return scores
+
+
+def load_lexicon(path: str) -> Dict[str, Entry]:
+    """word<TAB>polarity<TAB>intensity<TAB>modifier lines, see benchmarks/sentiment.py --build-lexicon"""
+    lexicon = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            word, polarity, intensity, modifies = line.rstrip("\n").split("\t")
+            lexicon[word] = (float(polarity), float(intensity), modifies == "1")
+    return lexicon
+
+
+SCORERS = {scorer.name: scorer for scorer in (TextBlobScorer, LexiconScorer)}
+
+
+def get_scorer(name: str) -> Scorer:
+    if name not in SCORERS:
+        raise ValueError(f"Unknown sentiment scorer {name!r}, expected one of {', '.join(SCORERS)}")
+    return SCORERS[name]()
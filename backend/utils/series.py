@@ -0,0 +1,107 @@
+import json
+from array import array
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from fastapi import Response
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, the JSON columns encoding is always available
+    msgpack = None
+
+COLUMNAR_JSON = "application/vnd.fanstocks.columnar+json"
+COLUMNAR_MSGPACK = "application/vnd.fanstocks.columnar+msgpack"
+
+FLOAT32_DIGITS = 7  # significant digits a float32 can hold
+
+
+#====================================================#
+# PRICE SERIES <-> COLUMNS
+#====================================================#
+def to_epoch_ms(timestamp: str) -> int:
+    return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+
+
+def to_columns(prices: List[Dict], packed: bool = False) -> Dict[str, Any]:
+    """
+    Encode [{price, timestamp}, ...] as parallel arrays:
+      t0      first timestamp (epoch ms)
+      dt      fixed interval in ms, when every step is the same
+      offsets delta from the previous timestamp in ms, when it is not
+      prices  float32 prices (raw little-endian bytes when packed)
+    """
+    times = [to_epoch_ms(point["timestamp"]) for point in prices]
+    values = [float(point["price"]) for point in prices]
+
+    deltas = [b - a for a, b in zip(times, times[1:])]
+    fixed = len(set(deltas)) <= 1
+
+    columns = {
+        "t0": times[0] if times else None,
+        "n": len(times),
+        "dt": (deltas[0] if deltas else 0) if fixed else None,
+        "offsets": None if fixed else deltas,
+    }
+    if packed:
+        columns["prices"] = array("f", values).tobytes()
+    else:
+        columns["prices"] = [float(f"{value:.{FLOAT32_DIGITS}g}") for value in values]
+    return columns
+
+
+def from_columns(columns: Dict[str, Any]) -> List[Dict]:
+    """Inverse of to_columns, timestamps come back as epoch ms"""
+    prices = columns["prices"]
+    if isinstance(prices, (bytes, bytearray)):
+        prices = array("f", prices).tolist()
+
+    times = [columns["t0"]] if columns["n"] else []
+    deltas = columns["offsets"] if columns["offsets"] is not None else [columns["dt"]] * (columns["n"] - 1)
+    for delta in deltas:
+        times.append(times[-1] + delta)
+
+    return [{"price": price, "timestamp": time} for price, time in zip(prices, times)]
+
+
+def is_price_series(key: str, value: Any) -> bool:
+    return isinstance(value, list) and (key == "prices" or key.endswith("_prices"))
+
+
+def columnar_market(market: Dict, packed: bool = False) -> Dict:
+    """Copy of a stock market snapshot with every price series in columnar form"""
+    if not market:
+        return market
+    stocks = []
+    for stock in market.get("stocks") or []:
+        stocks.append({
+            key: to_columns(value, packed) if is_price_series(key, value) else value
+            for key, value in stock.items()
+        })
+    return {**market, "stocks": stocks}
+
+
+#====================================================#
+# CONTENT NEGOTIATION
+#====================================================#
+def negotiate(accept: Optional[str]) -> Optional[str]:
+    """Pick a columnar media type from the Accept header, or None for the default JSON"""
+    if not accept:
+        return None
+    for part in accept.split(","):
+        media_type = part.split(";")[0].strip().lower()
+        if media_type == COLUMNAR_MSGPACK and msgpack is not None:
+            return COLUMNAR_MSGPACK
+        if media_type == COLUMNAR_JSON:
+            return COLUMNAR_JSON
+    return None
+
+
+def render(content: Dict, market_key: str, media_type: str) -> Response:
+    """Render a response whose content["data"][market_key] is a stock market snapshot"""
+    packed = media_type == COLUMNAR_MSGPACK
+    data = {**content["data"], market_key: columnar_market(content["data"][market_key], packed)}
+    body = {**content, "data": data}
+
+    if packed:
+        return Response(msgpack.packb(body, use_bin_type=True), media_type=media_type, headers={"Vary": "Accept"})
+    return Response(json.dumps(body, separators=(",", ":")), media_type=media_type, headers={"Vary": "Accept"})
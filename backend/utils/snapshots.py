@@ -0,0 +1,142 @@
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from constants.constants import PRICE_RANGES, TICK_SECONDS
+from utils.db.cache import SingleFlightCache
+from utils.responses import dumps, splice_object
+from utils.series import is_price_series
+
+USER_FIELDS = ("free_currency",)  # per-user keys of a market snapshot
+USER_STOCK_FIELDS = ("shares",)  # per-user keys of each stock
+
+
+def next_tick(now: float) -> float:
+    return (math.floor(now / TICK_SECONDS) + 1) * TICK_SECONDS
+
+
+def range_keys(price_range: Optional[str]) -> List[str]:
+    return [PRICE_RANGES[price_range]] if price_range else list(PRICE_RANGES.values())
+
+
+#====================================================#
+# SHARED PUBLIC SNAPSHOT, ONE PER MARKET PER TICK
+#====================================================#
+class PublicSnapshot:
+    """The part of a stock market that is the same for every viewer"""
+    __slots__ = ("market", "encoded", "lock", "version")
+
+    def __init__(self, market: Optional[Dict]):
+        self.market = market
+        self.encoded: Dict[str, Dict[str, bytes]] = {}  # range -> stock_id -> encoded series members
+        self.lock = threading.Lock()
+        self.version = tick_version(market)
+
+
+def tick_version(market: Optional[Dict]) -> Tuple:
+    """
+    The last tick a snapshot holds: each stock's price and latest point. A
+    market the ticker has left alone keeps its version across refetches,
+    so its viewers' ETags stay valid until it ticks again.
+    """
+    if not market:
+        return ()
+    return tuple((stock.get("stock_id"), stock.get("price"), *(series[-1]["timestamp"] if series else None
+                  for series in (stock.get(key) for key in PRICE_RANGES.values())))
+                 for stock in market.get("stocks") or [])
+
+
+# entries expire at the next tick boundary
+public_cache = SingleFlightCache("public_snapshot", next_tick)
+
+
+def to_public(market: Optional[Dict]) -> Optional[Dict]:
+    """Strip the requesting user's fields from a get_stock_market_details result"""
+    if not market:
+        return market
+    stocks = [{key: value for key, value in stock.items() if key not in USER_STOCK_FIELDS}
+              for stock in market.get("stocks") or []]
+    public = {key: value for key, value in market.items() if key not in USER_FIELDS}
+    public["stocks"] = stocks
+    return public
+
+
+def get_public(market_id: str, fetch: Callable[[], Optional[Dict]]) -> PublicSnapshot:
+    """
+    Return the cached public snapshot of a market, calling fetch() on a miss.
+    Concurrent misses for the same market share a single fetch.
+    """
+    return public_cache.get(market_id, lambda: PublicSnapshot(to_public(fetch())))
+
+
+def invalidate(market_id: str):
+    public_cache.invalidate(market_id)
+
+
+#====================================================#
+# PER-USER OVERLAY
+#====================================================#
+def merge(public: Optional[Dict], overlay: Dict) -> Optional[Dict]:
+    """Combine a public snapshot with a user's overlay into the full snapshot"""
+    if not public:
+        return public
+    shares = overlay.get("shares", {})
+    stocks = [{**stock, "shares": shares.get(stock["stock_id"], 0)} for stock in public.get("stocks") or []]
+    return {**public, "free_currency": overlay.get("free_currency"), "stocks": stocks}
+
+
+def select_range(market: Optional[Dict], price_range: Optional[str]) -> Optional[Dict]:
+    """Copy of a snapshot holding only the price series of one range"""
+    if not market or not price_range:
+        return market
+    keys = set(range_keys(price_range))
+    stocks = [{key: value for key, value in stock.items() if key in keys or not is_price_series(key, value)}
+              for stock in market.get("stocks") or []]
+    return {**market, "stocks": stocks}
+
+
+#====================================================#
+# ENCODING, PRICE SERIES ARE ENCODED ONCE PER SNAPSHOT AND RANGE
+#====================================================#
+def encode_series(stock: Dict, keys: List[str]) -> bytes:
+    return b",".join(dumps(key) + b":" + dumps(stock.get(key) or []) for key in keys)
+
+
+def series_members(snapshot: PublicSnapshot, price_range: Optional[str]) -> Dict[str, bytes]:
+    range_key = price_range or "all"
+    with snapshot.lock:
+        members = snapshot.encoded.get(range_key)
+        if members is None:
+            keys = range_keys(price_range)
+            members = {stock["stock_id"]: encode_series(stock, keys) for stock in snapshot.market.get("stocks") or []}
+            snapshot.encoded[range_key] = members
+    return members
+
+
+def encode_market(snapshot: PublicSnapshot, overlay: Dict, price_range: Optional[str] = None) -> bytes:
+    """Encode the full snapshot for one user, reusing the shared encoding of the price series"""
+    if not snapshot.market:
+        return dumps(snapshot.market)
+
+    members = series_members(snapshot, price_range)
+    shares = overlay.get("shares", {})
+
+    # collect the pieces and join once, the series are too large to copy repeatedly
+    parts = []
+    for stock in snapshot.market.get("stocks") or []:
+        head = {key: value for key, value in stock.items() if not is_price_series(key, value)}
+        head["shares"] = shares.get(stock["stock_id"], 0)
+        encoded_head = dumps(head)
+        parts.append(b"," if parts else b"[")
+        parts.append(encoded_head[:-1] + b",")
+        parts.append(members[stock["stock_id"]])
+        parts.append(b"}")
+    parts.append(b"]" if parts else b"[]")
+
+    head = {key: value for key, value in snapshot.market.items() if key != "stocks"}
+    head["free_currency"] = overlay.get("free_currency")
+    return splice_object(head, "stocks", b"".join(parts))
+
+
+def envelope(data_key: str, raw_value: bytes) -> bytes:
+    """{"status": 200, "data": {data_key: raw_value}}"""
+    return b"".join((b'{"status":200,"data":{', dumps(data_key), b":", raw_value, b"}}"))
@@ -1,14 +1,15 @@
-import httpx
 import os
 from dotenv import load_dotenv
 from typing import List
 from models.classes import Community
+from utils import upstream
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Constants
-TWITCH_SEARCH_URL = "https://api.twitch.tv/helix/search/channels"
+TWITCH_API_URL = os.getenv("TWITCH_API_URL", "https://api.twitch.tv")
+TWITCH_SEARCH_URL = f"{TWITCH_API_URL}/helix/search/channels"
 TWITCH_CLIENT_ID = os.getenv("TWITCH_CLIENT_ID")
 TWITCH_TOKEN = os.getenv("TWITCH_TOKEN")
 
@@ -26,8 +27,7 @@ async def get_channels(term: str) -> List[Community]:
         "first": 3  # Limit the number of results
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(TWITCH_SEARCH_URL, headers=headers, params=params)
+    response = await upstream.get("twitch", "channel_search", TWITCH_SEARCH_URL, headers=headers, params=params)
 
     if response.status_code == 200:
         channels = response.json()["data"]
@@ -0,0 +1,383 @@
+import asyncio
+import concurrent.futures
+import itertools
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+from constants.constants import (BREAKER_COOLDOWN_SECONDS, BREAKER_FAILURES, HEDGE_BUDGET, HEDGE_MIN_SAMPLES, HEDGE_QUANTILE,
+                                 HEDGE_THREADS, RETRY_BACKOFF_SECONDS, UPSTREAM_POLICIES)
+from utils import http, metrics
+
+# Supabase ops that only read, the rest of the RPCs write
+READ_RPCS = frozenset(("rpc.get_all_markets_with_status", "rpc.get_user_joined_markets", "rpc.get_stock_market_details"))
+LATENCY_WINDOW = 200  # latest successful attempts per (service, op) the hedge delay is taken from
+
+RETRIES = metrics.Counter("upstream_retries_total", "Reads attempted again after a transient error", ("service", "op"))
+HEDGES = metrics.Counter("upstream_hedges_total", "Second requests sent for reads slower than their hedge delay", ("service", "op"))
+HEDGE_WINS = metrics.Counter("upstream_hedge_wins_total", "Hedged reads the second request answered first", ("service", "op"))
+SHORT_CIRCUITED = metrics.Counter("upstream_short_circuited_total", "Calls failed fast while their service's breaker was open", ("service",))
+BREAKER_OPEN = metrics.Gauge("upstream_breaker_open", "1 while a service's breaker is open", ("service",))
+
+
+class Unavailable(Exception):
+    """A call refused without being sent, its service's breaker is open"""
+
+
+class Policy(NamedTuple):
+    timeout: float  # seconds per attempt
+    deadline: float  # seconds per call, its retries and their backoff included
+    retries: int  # extra attempts of a read after a transient error
+    hedge: bool  # send a second request for a read slower than its recent p95
+
+
+policies: Dict[str, Policy] = {service: Policy(*values) for service, values in UPSTREAM_POLICIES.items()}
+
+
+def transient(error: BaseException) -> bool:
+    """Worth retrying: timeouts, dropped connections and 429/5xx answers, not errors in the request itself"""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, concurrent.futures.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(getattr(error, "response", None), "status_code", None) or getattr(error, "status", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    # the transport errors of the HTTP clients (connect, read, protocol)
+    return type(error).__module__.split(".")[0] in ("httpx", "httpcore", "aiohttp")
+
+
+def is_read(op: str) -> bool:
+    return op.endswith(".select") or op in READ_RPCS
+
+
+#====================================================#
+# CIRCUIT BREAKERS AND LATENCIES
+#====================================================#
+class Breaker:
+    """
+    Opens after `failures` consecutive transient errors of a service and
+    fails its calls fast for `cooldown` seconds, then lets a single call
+    through as a probe: it closes the breaker if it gets an answer, reopens
+    it otherwise. An answer that is an error (a 4xx, a constraint
+    violation) still shows the service is up.
+    """
+
+    def __init__(self, service: str, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN_SECONDS):
+        self.service = service
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.probing = True
+            return True
+
+    def succeeded(self):
+        if self.failures == 0 and self.opened_at is None:
+            return
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+        BREAKER_OPEN.set(0, service=self.service)
+
+    def released(self):
+        """The attempt ended without an answer either way (cancelled, interrupted), another call may probe"""
+        with self.lock:
+            self.probing = False
+
+    def failed(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.opened_at is None and self.failures < self.threshold:
+                return
+            self.opened_at = time.monotonic()
+        BREAKER_OPEN.set(1, service=self.service)
+
+
+class Latencies:
+    """
+    The latest successful attempts of one (service, op) in a ring, and the
+    HEDGE_QUANTILE of them a read waits before it is hedged, as long as
+    the ring has a tail for the hedge to cut. Hedges are
+    capped at HEDGE_BUDGET of the reads, so a slow upstream sees a few
+    percent more requests rather than twice as many.
+    """
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self.samples: List[float] = []
+        self.size = size
+        self.next = 0
+        self.delay: Optional[float] = None
+        self.reads = 0
+        self.hedges = 0
+        self.lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self.lock:
+            if len(self.samples) < self.size:
+                self.samples.append(seconds)
+            else:
+                self.samples[self.next] = seconds
+                self.next = (self.next + 1) % self.size
+            if len(self.samples) >= HEDGE_MIN_SAMPLES:
+                ordered = sorted(self.samples)
+                delay = ordered[int(HEDGE_QUANTILE * (len(ordered) - 1))]
+                # a second request answers around delay + median; unless some reads took longer, it saves nothing
+                self.delay = delay if ordered[-1] > delay + ordered[len(ordered) // 2] else None
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds a read waits before its second request, None until enough latencies are known"""
+        with self.lock:
+            self.reads += 1
+            if self.reads >= 1000:
+                # halved so the budget follows the recent reads, not the whole lifetime
+                self.reads, self.hedges = self.reads // 2, self.hedges // 2
+        return self.delay
+
+    def take_hedge(self) -> bool:
+        with self.lock:
+            if self.hedges >= HEDGE_BUDGET * self.reads:
+                return False
+            self.hedges += 1
+            return True
+
+
+breakers: Dict[str, Breaker] = {}
+latencies: Dict[Tuple[str, str], Latencies] = {}
+
+
+def breaker(service: str) -> Breaker:
+    return breakers.get(service) or breakers.setdefault(service, Breaker(service))
+
+
+def latencies_of(service: str, op: str) -> Latencies:
+    return latencies.get((service, op)) or latencies.setdefault((service, op), Latencies())
+
+
+def admit(service: str):
+    if not breaker(service).allow():
+        SHORT_CIRCUITED.inc(service=service)
+        raise Unavailable(f"{service} is unavailable, its circuit breaker is open")
+
+
+def backoff_after(service: str, op: str, error: Exception, attempt: int, read: bool, deadline: float) -> Optional[float]:
+    """Seconds to wait before retrying after a failed attempt, None if the error is raised instead"""
+    if not transient(error):
+        breaker(service).succeeded()
+        return None
+    breaker(service).failed()
+    backoff = random.uniform(0, RETRY_BACKOFF_SECONDS * 2 ** attempt)
+    if not read or attempt >= policies[service].retries or time.monotonic() + backoff >= deadline:
+        return None
+    RETRIES.inc(service=service, op=op)
+    return backoff
+
+
+def record(service: str, op: str, start: float, failed: bool) -> float:
+    elapsed = time.perf_counter() - start
+    metrics.UPSTREAM_LATENCY.observe(elapsed, service=service, op=op)
+    if failed:
+        metrics.UPSTREAM_ERRORS.inc(service=service, op=op)
+    return elapsed
+
+
+#====================================================#
+# ASYNC CALLS (WORKERS, REDDIT AND TWITCH SEARCHES)
+#====================================================#
+async def call_async(service: str, op: str, request: Callable[[], Awaitable], read: bool = False) -> Any:
+    """
+    Await request() under its service's policy. Each attempt is cancelled
+    after the policy's timeout and the call gives up at its deadline; a read
+    is retried after a transient error with jittered exponential backoff
+    and, once its latencies are known, hedged with a second request when
+    the first is slower than their p95. While the service's breaker is open
+    the call raises Unavailable without being sent.
+    """
+    policy = policies[service]
+    deadline = time.monotonic() + policy.deadline
+    for attempt in itertools.count():
+        admit(service)
+        timeout = min(policy.timeout, deadline - time.monotonic())
+        try:
+            if read and policy.hedge:
+                result = await hedged_async(service, op, request, timeout)
+            else:
+                result = await attempt_async(service, op, request, timeout)
+        except Exception as e:
+            backoff = backoff_after(service, op, e, attempt, read, deadline)
+            if backoff is None:
+                raise
+            await asyncio.sleep(backoff)
+            continue
+        except BaseException:
+            # a cancelled probe must not hold the breaker half-open forever
+            breaker(service).released()
+            raise
+        breaker(service).succeeded()
+        return result
+
+
+async def attempt_async(service: str, op: str, request: Callable[[], Awaitable], timeout: float) -> Any:
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(request(), max(timeout, 0))
+    except asyncio.CancelledError:
+        raise  # a hedged read the other request answered, or the caller went away
+    except asyncio.TimeoutError:
+        # the slowest reads are the tail the hedge delay is there to cut, they count
+        latencies_of(service, op).add(record(service, op, start, failed=True))
+        raise
+    except BaseException:
+        record(service, op, start, failed=True)
+        raise
+    latencies_of(service, op).add(record(service, op, start, failed=False))
+    return result
+
+
+async def hedged_async(service: str, op: str, request: Callable[[], Awaitable], timeout: float) -> Any:
+    """The first answer of a read and, if it is slower than the hedge delay, a second request for it"""
+    stats = latencies_of(service, op)
+    delay = stats.hedge_delay()
+    first = asyncio.ensure_future(attempt_async(service, op, request, timeout))
+    if delay is None or delay >= timeout:
+        return await first
+
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done and stats.take_hedge():
+            HEDGES.inc(service=service, op=op)
+            tasks.add(asyncio.ensure_future(attempt_async(service, op, request, timeout - delay)))
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        HEDGE_WINS.inc(service=service, op=op)
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def get(service: str, op: str, url: str, **kwargs):
+    """GET through the shared httpx client as a read of `service`; a 429 or 5xx raises, so it is retried"""
+
+    async def request():
+        response = await http.get_client().get(url, **kwargs)
+        if response.status_code == 429 or response.status_code >= 500:
+            response.raise_for_status()
+        return response
+
+    return await call_async(service, op, request, read=True)
+
+
+async def execute_async(query, op: str):
+    """Execute an async Supabase query builder as a call to "supabase", selects and read RPCs are retried and hedged"""
+    return await call_async("supabase", op, query.execute, read=is_read(op))
+
+
+#====================================================#
+# SYNC CALLS (THE API'S SUPABASE CLIENT AND AUTH)
+#====================================================#
+_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(HEDGE_THREADS, thread_name_prefix="upstream-hedge")
+    return _executor
+
+
+def call(service: str, op: str, request: Callable[[], Any], read: bool = False) -> Any:
+    """
+    call_async for blocking clients. A blocking request cannot be cancelled,
+    so an attempt that runs on the caller's thread is bounded by the
+    client's own timeout (the policy's, see supabase_storage.get_client);
+    a hedged read runs on the hedge threads and is given up at the policy's
+    timeout, left to finish in the background.
+    """
+    policy = policies[service]
+    deadline = time.monotonic() + policy.deadline
+    for attempt in itertools.count():
+        admit(service)
+        timeout = min(policy.timeout, deadline - time.monotonic())
+        try:
+            if read and policy.hedge:
+                result = hedged(service, op, request, timeout)
+            else:
+                result = attempt_sync(service, op, request)
+        except Exception as e:
+            backoff = backoff_after(service, op, e, attempt, read, deadline)
+            if backoff is None:
+                raise
+            time.sleep(backoff)
+            continue
+        except BaseException:
+            breaker(service).released()
+            raise
+        breaker(service).succeeded()
+        return result
+
+
+def attempt_sync(service: str, op: str, request: Callable[[], Any]) -> Any:
+    start = time.perf_counter()
+    try:
+        result = request()
+    except BaseException:
+        record(service, op, start, failed=True)
+        raise
+    latencies_of(service, op).add(record(service, op, start, failed=False))
+    return result
+
+
+def hedged(service: str, op: str, request: Callable[[], Any], timeout: float) -> Any:
+    stats = latencies_of(service, op)
+    delay = stats.hedge_delay()
+    if delay is None or delay >= timeout:
+        return attempt_sync(service, op, request)
+
+    end = time.monotonic() + timeout
+    executor = get_executor()
+    first = executor.submit(attempt_sync, service, op, request)
+    futures = {first}
+    done, _ = concurrent.futures.wait(futures, timeout=delay)
+    if not done and stats.take_hedge():
+        HEDGES.inc(service=service, op=op)
+        futures.add(executor.submit(attempt_sync, service, op, request))
+    error = None
+    while futures:
+        done, futures = concurrent.futures.wait(futures, timeout=max(end - time.monotonic(), 0),
+                                                return_when=concurrent.futures.FIRST_COMPLETED)
+        if not done:
+            raise TimeoutError(f"{service} {op} timed out after {timeout:.1f}s")
+        for future in done:
+            if future.exception() is None:
+                if future is not first:
+                    HEDGE_WINS.inc(service=service, op=op)
+                return future.result()
+            error = error or future.exception()
+    raise error
+
+
+def execute(query, op: str):
+    """Execute a Supabase query builder as a call to "supabase", selects and read RPCs are retried and hedged"""
+    return call("supabase", op, query.execute, read=is_read(op))
@@ -69,3 +69,30 @@ export const addNewComment = async (marketId: string, message: string) => {
 
   return response.data;
 };
+
+export const getComments = async (marketId: string, before?: string) => {
+  const full_url = `${BACKEND_URL}/api/markets/comments`;
+
+  const response = await axios.get(full_url, {
+    params: { market_id: marketId, before: before },
+    withCredentials: true,
+  });
+
+  return response.data;
+};
+
+export const getLeaderboard = async (marketId: string, limit?: number) => {
+  const full_url = `${BACKEND_URL}/api/markets/leaderboard`;
+
+  const response = await axios.get(full_url, {
+    params: { market_id: marketId, limit: limit },
+    withCredentials: true,
+  });
+
+  return response.data;
+};
+
+export const subscribeToComments = (marketId: string) => {
+  const full_url = `${BACKEND_URL}/api/markets/comments/stream?market_id=${encodeURIComponent(marketId)}`;
+  return new EventSource(full_url, { withCredentials: true });
+};
@@ -1,6 +1,6 @@
 import axios from "axios";
 const BACKEND_URL = process.env.NEXT_PUBLIC_BACKEND_URL;
-import { IntegrationService, Integration, Stock } from "../_models/types";
+import { IntegrationService, Integration, OrderKind, OrderLeg, OrderSide, Stock } from "../_models/types";
 
 export const getAllPublicMarkets = async () => {
   const response = await axios.get(`${BACKEND_URL}/api/markets/public`, {
@@ -32,3 +32,34 @@ export const executeSellOrder = async (stockId: string, shares: number) => {
   });
   return response.data;
 };
+
+export const executeBatchOrder = async (marketId: string, legs: OrderLeg[]) => {
+  const response = await axios.post(`${BACKEND_URL}/api/orders/batch`, { market_id: marketId, legs: legs }, {
+    withCredentials: true,
+  });
+  return response.data;
+};
+
+export const placeOrder = async (stockId: string, side: OrderSide, kind: OrderKind, shares: number, price: number) => {
+  const response = await axios.post(`${BACKEND_URL}/api/orders`, null, {
+    params: { stock_id: stockId, side: side, kind: kind, shares: shares, price: price },
+    withCredentials: true,
+  });
+  return response.data;
+};
+
+export const cancelOrder = async (orderId: string) => {
+  const response = await axios.delete(`${BACKEND_URL}/api/orders`, {
+    params: { order_id: orderId },
+    withCredentials: true,
+  });
+  return response.data;
+};
+
+export const getOpenOrders = async (marketId: string) => {
+  const response = await axios.get(`${BACKEND_URL}/api/orders`, {
+    params: { market_id: marketId },
+    withCredentials: true,
+  });
+  return response.data;
+};
@@ -78,10 +78,49 @@ export interface Comment {
   message: string;
 }
 
+export interface CommentPage {
+  comments: Comment[];
+  next_cursor: string | null;
+}
+
+export interface LeaderboardEntry {
+  rank: number;
+  user_email: string;
+  net_worth: number;
+}
+
+export interface Leaderboard {
+  leaderboard: LeaderboardEntry[];
+  me: { rank: number; net_worth: number } | null;
+}
+
+export type OrderSide = "buy" | "sell";
+export type OrderKind = "limit" | "stop";
+
+export interface Order {
+  id: string;
+  created_at: string;
+  stock_id: string;
+  side: OrderSide;
+  kind: OrderKind;
+  shares: number;
+  price: number;
+}
+
+export interface OrderLeg {
+  stock_id: string;
+  side: OrderSide;
+  shares: number;
+}
+
+export interface Fill extends OrderLeg {
+  price: number;
+  seq: number;
+}
+
 export interface Stock {
   stock_id: string;
   ticker: string;
-  comments: Comment[];
   h_prices: StockPrice[];
   m_prices: StockPrice[];
   d_prices: StockPrice[];
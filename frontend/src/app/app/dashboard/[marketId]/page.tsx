@@ -6,7 +6,7 @@ import { Input } from "@/components/ui/input";
 import ProtectedRoute from "../../../_components/ProtectedRoute";
 import { useLoading } from "../../../_context/LoadingContext";
 import { useMessage } from "../../../_context/MessageContext";
-import { getStockMarket, addNewComment } from "../../../_api/markets";
+import { getStockMarket, addNewComment, getComments, subscribeToComments } from "../../../_api/markets";
 import { executeBuyOrder, executeSellOrder } from "../../../_api/stocks";
 import {
   ChevronLeft,
@@ -32,6 +32,7 @@ import {
 import {
   StockMarket,
   Stock,
+  Comment,
   TimeRange,
   TimeRangeKey,
 } from "../../../_models/types";
@@ -68,6 +69,8 @@ export default function MarketView() {
   const [selling, setSelling] = useState<boolean>(false);
   const [sharesInput, setSharesInput] = useState<number | string>("");
   const [newComment, setNewComment] = useState<string>("");
+  const [comments, setComments] = useState<Comment[]>([]);
+  const [commentsCursor, setCommentsCursor] = useState<string | null>(null);
 
 
   const priceChange = calculatePriceChange(selectedStock?.[(timeRange + "_prices") as TimeRangeKey] ?? [])
@@ -108,10 +111,40 @@ export default function MarketView() {
     handleFetchMarket();
   }, [handleFetchMarket]);
 
+  const addComments = (incoming: Comment[]) => {
+    setComments((prev) => {
+      const seen = new Set(prev.map((comment) => comment.comment_id));
+      const merged = [...prev, ...incoming.filter((comment) => !seen.has(comment.comment_id))];
+      return merged.sort((a, b) => b.created_at.localeCompare(a.created_at));
+    });
+  };
+
+  const handleFetchComments = async (before?: string) => {
+    const response = await requestWrapper(
+      "Error fetching comments",
+      triggerError,
+      "",
+      null,
+      null,
+      {},
+      getComments,
+      marketId as string,
+      before,
+    );
+    if (!response) return;
+    addComments(response.data.comments);
+    setCommentsCursor(response.data.next_cursor);
+  };
 
   useEffect(() => {
-    handleFetchMarket();
-  }, [handleFetchMarket]);
+    if (!marketId) return;
+    setComments([]);
+    handleFetchComments();
+
+    const source = subscribeToComments(marketId as string);
+    source.onmessage = (event) => addComments([JSON.parse(event.data)]);
+    return () => source.close();
+  }, [marketId]);
 
   const handlePostComment = async () => {
     if (!newComment.trim() || !marketId) return;
@@ -126,7 +159,6 @@ export default function MarketView() {
       marketId as string,
       newComment
     );
-    await handleRefresh();
     setNewComment("");
   };
 
@@ -303,7 +335,7 @@ export default function MarketView() {
                 <div className="bg-white rounded-2xl p-6 border border-slate-100 shadow-sm">
                   <h2 className="text-lg font-semibold text-slate-800 mb-6">Comments</h2>
                   <div className="space-y-6 mb-6">
-                    {selectedStock.comments && selectedStock.comments.map((comment) => (
+                    {comments.map((comment) => (
                       <div key={comment.comment_id} className="flex gap-4">
                         <div className="flex-1">
                           <div className="flex items-center gap-2 mb-1">
@@ -314,6 +346,11 @@ export default function MarketView() {
                         </div>
                       </div>
                     ))}
+                    {commentsCursor && (
+                      <Button variant="ghost" className="text-slate-500" onClick={() => handleFetchComments(commentsCursor)}>
+                        Load older comments
+                      </Button>
+                    )}
                   </div>
                   <div className="flex gap-4">
                     <Input